@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import struct
+import tempfile
+
+import numpy as np
+
+from ImageLoader import decode_texture, image_paths
+from MeshLod import build_lods
+from ObjLoader import load_obj_submeshes
+from VertexCache import optimize_submeshes, optimize_vertex_cache
+
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+
+# File layout: magic, version, header length, JSON header, then each array aligned to CACHE_ALIGN
+CACHE_MAGIC = b'PGCACHE\0'
+CACHE_VERSION = 1
+CACHE_ALIGN = 64
+_PREAMBLE = struct.Struct('<8sII')
+
+# Bump when the loader output changes so old caches are rebuilt
+MESH_CACHE_KIND = 'mesh/indexed-2'
+MESH_CACHE_SUFFIX = '.meshcache'
+LOD_CACHE_KIND = 'mesh/lods-2'
+LOD_CACHE_SUFFIX = '.lodcache'
+TEXTURE_CACHE_KIND = 'texture/rgba8-mips-1'
+TEXTURE_CACHE_SUFFIX = '.texcache'
+
+def cache_path(source: str, suffix: str) -> str:
+    # Caches sit next to their source, e.g. models/cube.obj.meshcache
+    return f'{source}{suffix}'
+
+def source_stamp(source: str, with_hash: bool = True) -> dict:
+    stat = os.stat(source)
+    stamp = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        stamp['sha256'] = file_hash(source)
+    return stamp
+
+def file_hash(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_cache(
+    path: str, source: str, kind: str, meta: dict, arrays: dict[str, np.ndarray], stamp: dict = None
+) -> None:
+    # Bakes pass the stamp taken before parsing, so an edit while baking leaves the cache stale rather than wrong
+    if stamp is None:
+        stamp = source_stamp(source)
+    header = {
+        'kind': kind,
+        'source': {'path': os.path.abspath(source), **stamp},
+        'meta': meta,
+        'arrays': {},
+    }
+
+    # Lay the arrays out after the header, the header length depends on the offsets so iterate
+    header_size = 0
+    while True:
+        offset = _align(_PREAMBLE.size + header_size)
+        for name, array in arrays.items():
+            header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _align(offset + array.nbytes)
+        encoded = json.dumps(header).encode()
+        if len(encoded) <= header_size:
+            break
+        header_size = len(encoded)
+    encoded = encoded.ljust(header_size)
+
+    # Write to a temporary file and rename so readers never see a partial cache
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(_PREAMBLE.pack(CACHE_MAGIC, CACHE_VERSION, header_size))
+            file.write(encoded)
+            for name, array in arrays.items():
+                file.seek(header['arrays'][name]['offset'])
+                file.write(np.ascontiguousarray(array).tobytes())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+def read_cache_header(path: str):
+    try:
+        with open(path, 'rb') as file:
+            magic, version, header_size = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                return None
+            return json.loads(file.read(header_size))
+    except (OSError, struct.error, ValueError):
+        return None
+
+def read_cache(path: str, source: str, kind: str):
+    # Returns (meta, arrays) with every array memory-mapped read-only, or None if missing or stale
+    header = read_cache_header(path)
+    if header is None or header['kind'] != kind:
+        return None
+
+    try:
+        stamp = source_stamp(source, with_hash=False)
+    except OSError:
+        return None
+    cached = header['source']
+
+    # Same size and mtime is trusted as is, a new mtime alone only invalidates if the content changed
+    if stamp['size'] != cached['size']:
+        return None
+    touched = stamp['mtime_ns'] != cached['mtime_ns']
+    if touched:
+        stamp['sha256'] = file_hash(source)
+        if stamp['sha256'] != cached['sha256']:
+            return None
+
+    size = os.path.getsize(path)
+    arrays = {}
+    for name, info in header['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        if info['offset'] + dtype.itemsize * int(np.prod(shape)) > size:
+            return None
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, mode='r', dtype=dtype, shape=shape, offset=info['offset'])
+
+    # Refresh the stamp after a touch so the next start doesn't hash again. Rewriting replaces the file,
+    # so the arrays are copied out first and the caller never holds a mapping of the old one.
+    if touched:
+        arrays = {name: np.array(array) for name, array in arrays.items()}
+        try:
+            write_cache(path, source, kind, header['meta'], arrays, stamp)
+        except OSError:
+            pass
+
+    return header['meta'], arrays
+
+def _align(offset: int) -> int:
+    return (offset + CACHE_ALIGN - 1) // CACHE_ALIGN * CACHE_ALIGN
+
+def mesh_cache_kind(optimize: bool) -> str:
+    return f'{MESH_CACHE_KIND}+vcache' if optimize else MESH_CACHE_KIND
+
+def bake_mesh(filename: str, optimize: bool = False, workers: int = 1) -> tuple[dict, dict[str, np.ndarray]]:
+    stamp = source_stamp(filename)
+    vertices, indices, submeshes, libraries = load_obj_submeshes(filename, workers)
+    if optimize:
+        indices = optimize_submeshes(indices, len(vertices) // 8, submeshes)
+
+    # Submeshes are (material name, first index, index count), libraries the mtllib files as written in the OBJ
+    meta = {
+        'stride': 8,
+        'vertex_count': len(vertices) // 8,
+        'index_count': len(indices),
+        'submeshes': submeshes,
+        'libraries': libraries,
+    }
+    arrays = {'vertices': vertices, 'indices': indices}
+
+    try:
+        write_cache(
+            cache_path(filename, MESH_CACHE_SUFFIX), filename, mesh_cache_kind(optimize), meta, arrays, stamp
+        )
+    except OSError:
+        # Read-only asset directories just don't get a cache
+        pass
+
+    return meta, arrays
+
+def load_mesh_cached(filename: str, optimize: bool = False, workers: int = 1) -> tuple[dict, dict[str, np.ndarray]]:
+    cached = read_cache(cache_path(filename, MESH_CACHE_SUFFIX), filename, mesh_cache_kind(optimize))
+    if cached is not None:
+        return cached
+    return bake_mesh(filename, optimize, workers)
+
+def lod_cache_kind(optimize: bool) -> str:
+    return f'{LOD_CACHE_KIND}+vcache' if optimize else LOD_CACHE_KIND
+
+def bake_lods(filename: str, optimize: bool = False, workers: int = 1) -> tuple[dict, list]:
+    # Simplified levels of the cached mesh, level 0 is the mesh itself and isn't stored twice.
+    # Simplifying merges triangles across material boundaries, so only single material meshes get levels.
+    stamp = source_stamp(filename)
+    base_meta, arrays = load_mesh_cached(filename, optimize, workers)
+    if len(base_meta['submeshes']) > 1:
+        raise ValueError(f'{filename} has {len(base_meta["submeshes"])} materials, levels of detail need one')
+    levels = build_lods(np.asarray(arrays['vertices']), np.asarray(arrays['indices']))
+    if optimize:
+        levels = [levels[0]] + [
+            (vertices, optimize_vertex_cache(indices, len(vertices) // 8), error)
+            for vertices, indices, error in levels[1:]
+        ]
+
+    meta = {
+        'levels': len(levels),
+        'errors': [error for _, _, error in levels],
+        'triangles': [len(indices) // 3 for _, indices, _ in levels],
+        'submeshes': base_meta['submeshes'],
+        'libraries': base_meta['libraries'],
+    }
+    lod_arrays = {}
+    for index, (vertices, indices, _) in enumerate(levels[1:], 1):
+        lod_arrays[f'vertices{index}'] = vertices
+        lod_arrays[f'indices{index}'] = indices
+
+    try:
+        write_cache(
+            cache_path(filename, LOD_CACHE_SUFFIX), filename, lod_cache_kind(optimize), meta, lod_arrays, stamp
+        )
+    except OSError:
+        pass
+
+    return meta, [(vertices, indices) for vertices, indices, _ in levels]
+
+def load_lods_cached(filename: str, optimize: bool = False, workers: int = 1) -> tuple[dict, list]:
+    # (vertices, indices) of every level finest first, memory-mapped from the mesh and LOD caches when valid
+    cached = read_cache(cache_path(filename, LOD_CACHE_SUFFIX), filename, lod_cache_kind(optimize))
+    if cached is None:
+        return bake_lods(filename, optimize, workers)
+
+    meta, arrays = cached
+    _, base = load_mesh_cached(filename, optimize, workers)
+    levels = [(base['vertices'], base['indices'])]
+    levels.extend((arrays[f'vertices{index}'], arrays[f'indices{index}']) for index in range(1, meta['levels']))
+    return meta, levels
+
+def bake_texture(filename: str) -> tuple[dict, dict[str, np.ndarray]]:
+    # RGBA8 pixels of every mip level, so loading needs neither an image decode nor glGenerateMipmap
+    stamp = source_stamp(filename)
+    levels = decode_texture(filename)
+    height, width = levels[0].shape[:2]
+    meta = {'format': 'rgba8', 'width': width, 'height': height, 'levels': len(levels)}
+    arrays = {f'level{index}': level for index, level in enumerate(levels)}
+
+    try:
+        write_cache(cache_path(filename, TEXTURE_CACHE_SUFFIX), filename, TEXTURE_CACHE_KIND, meta, arrays, stamp)
+    except OSError:
+        pass
+
+    return meta, arrays
+
+def load_texture_cached(filename: str) -> tuple[dict, list[np.ndarray]]:
+    # Mip levels largest first, memory-mapped from the cache when it is valid
+    cached = read_cache(cache_path(filename, TEXTURE_CACHE_SUFFIX), filename, TEXTURE_CACHE_KIND)
+    meta, arrays = cached if cached is not None else bake_texture(filename)
+    return meta, [arrays[f'level{index}'] for index in range(meta['levels'])]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Pre-bake binary mesh and texture caches so the app starts warm')
+    parser.add_argument('paths', nargs='*', default=[f'{APP_PATH}/models', f'{APP_PATH}/images'],
+                        help='OBJ and image files or directories to bake (default: models/ and images/)')
+    parser.add_argument('--force', action='store_true', help='rebuild caches even if they are valid')
+    parser.add_argument('--clear', action='store_true', help='delete caches instead of building them')
+    parser.add_argument('--optimize', action='store_true', help='reorder triangles for the post-transform vertex cache')
+    parser.add_argument('--lods', action='store_true', help='also bake simplified levels of detail for every mesh')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes used to parse each file')
+    args = parser.parse_args()
+
+    filenames = []
+    for path in map(pathlib.Path, args.paths):
+        if path.is_dir():
+            filenames.extend(sorted(path.glob('*.obj')) + image_paths(path))
+        else:
+            filenames.append(path)
+
+    for filename in map(str, filenames):
+        is_mesh = filename.lower().endswith('.obj')
+        path = cache_path(filename, MESH_CACHE_SUFFIX if is_mesh else TEXTURE_CACHE_SUFFIX)
+        if args.clear:
+            for stale in (path, cache_path(filename, LOD_CACHE_SUFFIX)) if is_mesh else (path, ):
+                if os.path.exists(stale):
+                    os.remove(stale)
+                    print(f'removed {stale}')
+            continue
+
+        kind = mesh_cache_kind(args.optimize) if is_mesh else TEXTURE_CACHE_KIND
+        if not args.force and read_cache(path, filename, kind) is not None:
+            print(f'up to date {path}')
+        elif is_mesh:
+            meta, _ = bake_mesh(filename, args.optimize, args.workers)
+            materials = f', {len(meta["submeshes"])} materials' if len(meta['submeshes']) > 1 else ''
+            print(f'baked {path} ({meta["vertex_count"]} vertices, {meta["index_count"]} indices{materials})')
+        else:
+            meta, _ = bake_texture(filename)
+            print(f'baked {path} ({meta["width"]}x{meta["height"]}, {meta["levels"]} levels)')
+
+        if is_mesh and args.lods:
+            if len(load_mesh_cached(filename, args.optimize, args.workers)[0]['submeshes']) > 1:
+                print(f'skipped {cache_path(filename, LOD_CACHE_SUFFIX)} (more than one material)')
+                continue
+            path = cache_path(filename, LOD_CACHE_SUFFIX)
+            if not args.force and read_cache(path, filename, lod_cache_kind(args.optimize)) is not None:
+                print(f'up to date {path}')
+                continue
+            meta, _ = bake_lods(filename, args.optimize, args.workers)
+            triangles = ', '.join(map(str, meta['triangles']))
+            print(f'baked {path} ({meta["levels"]} levels, {triangles} triangles)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+import os
+
+from Cube import Mesh
+from Material import Material
+
+# Default GPU memory for textures and meshes that nobody holds anymore but are kept around for reuse
+DEFAULT_VRAM_BUDGET = 512 << 20
+
+class Asset:
+
+    def __init__(self, key: tuple, resource, nbytes: int) -> None:
+        self.key = key
+        self.resource = resource
+        self.nbytes = nbytes
+        self.references = 0
+
+class AssetManager:
+
+    def __init__(self, vram_budget: int = DEFAULT_VRAM_BUDGET, loader=None) -> None:
+        self.vram_budget = vram_budget
+        self.vram_bytes = 0
+
+        # Textures from a TextureLoader only know their size once uploaded
+        self.loader = loader
+        if loader is not None:
+            loader.listeners.append(self.texture_loaded)
+
+        # Every live asset by key, plus the unreferenced ones again in least recently used first order
+        self.assets = {}
+        self.unused = OrderedDict()
+        self.keys = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def texture(self, filepath: str) -> Material:
+        return self.acquire(('texture', os.path.realpath(filepath)), lambda: Material(filepath, self.loader))
+
+    def mesh(self, filename: str, **options) -> Mesh:
+        # Different load options give different GPU buffers, so they are part of the key
+        key = ('mesh', os.path.realpath(filename), tuple(sorted(options.items())))
+        return self.acquire(key, lambda: Mesh(filename, **options))
+
+    def acquire(self, key: tuple, load):
+        asset = self.assets.get(key)
+        if asset is None:
+            self.misses += 1
+            resource = load()
+            asset = Asset(key, resource, resource.nbytes)
+            self.assets[key] = asset
+            self.keys[id(resource)] = key
+            self.vram_bytes += asset.nbytes
+        else:
+            self.hits += 1
+            self.unused.pop(key, None)
+
+        asset.references += 1
+        self.evict()
+        return asset.resource
+
+    def texture_loaded(self, material: Material) -> None:
+        key = self.keys.get(id(material))
+        if key is None:
+            return
+        asset = self.assets[key]
+        self.vram_bytes += material.nbytes - asset.nbytes
+        asset.nbytes = material.nbytes
+        self.evict()
+
+    def release(self, resource) -> None:
+        # The GL objects stay alive until the budget needs the room, so loading it again is free until then
+        asset = self.assets[self.keys[id(resource)]]
+        asset.references -= 1
+        if asset.references == 0:
+            self.unused[asset.key] = asset
+            self.evict()
+
+    def evict(self, budget: int = None) -> None:
+        # Only unreferenced assets can go, so the total may stay over budget while everything is in use
+        budget = self.vram_budget if budget is None else budget
+        while self.vram_bytes > budget and self.unused:
+            _, asset = self.unused.popitem(last=False)
+            self.delete_asset(asset)
+            self.evictions += 1
+
+    def delete_asset(self, asset: Asset) -> None:
+        del self.assets[asset.key]
+        del self.keys[id(asset.resource)]
+        self.vram_bytes -= asset.nbytes
+        asset.resource.delete()
+
+    def references(self, resource) -> int:
+        key = self.keys.get(id(resource))
+        return self.assets[key].references if key else 0
+
+    def stats(self) -> dict:
+        return {
+            'assets': len(self.assets),
+            'unused': len(self.unused),
+            'vram_bytes': self.vram_bytes,
+            'vram_budget': self.vram_budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def delete(self) -> None:
+        # Frees everything, referenced or not, for shutdown
+        for asset in list(self.assets.values()):
+            self.delete_asset(asset)
+        self.unused.clear()
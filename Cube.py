@@ -1,119 +1,280 @@
 from OpenGL.GL import *
-from collections import defaultdict
 import numpy as np
+import pyrr
 import ctypes
 import pathlib
 
+from AssetCache import load_lods_cached, load_mesh_cached
+from MeshLod import build_lods, select_lod
+from ObjLoader import (
+    STREAM_CHUNK_SIZE, count_obj_triangles, index_dtype, load_obj_materials, load_obj_submeshes, stream_obj
+)
+from VertexCache import optimize_submeshes
+from VertexFormat import VertexFormat
+
 DEBUG_PATH = f'{pathlib.Path(__file__).parent.resolve()}/debug/vert1.txt'
 
+def bounding_volume(positions: np.ndarray, radius: float = None) -> tuple:
+    # AABB min and max, and a sphere around the box centre reaching the farthest vertex,
+    # unless the caller only has the box to go on and passes the radius
+    if len(positions):
+        bounds_min = positions.min(axis=0).astype(np.float32)
+        bounds_max = positions.max(axis=0).astype(np.float32)
+    else:
+        bounds_min = bounds_max = np.zeros(3, dtype=np.float32)
+    center = (bounds_min + bounds_max) / 2
+    if radius is None:
+        radius = np.linalg.norm(positions - center, axis=1).max() if len(positions) else 0.0
+    return bounds_min, bounds_max, center, float(radius)
+
 class Cube:
     
     def __init__(self, position, eulers) -> None:
         self.position = np.array(position, dtype=np.float32)
         self.eulers = np.array(eulers, dtype=np.float32)
+        
+    def model_transform(self) -> np.ndarray:
+        # Create identity, multiply transformations progressively
+        model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
+        
+        # Rotate cube around its own axis
+        model_transform = pyrr.matrix44.multiply(
+            m1=model_transform,
+            m2=pyrr.matrix44.create_from_eulers(
+                eulers=np.radians(self.eulers),
+                dtype=np.float32
+            )
+        )
+        
+        # Translate cube to its position
+        model_transform = pyrr.matrix44.multiply(
+            m1=model_transform,
+            m2=pyrr.matrix44.create_from_translation(
+                vec=self.position,
+                dtype=np.float32
+            )
+        )
+        
+        return model_transform
 
 class Mesh:
     
-    def __init__(self, filename) -> None:
+    def __init__(
+        self, filename, cache=True, optimize=False, stream=False, workers=1, lods=False, vertex_format=None
+    ) -> None:
+        # Loaded records are vertex_stride floats, the VBO holds them in vertex_format's encoding
         self.vertex_stride = 8
-        self.v_data = defaultdict(list)
-        
-        # x, y, z, s, t, nx, ny, nz
-        vertices = self.load_mesh(filename)
-        self.vertex_count = len(vertices) // self.vertex_stride
-        vertices = np.array(vertices, dtype=np.float32)
+        self.vertex_format = vertex_format or VertexFormat()
+        self.decode_parameters = {}
         
-        # create VAO and VBO and binds them
+        # create VAO and VBO and binds them, straight to GL so a RenderState in use has to be invalidated after
         self.vao = glGenVertexArrays(1)
         glBindVertexArray(self.vao)
-
-        # vertices
         self.vbo = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
         
-        # Position
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 4 * self.vertex_stride, ctypes.c_void_p(0))
+        if stream:
+            # Very large files go straight from file chunks into the VBO, unindexed
+            self.ebo = None
+            self.index_count = 0
+            self.vertex_count = self.stream_mesh(filename)
+            self.vertex_bytes = self.nbytes = self.vertex_count * self.vertex_format.stride
+            
+            # Streamed meshes are never simplified, they only have the one level
+            self.lod_errors = [0.0]
+            self.lod_index_counts = [0]
+            self.lod_index_offsets = [0]
+            
+            # Streaming skips the usemtl lines along with everything else that isn't vertex data
+            self.submeshes = [(None, 0, self.vertex_count)]
+            self.materials = {}
+        else:
+            # x, y, z, s, t, nx, ny, nz for each unique corner, plus triangle indices into them
+            if lods:
+                levels, self.lod_errors, submeshes, libraries = self.load_lods(filename, cache, optimize, workers)
+            else:
+                vertices, indices, submeshes, libraries = self.load_mesh(filename, cache, optimize, workers)
+                levels, self.lod_errors = [(vertices, indices)], [0.0]
+            vertices, indices = self.pack_levels(levels)
+            self.vertex_count = len(levels[0][0]) // self.vertex_stride
+            self.index_count = len(levels[0][1])
+            self.index_type = GL_UNSIGNED_SHORT if indices.dtype == np.uint16 else GL_UNSIGNED_INT
+            self.index_size = indices.itemsize
+            
+            # (material name, first index, index count) of each material's triangles in level 0, in order of
+            # first use, and the MTL properties of those names (diffuse colour and map_Kd texture path)
+            self.submeshes = [tuple(submesh) for submesh in submeshes]
+            self.materials = load_obj_materials(filename, libraries)
+            self.compute_bounds(levels[0][0].reshape(-1, self.vertex_stride)[:, :3])
+            
+            # Quantized formats are scaled against this mesh's own ranges, the shader gets them as uniforms
+            if not self.vertex_format.is_reference:
+                records = np.asarray(vertices).reshape(-1, self.vertex_stride)
+                self.decode_parameters = self.vertex_format.decode_parameters(records)
+                vertices = self.vertex_format.encode(records, self.decode_parameters).view(np.uint8)
+            self.vertex_bytes = vertices.nbytes
+            self.nbytes = vertices.nbytes + indices.nbytes
+            
+            # vertices
+            glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+            
+            # indices, the element buffer binding is stored in the VAO
+            self.ebo = glGenBuffers(1)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        
+        self.setup_attributes()
+        
+    def setup_attributes(self) -> None:
+        # Describe the bound VBO's layout to the bound VAO
+        self.vertex_format.setup_attributes()
         
-        # Texture
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 4 * self.vertex_stride, ctypes.c_void_p(12))
+    def use_decode(self, shader, state=None) -> None:
+        # Quantized attributes' scale and offset into the bound program, if it reads them
+        for name, value in self.decode_parameters.items():
+            location = shader.uniform(name)
+            setter = glUniform3fv if len(value) == 3 else glUniform2fv
+            if state is not None:
+                state.uniform(setter, location, 1, value)
+            elif location >= 0:
+                setter(location, 1, value)
         
-    def load_mesh(self, filename: str) -> list[float]:
-        vertices = []
+    def compute_bounds(self, positions: np.ndarray, radius: float = None) -> None:
+        # Object space AABB and a bounding sphere around its centre, used for frustum culling
+        bounds = bounding_volume(positions, radius)
+        self.bounds_min, self.bounds_max, self.bounding_center, self.bounding_radius = bounds
         
-        with open(filename, 'r') as file:
-            for line in file:
-                words = line.strip().split()
-                if words and words[0] in {'v', 'vt', 'vn'}:
-                    self.v_data[words[0]].append(self.read_mesh_data(words))
-                elif words and words[0] == 'f':
-                    self.read_face_data(words, vertices)
+    def load_mesh(
+        self,
+        filename: str,
+        cache: bool = True,
+        optimize: bool = False,
+        workers: int = 1,
+    ) -> tuple[np.ndarray, np.ndarray, list, list]:
+        # (vertices, indices, submeshes, mtllib files), the cached buffers are memory-mapped and go to
+        # glBufferData as is
+        if cache:
+            meta, arrays = load_mesh_cached(filename, optimize, workers)
+            return arrays['vertices'], arrays['indices'], meta['submeshes'], meta['libraries']
+        
+        # More than one worker parses byte ranges of the file in parallel processes
+        vertices, indices, submeshes, libraries = load_obj_submeshes(filename, workers)
+        if optimize:
+            indices = optimize_submeshes(indices, len(vertices) // self.vertex_stride, submeshes)
         
         # self.debug_print_vertices(vertices)
         # print(vertices)
-        return vertices
+        return vertices, indices, submeshes, libraries
     
-    def debug_print_vertices(self, vertices: list[float]) -> None:
+    def load_lods(
+        self,
+        filename: str,
+        cache: bool = True,
+        optimize: bool = False,
+        workers: int = 1,
+    ) -> tuple[list, list, list, list]:
+        # (vertices, indices) of each level finest first, with each level's error in object space units,
+        # then the submeshes and mtllib files as load_mesh returns them
+        if cache:
+            meta, levels = load_lods_cached(filename, optimize, workers)
+            return levels, meta['errors'], meta['submeshes'], meta['libraries']
+        
+        # Simplifying would merge triangles across materials, so levels are for single material meshes
+        vertices, indices, submeshes, libraries = self.load_mesh(filename, cache, optimize, workers)
+        if len(submeshes) > 1:
+            raise ValueError(f'{filename} has {len(submeshes)} materials, levels of detail need one')
+        levels = build_lods(vertices, indices)
+        levels, errors = [(vertices, indices) for vertices, indices, _ in levels], [error for _, _, error in levels]
+        return levels, errors, submeshes, libraries
+    
+    def pack_levels(self, levels: list) -> tuple[np.ndarray, np.ndarray]:
+        # Every level in one VBO and one element buffer, each level's indices already offset to its vertices
+        index_counts = [len(indices) for _, indices in levels]
+        if len(levels) == 1:
+            vertices, indices = levels[0]
+        else:
+            vertices = np.concatenate([vertices for vertices, _ in levels])
+            dtype = index_dtype(len(vertices) // self.vertex_stride)
+            indices, base = [], 0
+            for level_vertices, level_indices in levels:
+                indices.append((np.asarray(level_indices, dtype=np.int64) + base).astype(dtype))
+                base += len(level_vertices) // self.vertex_stride
+            indices = np.concatenate(indices)
+        
+        # Draws pick a level by its index range
+        self.lod_index_counts = index_counts
+        self.lod_index_offsets = (np.cumsum([0] + index_counts[:-1]) * indices.itemsize).tolist()
+        return vertices, indices
+    
+    def stream_mesh(self, filename: str, chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+        # Size the bound VBO from a counting pass, then fill it one parsed chunk at a time.
+        # Chunks are encoded as they arrive, which leaves out formats quantized against the whole mesh.
+        if self.vertex_format.quantized:
+            raise ValueError(f'streamed meshes can not use quantized attributes, {self.vertex_format}')
+        vertex_count = 3 * count_obj_triangles(filename, chunk_size)
+        glBufferData(GL_ARRAY_BUFFER, vertex_count * self.vertex_format.stride, None, GL_STATIC_DRAW)
+        
+        offset = 0
+        bounds = np.array([[np.inf] * 3, [-np.inf] * 3], dtype=np.float32)
+        for batch in stream_obj(filename, chunk_size):
+            data = batch if self.vertex_format.is_reference else self.vertex_format.encode(batch).view(np.uint8)
+            glBufferSubData(GL_ARRAY_BUFFER, offset, data.nbytes, data)
+            offset += data.nbytes
+            if len(batch):
+                np.minimum(bounds[0], batch[:, :3].min(axis=0), out=bounds[0])
+                np.maximum(bounds[1], batch[:, :3].max(axis=0), out=bounds[1])
+        
+        # Positions are gone by the end, so the sphere is the one around the box
+        if offset:
+            self.compute_bounds(bounds, radius=np.linalg.norm(bounds[1] - bounds[0]) / 2)
+        else:
+            self.compute_bounds(bounds[:0])
+        
+        return vertex_count
+    
+    def debug_print_vertices(self, vertices: np.ndarray) -> None:
         with open(DEBUG_PATH, 'w') as f:
             # Write the floats to the file with a newline every eighth number
             f.write('\n'.join([' '.join(map(str, vertices[i:i+8])) for i in range(0, len(vertices), 8)]))
-    
-    def read_mesh_data(self, words: list[str]) -> list[float]:
-        return [float(word) for word in words[1:] if word]
-    
-    def read_face_data(self, words: list[str], vertices: list[float]) -> None:
-        v  = self.v_data['v']
-        vt = self.v_data['vt']
-        vn = self.v_data['vn']
-        
-        """ Previous code:
-        triangle_count = len(words) - 3
-        
-        for i in range(triangle_count):
-            self.make_corner(words[1]    , v, vt, vn, vertices)
-            self.make_corner(words[2 + i], v, vt, vn, vertices)
-            self.make_corner(words[3 + i], v, vt, vn, vertices)
-        """
-
-        # Pre-process to extract all indices
-        indices = [word.split('/') for word in words[1:]]
         
-        # Validate indices and convert them to integers (assumes indices are complete and correct)
-        indices = [(int(v_idx)-1 if v_idx else None, 
-                    int(vt_idx)-1 if vt_idx else None, 
-                    int(vn_idx)-1 if vn_idx else None) for v_idx, vt_idx, vn_idx in indices]
-
-        # Each face is a polygon, triangulate the polygon by creating triangles from consecutive vertices
-        for i in range(1, len(indices) - 1):
-            for index_set in (indices[0], indices[i], indices[i + 1]):
-                for idx, data_array in zip(index_set, (v, vt, vn)):
-                    if idx is not None:  # Ensure the index is valid
-                        vertices.extend(data_array[idx])
-            
-    def make_corner(
-        self,
-        corner: str,
-        v: list[list[float]],
-        vt: list[list[float]],
-        vn: list[list[float]],
-        vertices: list[float],
-    ) -> None:
+    def lod_levels(self, screen_sizes) -> np.ndarray:
+        # Level to draw for each projected size in pixels, 0 (full detail) when the mesh has no others
+        return select_lod(self.lod_errors, self.bounding_radius, screen_sizes)
         
-        """ Previous code:
-        v_vt_vn = corner.split('/')
-        for element in v[int(v_vt_vn[0]) - 1]:
-            vertices.append(element)
-        for element in vt[int(v_vt_vn[1]) - 1]:
-            vertices.append(element)
-        for element in vn[int(v_vt_vn[2]) - 1]:
-            vertices.append(element)
-        """
-
-        v_idx, vt_idx, vn_idx = map(int, corner.split('/'))
-        vertices.extend(v[v_idx - 1] + vt[vt_idx - 1] + vn[vn_idx - 1])
+    def lod_triangles(self, level: int = 0) -> int:
+        return self.lod_index_counts[level] // 3 if self.ebo is not None else self.vertex_count // 3
+        
+    def draw(self, level: int = 0, state=None, submesh: int = None):
+        # Draw the whole mesh, or one material's submesh, using the currently bound shader.
+        # A RenderState skips the bind if the VAO is bound.
+        if state is not None:
+            state.bind_vertex_array(self.vao)
+        else:
+            glBindVertexArray(self.vao)
+        self.draw_bound(level=level, submesh=submesh)
+        
+    def draw_bound(self, instance_count: int = 0, level: int = 0, submesh: int = None):
+        # Issue the draw for whichever VAO holding this mesh's buffers is bound, instanced if asked.
+        # Meshes with levels have a single submesh, which is the whole of every level.
+        if self.ebo is None:
+            if instance_count:
+                glDrawArraysInstanced(GL_TRIANGLES, 0, self.vertex_count, instance_count)
+            else:
+                glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
+            return
+        
+        count = self.lod_index_counts[level]
+        offset = ctypes.c_void_p(self.lod_index_offsets[level])
+        if submesh is not None and len(self.submeshes) > 1:
+            _, first, count = self.submeshes[submesh]
+            offset = ctypes.c_void_p(first * self.index_size)
+        if instance_count:
+            glDrawElementsInstanced(GL_TRIANGLES, count, self.index_type, offset, instance_count)
+        else:
+            glDrawElements(GL_TRIANGLES, count, self.index_type, offset)
         
     def delete(self):
         glDeleteVertexArrays(1, (self.vao, ))
         glDeleteBuffers(1, (self.vbo, ))
+        if self.ebo is not None:
+            glDeleteBuffers(1, (self.ebo, ))
@@ -0,0 +1,186 @@
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v
+import numpy as np
+import ctypes
+import csv
+import json
+import time
+
+# Main loop phases in the order they are marked
+FRAME_PHASES = ('events', 'update', 'cull', 'upload', 'draw', 'present')
+
+# Frames a GPU timer result may lag behind before it is read back, so reading never stalls the pipeline
+GPU_QUERY_LATENCY = 4
+
+class FrameProfiler:
+
+    def __init__(self, capacity: int = 600, gpu: bool = True, phases: tuple[str, ...] = FRAME_PHASES) -> None:
+        self.phases = phases
+        self.phase_index = {name: index for index, name in enumerate(phases)}
+        self.capacity = capacity
+        self.frame = -1
+        self.origin = time.perf_counter_ns()
+
+        # Ring buffer of the most recent frames, milliseconds per phase, NaN until a GPU result is in
+        self.frame_ids = np.full(capacity, -1, dtype=np.int64)
+        self.frame_starts = np.zeros(capacity, dtype=np.float64)
+        self.cpu_times = np.zeros((capacity, len(phases)), dtype=np.float64)
+        self.gpu_times = np.full((capacity, len(phases)), np.nan, dtype=np.float64)
+
+        # One GL_TIME_ELAPSED query per phase for each frame in flight, only one can be active at a time
+        self.gpu = gpu
+        if gpu:
+            self.queries = np.asarray(glGenQueries(GPU_QUERY_LATENCY * len(phases))).reshape(GPU_QUERY_LATENCY, -1)
+            self.query_result = ctypes.c_uint64()
+        self.active_query = None
+        self.last_mark = 0
+
+    def begin_frame(self) -> None:
+        self.end_query()
+        self.frame += 1
+        row = self.frame % self.capacity
+
+        # Reusing this frame's query slot means reading back the frame that used it last
+        if self.gpu and self.frame >= GPU_QUERY_LATENCY:
+            self.read_gpu_times(self.frame - GPU_QUERY_LATENCY)
+
+        now = time.perf_counter_ns()
+        self.frame_ids[row] = self.frame
+        self.frame_starts[row] = (now - self.origin) / 1e6
+        self.cpu_times[row] = 0
+        self.gpu_times[row] = np.nan
+        self.last_mark = now
+        self.begin_query(0)
+
+    def mark(self, phase: str) -> None:
+        # Ends the named phase at the current time, the next phase starts right away
+        now = time.perf_counter_ns()
+        index = self.phase_index[phase]
+        self.cpu_times[self.frame % self.capacity, index] += (now - self.last_mark) / 1e6
+        self.last_mark = now
+
+        self.end_query()
+        if index + 1 < len(self.phases):
+            self.begin_query(index + 1)
+
+    def begin_query(self, index: int) -> None:
+        if self.gpu:
+            self.active_query = int(self.queries[self.frame % GPU_QUERY_LATENCY, index])
+            glBeginQuery(GL_TIME_ELAPSED, self.active_query)
+
+    def end_query(self) -> None:
+        if self.active_query is not None:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.active_query = None
+
+    def read_gpu_times(self, frame: int) -> None:
+        # The first frame's timers also see context warm-up, llvmpipe even reports garbage for them
+        row = frame % self.capacity
+        if frame == 0 or self.frame_ids[row] != frame:
+            return
+        for index, query in enumerate(self.queries[frame % GPU_QUERY_LATENCY]):
+            # PyOpenGL's wrapper can't size 64-bit outputs, so call the raw entry point
+            glGetQueryObjectui64v(int(query), GL_QUERY_RESULT, ctypes.byref(self.query_result))
+            self.gpu_times[row, index] = self.query_result.value / 1e6
+
+    def finish(self) -> None:
+        # Collect the GPU times still in flight, e.g. before exporting
+        self.end_query()
+        if self.gpu:
+            for frame in range(max(0, self.frame - GPU_QUERY_LATENCY + 1), self.frame + 1):
+                self.read_gpu_times(frame)
+
+    def records(self) -> list[dict]:
+        # Recorded frames oldest first
+        rows = np.flatnonzero(self.frame_ids >= 0)
+        rows = rows[np.argsort(self.frame_ids[rows])]
+        return [
+            {
+                'frame': int(self.frame_ids[row]),
+                'start_ms': float(self.frame_starts[row]),
+                'cpu_ms': dict(zip(self.phases, self.cpu_times[row].tolist())),
+                'gpu_ms': dict(zip(self.phases, self.gpu_times[row].tolist())) if self.gpu else None,
+            }
+            for row in rows
+        ]
+
+    def summary(self) -> dict:
+        # Mean and 95th percentile of every phase over the frames in the buffer
+        rows = self.frame_ids >= 0
+        summary = {'frames': int(rows.sum()), 'cpu_ms': {}, 'gpu_ms': {}}
+        if not rows.any():
+            return summary
+        for column, phase in enumerate(self.phases):
+            cpu = self.cpu_times[rows, column]
+            summary['cpu_ms'][phase] = {'mean': float(cpu.mean()), 'p95': float(np.percentile(cpu, 95))}
+            gpu = self.gpu_times[rows, column]
+            gpu = gpu[~np.isnan(gpu)]
+            if len(gpu):
+                summary['gpu_ms'][phase] = {'mean': float(gpu.mean()), 'p95': float(np.percentile(gpu, 95))}
+        return summary
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f'{summary["frames"]} frames', f'{"phase":<10} {"CPU ms":>8} {"p95":>8} {"GPU ms":>8} {"p95":>8}']
+        for phase in self.phases:
+            cpu = summary['cpu_ms'].get(phase)
+            gpu = summary['gpu_ms'].get(phase)
+            if cpu is None:
+                continue
+            gpu_columns = f'{gpu["mean"]:8.3f} {gpu["p95"]:8.3f}' if gpu else f'{"-":>8} {"-":>8}'
+            lines.append(f'{phase:<10} {cpu["mean"]:8.3f} {cpu["p95"]:8.3f} {gpu_columns}')
+        return '\n'.join(lines)
+
+    def export(self, filename: str) -> None:
+        # Format from the name: .csv, .trace.json for chrome://tracing or Perfetto, anything else is JSON
+        self.finish()
+        if filename.endswith('.csv'):
+            self.export_csv(filename)
+        elif filename.endswith('.trace.json'):
+            self.export_chrome_trace(filename)
+        else:
+            self.export_json(filename)
+
+    def export_json(self, filename: str) -> None:
+        with open(filename, 'w') as file:
+            json.dump({'summary': self.summary(), 'frames': self.records()}, file, indent=2)
+            file.write('\n')
+
+    def export_csv(self, filename: str) -> None:
+        with open(filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(
+                ['frame', 'start_ms'] + [f'cpu_{phase}_ms' for phase in self.phases] +
+                ([f'gpu_{phase}_ms' for phase in self.phases] if self.gpu else [])
+            )
+            for record in self.records():
+                row = [record['frame'], record['start_ms'], *record['cpu_ms'].values()]
+                if self.gpu:
+                    row.extend(record['gpu_ms'].values())
+                writer.writerow(row)
+
+    def export_chrome_trace(self, filename: str) -> None:
+        # Complete ("X") events in microseconds, CPU phases on one track and GPU phases on another.
+        # GPU timer queries only give durations, so GPU phases are laid end to end from the frame start.
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'CPU'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 2, 'args': {'name': 'GPU'}},
+        ]
+        for record in self.records():
+            for track, times in ((1, record['cpu_ms']), (2, record['gpu_ms'] or {})):
+                start = record['start_ms']
+                for phase, duration in times.items():
+                    if duration != duration:
+                        continue
+                    events.append({
+                        'name': phase, 'cat': 'frame', 'ph': 'X', 'pid': 1, 'tid': track,
+                        'ts': start * 1000, 'dur': duration * 1000, 'args': {'frame': record['frame']},
+                    })
+                    start += duration
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def delete(self) -> None:
+        self.end_query()
+        if self.gpu:
+            glDeleteQueries(self.queries.size, self.queries.ravel())
@@ -0,0 +1,71 @@
+import numpy as np
+
+def frustum_planes(view_projection: np.ndarray) -> np.ndarray:
+    # Row vector convention (clip = point @ matrix), so each clip coordinate is a column of the matrix.
+    # A point is inside when -w <= x, y, z <= w, which gives (a, b, c, d) with a*x + b*y + c*z + d >= 0.
+    columns = np.asarray(view_projection, dtype=np.float64).T
+    planes = np.array([
+        columns[3] + columns[0],  # left
+        columns[3] - columns[0],  # right
+        columns[3] + columns[1],  # bottom
+        columns[3] - columns[1],  # top
+        columns[3] + columns[2],  # near
+        columns[3] - columns[2],  # far
+    ])
+
+    # Unit normals so plane distances are in world units and compare directly with radii
+    planes /= np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+    return planes.astype(np.float32)
+
+def transform_points(point: np.ndarray, rotation: np.ndarray, translation: np.ndarray) -> np.ndarray:
+    # One object space point through n row vector transforms, without NumPy's slow stacked 3x3 matmul
+    return point[0] * rotation[:, 0] + point[1] * rotation[:, 1] + point[2] * rotation[:, 2] + translation
+
+def row_lengths(rotation: np.ndarray, row: int) -> np.ndarray:
+    # Squared length of one basis vector of every transform, its scale along that axis
+    return np.square(rotation[:, row, 0]) + np.square(rotation[:, row, 1]) + np.square(rotation[:, row, 2])
+
+class Frustum:
+
+    def __init__(self, view_projection: np.ndarray) -> None:
+        self.set_matrix(view_projection)
+
+        # Counters for the last cull() call
+        self.tested = 0
+        self.visible = 0
+        self.culled = 0
+
+    def set_matrix(self, view_projection: np.ndarray) -> None:
+        planes = frustum_planes(view_projection)
+        self.normals = planes[:, :3]
+        self.distances = planes[:, 3]
+
+    def cull(self, matrices: np.ndarray, mesh) -> np.ndarray:
+        # Indices of the (n, 4, 4) model matrices whose copy of the mesh can be on screen
+        rotation = matrices[:, :3, :3]
+        translation = matrices[:, 3, :3]
+
+        # Bounding sphere first: most objects are clearly outside or clearly inside every plane.
+        # Plane major (6, n) layout keeps every reduction across rows, which NumPy does much faster.
+        centers = transform_points(mesh.bounding_center, rotation, translation)
+        scale = np.maximum(np.maximum(row_lengths(rotation, 0), row_lengths(rotation, 1)), row_lengths(rotation, 2))
+        radii = mesh.bounding_radius * np.sqrt(scale)
+        distances = self.normals @ centers.T + self.distances[:, None]
+        outside = distances.min(axis=0) < -radii
+
+        # Spheres crossing a plane get the tighter test with the AABB's world space projection
+        straddling = np.flatnonzero(~outside & (distances.min(axis=0) < radii))
+        if len(straddling):
+            rotation = rotation[straddling]
+            half_extents = (mesh.bounds_max - mesh.bounds_min) / 2
+            box_centers = transform_points(mesh.bounds_min + half_extents, rotation, translation[straddling])
+            axes = np.abs(self.normals @ rotation.reshape(-1, 3).T).reshape(6, -1, 3)
+            box_radii = axes @ half_extents
+            box_distances = self.normals @ box_centers.T + self.distances[:, None]
+            outside[straddling] = (box_distances + box_radii).min(axis=0) < 0
+
+        visible = np.flatnonzero(~outside)
+        self.tested = len(matrices)
+        self.visible = len(visible)
+        self.culled = self.tested - self.visible
+        return visible
@@ -0,0 +1,361 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+
+from AssetCache import load_mesh_cached
+from Cube import bounding_volume
+from InstanceBatch import INSTANCE_MODEL_LOCATION, MATRIX_SIZE
+from ObjLoader import load_obj_submeshes
+from VertexCache import optimize_submeshes
+from VertexFormat import VertexFormat
+
+# Starting sizes of the shared buffers, both grow by doubling when a mesh doesn't fit even after defragmenting
+DEFAULT_ARENA_VERTICES = 1 << 16
+DEFAULT_ARENA_INDICES = 1 << 18
+
+# Every mesh's indices count from its own first vertex, drawn with a base vertex, always 32-bit
+ARENA_INDEX_SIZE = 4
+
+# One DrawElementsIndirectCommand: count, instanceCount, firstIndex, baseVertex, baseInstance
+INDIRECT_COMMAND_SIZE = 4 * 5
+
+class RangeAllocator:
+
+    def __init__(self, capacity: int) -> None:
+        # Free ranges as offset -> size and again as end -> offset, merged so no two free ranges touch
+        self.capacity = capacity
+        self.free = {0: capacity} if capacity else {}
+        self.free_ends = {capacity: 0} if capacity else {}
+        self.used = 0
+
+    def allocate(self, size: int):
+        # Best fit, the smallest free range that holds `size`, so large ranges stay whole for large meshes.
+        # Returns the offset, or None when no single free range is big enough.
+        if size == 0:
+            return 0
+        best = None
+        for offset, free_size in self.free.items():
+            if free_size >= size and (best is None or free_size < self.free[best]):
+                best = offset
+                if free_size == size:
+                    break
+        if best is None:
+            return None
+
+        free_size = self.free.pop(best)
+        del self.free_ends[best + free_size]
+        if free_size > size:
+            self.add_free(best + size, free_size - size)
+        self.used += size
+        return best
+
+    def release(self, offset: int, size: int) -> None:
+        if size == 0:
+            return
+        self.used -= size
+
+        # Merge with the free ranges right after and right before
+        end = offset + size
+        if end in self.free:
+            following = self.free.pop(end)
+            del self.free_ends[end + following]
+            size += following
+        if offset in self.free_ends:
+            previous = self.free_ends.pop(offset)
+            size += self.free.pop(previous)
+            offset = previous
+        self.add_free(offset, size)
+
+    def add_free(self, offset: int, size: int) -> None:
+        self.free[offset] = size
+        self.free_ends[offset + size] = offset
+
+    def compacted(self, capacity: int) -> None:
+        # After the live ranges were packed from offset 0: everything past them is one free range
+        self.capacity = capacity
+        self.free, self.free_ends = {}, {}
+        if capacity > self.used:
+            self.add_free(self.used, capacity - self.used)
+
+    def largest_free(self) -> int:
+        return max(self.free.values(), default=0)
+
+    def fragmentation(self) -> float:
+        # Share of the free space outside the largest free range, 0 when it is all in one piece
+        free = self.capacity - self.used
+        return 1 - self.largest_free() / free if free else 0.0
+
+class ArenaMesh:
+
+    def __init__(self, arena, first_vertex: int, vertex_count: int, first_index: int, index_count: int) -> None:
+        # A mesh's ranges in its arena's buffers, in vertices and indices. They move when the arena is defragmented.
+        self.arena = arena
+        self.first_vertex = first_vertex
+        self.vertex_count = vertex_count
+        self.first_index = first_index
+        self.index_count = index_count
+
+        # (material name, first index, index count) relative to first_index, as Mesh.submeshes
+        self.submeshes = [(None, 0, index_count)]
+
+    def draw_bound(self, instance_count: int = 0) -> None:
+        # Issue the draw with the arena's VAO bound, like Mesh.draw_bound
+        offset = ctypes.c_void_p(self.first_index * ARENA_INDEX_SIZE)
+        if instance_count:
+            glDrawElementsInstancedBaseVertex(
+                GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, offset, instance_count, self.first_vertex
+            )
+        else:
+            glDrawElementsBaseVertex(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, offset, self.first_vertex)
+
+class GeometryArena:
+
+    def __init__(
+        self,
+        vertex_format: VertexFormat = None,
+        vertex_capacity: int = DEFAULT_ARENA_VERTICES,
+        index_capacity: int = DEFAULT_ARENA_INDICES,
+    ) -> None:
+        # Meshes of one vertex format share one VBO, one element buffer and one VAO, each mesh is a pair of ranges.
+        # Only benchmark.py draws through an arena so far, the app keeps a Mesh with buffers of its own.
+        # Quantized formats scale every mesh by its own bounds, which one shared draw has no way to tell apart.
+        self.vertex_format = vertex_format or VertexFormat()
+        if self.vertex_format.quantized:
+            raise ValueError(f'arena meshes are drawn together and can not use quantized attributes, {vertex_format}')
+        self.vertex_ranges = RangeAllocator(vertex_capacity)
+        self.index_ranges = RangeAllocator(index_capacity)
+        self.meshes = set()
+
+        # Bumped whenever the buffers are replaced, VAOs made over them elsewhere have to be rebuilt
+        self.generation = 0
+        self.relocations = 0
+
+        self.vao = glGenVertexArrays(1)
+        self.vbo = self.create_buffer(vertex_capacity * self.vertex_format.stride)
+        self.ebo = self.create_buffer(index_capacity * ARENA_INDEX_SIZE)
+        self.attach(self.vao)
+
+    @staticmethod
+    def create_buffer(nbytes: int) -> int:
+        # Created through the copy target, binding GL_ELEMENT_ARRAY_BUFFER would change the bound VAO
+        buffer = glGenBuffers(1)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, buffer)
+        glBufferData(GL_COPY_WRITE_BUFFER, max(nbytes, 1), None, GL_STATIC_DRAW)
+        return buffer
+
+    def attach(self, vao: int) -> None:
+        # Point a VAO's vertex attributes and element buffer at the arena's buffers
+        glBindVertexArray(vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        self.vertex_format.setup_attributes()
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+
+    def add(self, vertices: np.ndarray, indices: np.ndarray) -> ArenaMesh:
+        # x, y, z, s, t, nx, ny, nz records and triangle indices into them, copied into free ranges
+        records = np.asarray(vertices, dtype=np.float32).reshape(-1, 8)
+        indices = np.asarray(indices).astype(np.uint32, copy=False)
+        first_vertex, first_index = self.reserve(len(records), len(indices))
+
+        data = records if self.vertex_format.is_reference else self.vertex_format.encode(records).view(np.uint8)
+        stride = self.vertex_format.stride
+        glBindBuffer(GL_COPY_WRITE_BUFFER, self.vbo)
+        glBufferSubData(GL_COPY_WRITE_BUFFER, first_vertex * stride, data.nbytes, data)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, self.ebo)
+        glBufferSubData(GL_COPY_WRITE_BUFFER, first_index * ARENA_INDEX_SIZE, indices.nbytes, indices)
+
+        mesh = ArenaMesh(self, first_vertex, len(records), first_index, len(indices))
+        mesh.bounds_min, mesh.bounds_max, mesh.bounding_center, mesh.bounding_radius = bounding_volume(records[:, :3])
+        self.meshes.add(mesh)
+        return mesh
+
+    def load(self, filename: str, cache: bool = True, optimize: bool = False, workers: int = 1) -> ArenaMesh:
+        # Same loading as Mesh, into the arena instead of buffers of its own, with the same index order
+        if cache:
+            meta, arrays = load_mesh_cached(filename, optimize, workers)
+            vertices, indices, submeshes = arrays['vertices'], arrays['indices'], meta['submeshes']
+        else:
+            vertices, indices, submeshes, _ = load_obj_submeshes(filename, workers)
+            if optimize:
+                indices = optimize_submeshes(indices, len(vertices) // 8, submeshes)
+        mesh = self.add(vertices, indices)
+        mesh.submeshes = [tuple(submesh) for submesh in submeshes]
+        return mesh
+
+    def remove(self, mesh: ArenaMesh) -> None:
+        # The ranges go back on the free lists, the data stays until something else is put there
+        self.meshes.remove(mesh)
+        self.vertex_ranges.release(mesh.first_vertex, mesh.vertex_count)
+        self.index_ranges.release(mesh.first_index, mesh.index_count)
+
+    def reserve(self, vertex_count: int, index_count: int) -> tuple[int, int]:
+        # First vertex and first index of a new mesh's ranges. Both are taken together: a relocation only moves
+        # the live meshes, so a range already handed out for the new one would point into the old layout.
+        first_vertex = self.vertex_ranges.allocate(vertex_count)
+        first_index = self.index_ranges.allocate(index_count)
+        if first_vertex is not None and first_index is not None:
+            return first_vertex, first_index
+        if first_vertex is not None:
+            self.vertex_ranges.release(first_vertex, vertex_count)
+        if first_index is not None:
+            self.index_ranges.release(first_index, index_count)
+
+        # Enough room in total only needs the free ranges packed together, otherwise the buffers double until it fits
+        self.relocate(self.grown(self.vertex_ranges, vertex_count), self.grown(self.index_ranges, index_count))
+        return self.vertex_ranges.allocate(vertex_count), self.index_ranges.allocate(index_count)
+
+    @staticmethod
+    def grown(ranges: RangeAllocator, size: int) -> int:
+        capacity = ranges.capacity
+        if capacity - ranges.used < size:
+            capacity = max(capacity, 1)
+            while capacity - ranges.used < size:
+                capacity *= 2
+        return capacity
+
+    def defragment(self) -> None:
+        self.relocate(self.vertex_ranges.capacity, self.index_ranges.capacity)
+
+    def relocate(self, vertex_capacity: int, index_capacity: int) -> None:
+        # Copy every live range, in order, to the start of new buffers on the GPU, leaving one free range at the end
+        stride = self.vertex_format.stride
+        vbo = self.create_buffer(vertex_capacity * stride)
+        ebo = self.create_buffer(index_capacity * ARENA_INDEX_SIZE)
+
+        for old, new, first, count, size in (
+            (self.vbo, vbo, 'first_vertex', 'vertex_count', stride),
+            (self.ebo, ebo, 'first_index', 'index_count', ARENA_INDEX_SIZE),
+        ):
+            glBindBuffer(GL_COPY_READ_BUFFER, old)
+            glBindBuffer(GL_COPY_WRITE_BUFFER, new)
+            offset = 0
+            for mesh in sorted(self.meshes, key=lambda mesh: getattr(mesh, first)):
+                length = getattr(mesh, count)
+                if length:
+                    glCopyBufferSubData(
+                        GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, getattr(mesh, first) * size, offset * size,
+                        length * size
+                    )
+                setattr(mesh, first, offset)
+                offset += length
+
+        glDeleteBuffers(2, (self.vbo, self.ebo))
+        self.vbo, self.ebo = vbo, ebo
+        self.vertex_ranges.compacted(vertex_capacity)
+        self.index_ranges.compacted(index_capacity)
+        self.attach(self.vao)
+        self.generation += 1
+        self.relocations += 1
+
+    def bind(self) -> None:
+        glBindVertexArray(self.vao)
+
+    def draw(self, meshes: list) -> None:
+        # Any number of meshes in one call with the arena bound, all with the current uniforms
+        if not meshes:
+            return
+        counts = np.array([mesh.index_count for mesh in meshes], dtype=np.int32)
+        offsets = (ctypes.c_void_p * len(meshes))(*(mesh.first_index * ARENA_INDEX_SIZE for mesh in meshes))
+        base_vertices = np.array([mesh.first_vertex for mesh in meshes], dtype=np.int32)
+        glMultiDrawElementsBaseVertex(GL_TRIANGLES, counts, GL_UNSIGNED_INT, offsets, len(meshes), base_vertices)
+
+    def stats(self) -> dict:
+        stride = self.vertex_format.stride
+        return {
+            'meshes': len(self.meshes),
+            'vertex_bytes': self.vertex_ranges.used * stride,
+            'vertex_capacity_bytes': self.vertex_ranges.capacity * stride,
+            'index_bytes': self.index_ranges.used * ARENA_INDEX_SIZE,
+            'index_capacity_bytes': self.index_ranges.capacity * ARENA_INDEX_SIZE,
+            'vertex_fragmentation': self.vertex_ranges.fragmentation(),
+            'index_fragmentation': self.index_ranges.fragmentation(),
+            'relocations': self.relocations,
+        }
+
+    def delete(self) -> None:
+        glDeleteVertexArrays(1, (self.vao, ))
+        glDeleteBuffers(2, (self.vbo, self.ebo))
+        self.meshes.clear()
+
+class ArenaBatch:
+
+    def __init__(self, arena: GeometryArena, capacity: int = 1024) -> None:
+        # Objects of every mesh in an arena, each with its own model matrix, drawn by one indirect multi-draw:
+        # one command per mesh, instanced over that mesh's objects, whose matrices start at its base instance
+        self.arena = arena
+        self.capacity = capacity
+        self.command_count = 0
+        self.commands = np.zeros((0, 5), dtype=np.uint32)
+        self.indirect = bool(glMultiDrawElementsIndirect)
+
+        # Own VAO over the arena's buffers plus the per-instance matrices, like InstanceBatch
+        self.vao = glGenVertexArrays(1)
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * MATRIX_SIZE, None, GL_DYNAMIC_DRAW)
+        self.command_buffer = glGenBuffers(1)
+        self.generation = None
+        self.attach()
+
+    def attach(self) -> None:
+        # (Re)build the VAO, after a defragment moved the arena's buffers too
+        self.arena.attach(self.vao)
+        self.point_instances(0)
+        for column in range(4):
+            glEnableVertexAttribArray(INSTANCE_MODEL_LOCATION + column)
+            glVertexAttribDivisor(INSTANCE_MODEL_LOCATION + column, 1)
+        self.generation = self.arena.generation
+
+    def point_instances(self, first: int) -> None:
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for column in range(4):
+            offset = ctypes.c_void_p(first * MATRIX_SIZE + 16 * column)
+            glVertexAttribPointer(INSTANCE_MODEL_LOCATION + column, 4, GL_FLOAT, GL_FALSE, MATRIX_SIZE, offset)
+
+    def update(self, groups: list) -> None:
+        # (ArenaMesh, (n, 4, 4) float32 model matrices) pairs, a frame's objects grouped by mesh
+        groups = [(mesh, matrices) for mesh, matrices in groups if len(matrices)]
+        count = sum(len(matrices) for _, matrices in groups)
+        self.capacity = max(self.capacity, count)
+
+        # Matrices of every group back to back, orphaning last frame's storage like InstanceBatch
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * MATRIX_SIZE, None, GL_DYNAMIC_DRAW)
+        commands = np.zeros((len(groups), 5), dtype=np.uint32)
+        first = 0
+        for row, (mesh, matrices) in enumerate(groups):
+            glBufferSubData(GL_ARRAY_BUFFER, first * MATRIX_SIZE, matrices.nbytes, matrices)
+            commands[row] = (mesh.index_count, len(matrices), mesh.first_index, mesh.first_vertex, first)
+            first += len(matrices)
+        self.commands = commands
+        self.command_count = len(groups)
+
+        if self.indirect and len(commands):
+            glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.command_buffer)
+            glBufferData(GL_DRAW_INDIRECT_BUFFER, commands.nbytes, commands, GL_DYNAMIC_DRAW)
+            glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+
+    def draw(self) -> int:
+        # Every object in one call when indirect multi-draw (GL 4.3) is there, one call per mesh otherwise.
+        # Returns the draw calls issued.
+        if not self.command_count:
+            return 0
+        if self.generation != self.arena.generation:
+            self.attach()
+        glBindVertexArray(self.vao)
+        if self.indirect:
+            glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.command_buffer)
+            glMultiDrawElementsIndirect(GL_TRIANGLES, GL_UNSIGNED_INT, ctypes.c_void_p(0), self.command_count, 0)
+            glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+            return 1
+
+        # Without base instance the instance attributes are pointed at each group's first matrix
+        for count, instances, first_index, base_vertex, first in self.commands.tolist():
+            self.point_instances(first)
+            offset = ctypes.c_void_p(first_index * ARENA_INDEX_SIZE)
+            glDrawElementsInstancedBaseVertex(GL_TRIANGLES, count, GL_UNSIGNED_INT, offset, instances, base_vertex)
+        self.point_instances(0)
+        return self.command_count
+
+    def delete(self) -> None:
+        glDeleteVertexArrays(1, (self.vao, ))
+        glDeleteBuffers(2, (self.vbo, self.command_buffer))
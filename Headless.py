@@ -0,0 +1,171 @@
+import ctypes
+import json
+import os
+import sys
+
+import numpy as np
+
+# Software GL platforms PyOpenGL can use without a display server
+HEADLESS_PLATFORMS = ('egl', 'osmesa')
+
+def use_headless_platform(platform: str = 'egl') -> None:
+    # PyOpenGL binds its platform the first time OpenGL.GL is imported, so this has to run before that
+    if platform not in HEADLESS_PLATFORMS:
+        raise ValueError(f'unknown headless platform {platform!r}, expected one of {HEADLESS_PLATFORMS}')
+    if 'OpenGL.GL' in sys.modules and os.environ.get('PYOPENGL_PLATFORM') != platform:
+        raise RuntimeError('OpenGL was imported before the headless platform was selected')
+
+    os.environ['PYOPENGL_PLATFORM'] = platform
+    if platform == 'egl':
+        # No X11 or Wayland, let Mesa hand out a surfaceless (llvmpipe if there is no GPU) display
+        os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+
+    # pygame still loads and converts images, which needs a video mode, just not a visible one
+    os.environ.setdefault('SDL_VIDEODRIVER', 'offscreen')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+def use_release_mode() -> None:
+    # PyOpenGL wraps every function with a glGetError check (and logging, if turned on) as OpenGL.GL is imported,
+    # so like the platform this has to run first, after use_headless_platform. GL errors go unnoticed after this.
+    import OpenGL
+    if 'OpenGL.GL' in sys.modules and OpenGL.ERROR_CHECKING:
+        raise RuntimeError('OpenGL was imported before release mode was selected')
+
+    # PyOpenGL's EGL bindings fail to import without error checking, they are loaded (and keep theirs) first
+    if os.environ.get('PYOPENGL_PLATFORM') == 'egl':
+        from OpenGL import EGL
+
+    # Functions read the copies in _configflags as they are created, which EGL's import has already made
+    from OpenGL import _configflags
+    for flags in (OpenGL, _configflags):
+        flags.ERROR_CHECKING = False
+        flags.ERROR_LOGGING = False
+        flags.FULL_LOGGING = False
+
+class OffscreenContext:
+
+    def __init__(self, size: tuple[int, int], platform: str = None) -> None:
+        self.width, self.height = size
+        self.platform = platform or os.environ.get('PYOPENGL_PLATFORM', 'egl')
+        if self.platform == 'osmesa':
+            self.create_osmesa_context()
+        else:
+            self.create_egl_context()
+
+        # Colour and depth renderbuffers stand in for the window's default framebuffer
+        from OpenGL.GL import (
+            GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, GL_DEPTH_COMPONENT24, GL_FRAMEBUFFER,
+            GL_FRAMEBUFFER_COMPLETE, GL_RENDERBUFFER, GL_RGBA8, glBindFramebuffer, glBindRenderbuffer,
+            glCheckFramebufferStatus, glFramebufferRenderbuffer, glGenFramebuffers, glGenRenderbuffers,
+            glRenderbufferStorage, glViewport,
+        )
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        self.renderbuffers = glGenRenderbuffers(2)
+        for renderbuffer, storage, attachment in zip(
+            self.renderbuffers, (GL_RGBA8, GL_DEPTH_COMPONENT24), (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT)
+        ):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, storage, self.width, self.height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError('offscreen framebuffer is incomplete')
+        glViewport(0, 0, self.width, self.height)
+
+    def create_egl_context(self) -> None:
+        from OpenGL import EGL
+
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if not EGL.eglInitialize(self.display, None, None):
+            raise RuntimeError('eglInitialize failed, is Mesa (libEGL_mesa) installed?')
+
+        config = EGL.EGLConfig()
+        config_count = EGL.EGLint()
+        config_attributes = (EGL.EGLint * 5)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE
+        )
+        EGL.eglChooseConfig(self.display, config_attributes, ctypes.pointer(config), 1, ctypes.pointer(config_count))
+        if config_count.value == 0:
+            raise RuntimeError('no EGL config with desktop OpenGL support')
+
+        # Same 3.3 core profile the shaders are written for
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attributes = (EGL.EGLint * 7)(
+            EGL.EGL_CONTEXT_MAJOR_VERSION, 3, EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+            EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT, EGL.EGL_NONE,
+        )
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, context_attributes)
+        if self.context == EGL.EGL_NO_CONTEXT:
+            raise RuntimeError('could not create an OpenGL 3.3 core EGL context')
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context)
+
+    def create_osmesa_context(self) -> None:
+        from OpenGL import arrays, osmesa
+        from OpenGL.GL import GL_UNSIGNED_BYTE
+
+        context_attributes = arrays.GLintArray.asArray([
+            osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+            osmesa.OSMESA_DEPTH_BITS, 24,
+            osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+            osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3,
+            osmesa.OSMESA_CONTEXT_MINOR_VERSION, 3,
+            0,
+        ])
+        self.context = osmesa.OSMesaCreateContextAttribs(context_attributes, None)
+        if not self.context:
+            raise RuntimeError('could not create an OpenGL 3.3 core OSMesa context')
+
+        # OSMesa always wants a client side buffer, even though drawing goes to the framebuffer object
+        self.buffer = arrays.GLubyteArray.zeros((self.height, self.width, 4))
+        osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, self.width, self.height)
+
+    def delete(self) -> None:
+        from OpenGL.GL import glDeleteFramebuffers, glDeleteRenderbuffers
+
+        glDeleteFramebuffers(1, (self.fbo, ))
+        glDeleteRenderbuffers(2, self.renderbuffers)
+        if self.platform == 'osmesa':
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context)
+        else:
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+
+def read_pixels(size: tuple[int, int]) -> np.ndarray:
+    # RGBA rows of the bound framebuffer, top row first like an image file
+    from OpenGL.GL import GL_PACK_ALIGNMENT, GL_RGBA, GL_UNSIGNED_BYTE, glPixelStorei, glReadPixels
+
+    width, height = size
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    data = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+    return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)[::-1]
+
+def save_png(filename: str, size: tuple[int, int]) -> None:
+    import pygame
+
+    pixels = np.ascontiguousarray(read_pixels(size))
+    pygame.image.save(pygame.image.frombuffer(pixels.tobytes(), size, 'RGBA'), filename)
+
+def frame_time_stats(frame_times: list[float]) -> dict:
+    # Frame times in seconds in, milliseconds out
+    milliseconds = np.asarray(frame_times, dtype=np.float64) * 1000
+    if len(milliseconds) == 0:
+        return {'frames': 0}
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    return {
+        'frames': len(milliseconds),
+        'mean_ms': float(milliseconds.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'min_ms': float(milliseconds.min()),
+        'max_ms': float(milliseconds.max()),
+        'fps': float(1000 / milliseconds.mean()),
+    }
+
+def write_frame_stats(filename: str, stats: dict) -> None:
+    with open(filename, 'w') as file:
+        json.dump(stats, file, indent=2)
+        file.write('\n')
@@ -0,0 +1,46 @@
+import numpy as np
+import pathlib
+import pygame
+
+# Image files the texture bake step picks up from a directory
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp', '.tga')
+
+def image_paths(directory) -> list[str]:
+    # Image files of a directory in name order, skipping the caches baked next to them
+    return sorted(str(path) for path in pathlib.Path(directory).iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+
+def decode_image(filepath: str) -> np.ndarray:
+    # Safe on worker threads: SDL_image decodes without the GIL and NumPy's copies release it too,
+    # where pygame.image.tostring would hold it for the whole conversion
+    image = pygame.image.load(filepath)
+    width, height = image.get_size()
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    if image.get_bitsize() in (24, 32):
+        pixels[..., :3] = pygame.surfarray.pixels3d(image).transpose(1, 0, 2)
+        if image.get_flags() & pygame.SRCALPHA:
+            pixels[..., 3] = pygame.surfarray.pixels_alpha(image).T
+        else:
+            pixels[..., 3] = 255
+    else:
+        # Paletted and 16-bit images are rare and small, let pygame expand them
+        pixels[...] = np.frombuffer(pygame.image.tostring(image, 'RGBA'), dtype=np.uint8).reshape(height, width, 4)
+    return pixels
+
+def build_mipmaps(pixels: np.ndarray) -> list[np.ndarray]:
+    # Full mip chain down to 1x1 with a 2x2 box filter, so glGenerateMipmap doesn't run on the GL thread.
+    # Odd sizes round down like GL's level sizes, dropping the last row or column.
+    levels = [pixels]
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        level = levels[-1]
+        height, width = level.shape[:2]
+        step_y, step_x = min(height, 2), min(width, 2)
+        total = np.zeros((height // step_y, width // step_x, 4), dtype=np.uint16)
+        for y in range(step_y):
+            for x in range(step_x):
+                total += level[y:height - height % step_y:step_y, x:width - width % step_x:step_x]
+        count = step_y * step_x
+        levels.append(((total + count // 2) // count).astype(np.uint8))
+    return levels
+
+def decode_texture(filepath: str) -> list[np.ndarray]:
+    return build_mipmaps(decode_image(filepath))
@@ -0,0 +1,124 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+
+from Cube import Mesh
+
+# First attribute location of the per-instance model matrix, a mat4 takes one location per column
+INSTANCE_MODEL_LOCATION = 2
+
+# Bytes of one model matrix
+MATRIX_SIZE = 4 * 16
+
+# Attribute locations of the per-instance texture array region, a vec4 rect and a float layer
+INSTANCE_REGION_LOCATION = 6
+INSTANCE_LAYER_LOCATION = 7
+
+# Bytes of one region, see TextureRegion.instance_data
+REGION_SIZE = 4 * 5
+
+class InstanceBatch:
+    
+    def __init__(self, mesh: Mesh, capacity: int = 1024, regions: bool = False) -> None:
+        self.mesh = mesh
+        self.capacity = capacity
+        self.instance_count = 0
+        self.level_counts = [0]
+        
+        # Own VAO over the mesh's buffers, so the mesh can still be drawn one object at a time.
+        # The binds here go straight to GL, a RenderState in use has to be invalidated after.
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, mesh.vbo)
+        mesh.setup_attributes()
+        if mesh.ebo is not None:
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, mesh.ebo)
+        
+        # Per-instance model matrices, advancing once per instance instead of once per vertex
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * MATRIX_SIZE, None, GL_DYNAMIC_DRAW)
+        for column in range(4):
+            location = INSTANCE_MODEL_LOCATION + column
+            glEnableVertexAttribArray(location)
+            glVertexAttribDivisor(location, 1)
+        
+        # With a TextureArray every instance also says which packed image it shows
+        self.region_vbo = None
+        if regions:
+            self.region_vbo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.region_vbo)
+            glBufferData(GL_ARRAY_BUFFER, self.capacity * REGION_SIZE, None, GL_DYNAMIC_DRAW)
+            for location in (INSTANCE_REGION_LOCATION, INSTANCE_LAYER_LOCATION):
+                glEnableVertexAttribArray(location)
+                glVertexAttribDivisor(location, 1)
+        self.point_instances(0)
+        
+    @staticmethod
+    def bind_array_buffer(buffer: int, state=None) -> None:
+        if state is not None:
+            state.bind_buffer(GL_ARRAY_BUFFER, buffer)
+        else:
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+        
+    def point_instances(self, first: int, state=None) -> None:
+        # Point the bound VAO's per-instance attributes at instance `first` onwards
+        self.bind_array_buffer(self.vbo, state)
+        for column in range(4):
+            offset = ctypes.c_void_p(first * MATRIX_SIZE + 16 * column)
+            glVertexAttribPointer(INSTANCE_MODEL_LOCATION + column, 4, GL_FLOAT, GL_FALSE, MATRIX_SIZE, offset)
+        if self.region_vbo is not None:
+            self.bind_array_buffer(self.region_vbo, state)
+            for location, size, offset in ((INSTANCE_REGION_LOCATION, 4, 0), (INSTANCE_LAYER_LOCATION, 1, 16)):
+                offset = ctypes.c_void_p(first * REGION_SIZE + offset)
+                glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, REGION_SIZE, offset)
+        
+    def update(
+        self, matrices: np.ndarray, regions: np.ndarray = None, level_counts: list = None, state=None
+    ) -> None:
+        # (n, 4, 4) float32 model matrices, laid out exactly as glUniformMatrix4fv would take them.
+        # With level_counts the instances are grouped by mesh level of detail, that many of each level in turn.
+        self.capacity = max(self.capacity, len(matrices))
+        
+        # Orphan the old storage so the driver doesn't wait on last frame's draw before the upload
+        self.bind_array_buffer(self.vbo, state)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * MATRIX_SIZE, None, GL_DYNAMIC_DRAW)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, matrices.nbytes, matrices)
+        self.instance_count = len(matrices)
+        self.level_counts = [len(matrices)] if level_counts is None else [int(count) for count in level_counts]
+        
+        # (n, 5) float32 rows from TextureArray.instance_data, one per matrix, whenever the instances change
+        if regions is not None:
+            self.bind_array_buffer(self.region_vbo, state)
+            glBufferData(GL_ARRAY_BUFFER, self.capacity * REGION_SIZE, None, GL_DYNAMIC_DRAW)
+            glBufferSubData(GL_ARRAY_BUFFER, 0, regions.nbytes, regions)
+        
+    def update_cubes(self, cubes: list) -> None:
+        self.update(np.array([cube.model_transform() for cube in cubes], dtype=np.float32).reshape(-1, 4, 4))
+        
+    def draw(self, state=None, submesh: int = None) -> None:
+        # Every instance in one call, using the currently bound (instanced) shader, of one material's submesh if given
+        if not self.instance_count:
+            return
+        if state is not None:
+            state.bind_vertex_array(self.vao)
+        else:
+            glBindVertexArray(self.vao)
+        if len(self.level_counts) == 1:
+            self.mesh.draw_bound(self.instance_count, submesh=submesh)
+            return
+        
+        # One call per level, without base instance (GL 4.2) the attributes are pointed at each level's first instance
+        first = 0
+        for level, count in enumerate(self.level_counts):
+            if count:
+                self.point_instances(first, state)
+                self.mesh.draw_bound(count, level)
+            first += count
+        self.point_instances(0, state)
+        
+    def delete(self) -> None:
+        glDeleteVertexArrays(1, (self.vao, ))
+        glDeleteBuffers(1, (self.vbo, ))
+        if self.region_vbo is not None:
+            glDeleteBuffers(1, (self.region_vbo, ))
@@ -1,9 +1,20 @@
 import pygame
 from OpenGL.GL import *
 
+from AssetCache import load_texture_cached
+
+def texture_bytes(width: int, height: int, bytes_per_pixel: int = 4) -> int:
+    # GPU memory of an RGBA8 texture and its full mip chain, each level halving down to 1x1
+    total = 0
+    while True:
+        total += width * height * bytes_per_pixel
+        if width == 1 and height == 1:
+            return total
+        width, height = max(1, width // 2), max(1, height // 2)
+
 class Material:
     
-    def __init__(self, filepath) -> None:
+    def __init__(self, filepath, loader=None, cache=True) -> None:
         # Generate texture ID and bind as 2D texture
         self.texture = glGenTextures(1)
         glBindTexture(GL_TEXTURE_2D, self.texture)
@@ -16,6 +27,23 @@ class Material:
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         
+        # With a TextureLoader the image is decoded in the background and uploaded later, a placeholder is bound until then
+        self.loader = loader
+        if loader is not None:
+            self.ready = False
+            self.width = self.height = self.nbytes = 0
+            loader.request(self, filepath, cache)
+            return
+        
+        # The baked cache already holds every mip level as raw RGBA, memory-mapped and uploaded as is
+        if cache:
+            meta, levels = load_texture_cached(filepath)
+            for index, level in enumerate(levels):
+                level_height, level_width = level.shape[:2]
+                glTexImage2D(GL_TEXTURE_2D, index, GL_RGBA, level_width, level_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, level)
+            self.loaded(meta['width'], meta['height'])
+            return
+        
         # Load image and convert for OpenGL
         image = pygame.image.load(filepath).convert_alpha()
         image_width, image_height = image.get_rect().size
@@ -24,11 +52,24 @@ class Material:
         # Create new texture from image data, setting it as the current texture of the bound texture object
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, image_width, image_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, image_data)
         glGenerateMipmap(GL_TEXTURE_2D)
+        self.loaded(image_width, image_height)
+        
+    def loaded(self, width: int, height: int) -> None:
+        # The texture object now holds the image and its mipmaps
+        self.width, self.height = width, height
+        self.nbytes = texture_bytes(width, height)
+        self.ready = True
         
-    def use(self):
-        # Activate and bind the first texture unit
+    def use(self, state=None):
+        # Activate and bind the first texture unit, through a RenderState only if it isn't bound there already
+        texture = self.texture if self.ready else self.loader.placeholder
+        if state is not None:
+            state.bind_texture(0, GL_TEXTURE_2D, texture)
+            return
         glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glBindTexture(GL_TEXTURE_2D, texture)
         
     def delete(self):
+        if self.loader is not None:
+            self.loader.cancel(self)
         glDeleteTextures(1, (self.texture, ))
@@ -0,0 +1,309 @@
+import heapq
+import math
+
+import numpy as np
+
+from ObjLoader import index_dtype
+
+# Each level keeps about this fraction of the previous level's triangles
+LOD_REDUCTION = 0.5
+
+# Levels stop before going under this many triangles, or after this many below the full mesh
+LOD_MIN_TRIANGLES = 32
+LOD_MAX_LEVELS = 6
+
+# A level is drawn once its geometric error covers at most this many pixels on screen
+LOD_PIXEL_ERROR = 1.0
+
+# Planes holding borders, UV seams and hard normal edges in place count this much more than a face plane
+FEATURE_EDGE_WEIGHT = 10.0
+
+# Collapses that tilt any remaining triangle further than this from its old orientation are refused
+MIN_NORMAL_DOT = 0.2
+
+# Corner normals closer than this are the same normal, an edge between different ones is a hard edge
+SMOOTH_NORMAL_DOT = 0.999
+
+# A moved corner takes the closest normal already at its new position, unless none is this close
+NORMAL_MATCH_DOT = 0.7
+
+def index_vertices(records: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Collapse identical rows, numbering the unique ones in order of first use like ObjLoader.index_corners
+    keys = np.ascontiguousarray(records).view(np.dtype((np.void, records.shape[1] * records.itemsize))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return records[first[order]], rank[inverse.ravel()]
+
+def plane_quadrics(normals: np.ndarray, points: np.ndarray, weight: float = 1.0) -> np.ndarray:
+    # (n, 4, 4) quadrics of the planes through each point, v^T K v is the squared distance of v to the plane
+    planes = np.concatenate([normals, -np.einsum('ij,ij->i', normals, points)[:, None]], axis=1)
+    return weight * planes[:, :, None] * planes[:, None, :]
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
+
+class QuadricSimplifier:
+
+    def __init__(self, vertices: np.ndarray, indices: np.ndarray) -> None:
+        # x, y, z, s, t, nx, ny, nz records and triangle indices into them, as Mesh loads them
+        records = np.asarray(vertices, dtype=np.float32).reshape(-1, 8)
+        corners = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+
+        # Wedges weld the records sharing position and texture coordinates, positions weld the wedges again.
+        # A UV seam is a position with several wedges, collapses move whole wedges so seams never tear.
+        wedge_records, record_wedges = index_vertices(records[:, :5])
+        positions, wedge_positions = index_vertices(np.ascontiguousarray(wedge_records[:, :3]))
+        self.positions = positions.astype(np.float64)
+        self.texcoords = wedge_records[:, 3:5]
+        self.wedge_position = wedge_positions.tolist()
+
+        # Normals stay per triangle corner, so hard edges keep their split and flat triangles their facet
+        triangle_wedges = record_wedges[corners]
+        self.triangles = triangle_wedges.tolist()
+        self.normals = records[corners][:, :, 5:].astype(np.float64)
+
+        # Triangles with two corners on one position cover nothing and are dropped from the start
+        triangle_positions = wedge_positions[triangle_wedges]
+        self.alive = ((triangle_positions[:, 0] != triangle_positions[:, 1])
+                      & (triangle_positions[:, 1] != triangle_positions[:, 2])
+                      & (triangle_positions[:, 2] != triangle_positions[:, 0])).tolist()
+        self.triangle_count = sum(self.alive)
+
+        self.wedge_triangles = [set() for _ in range(len(wedge_records))]
+        for triangle, wedges in enumerate(self.triangles):
+            if self.alive[triangle]:
+                for wedge in wedges:
+                    self.wedge_triangles[wedge].add(triangle)
+        self.position_wedges = [set() for _ in range(len(positions))]
+        for wedge, position in enumerate(self.wedge_position):
+            if self.wedge_triangles[wedge]:
+                self.position_wedges[position].add(wedge)
+
+        # Every position starts with the planes of the triangles around it
+        alive = np.flatnonzero(self.alive)
+        points = self.positions[triangle_positions[alive]]
+        face_normals = unit_rows(np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0]))
+        face_quadrics = plane_quadrics(face_normals, points[:, 0])
+        self.quadrics = np.zeros((len(positions), 4, 4))
+        for corner in range(3):
+            np.add.at(self.quadrics, triangle_positions[alive, corner], face_quadrics)
+        self.add_feature_quadrics(alive, face_normals)
+
+        # Largest quadric error of any collapse so far, the error of the current level
+        self.error = 0.0
+
+    def corner_at(self, triangle: int, position: int) -> int:
+        wedges = self.triangles[triangle]
+        for corner in range(3):
+            if self.wedge_position[wedges[corner]] == position:
+                return corner
+        return -1
+
+    def add_feature_quadrics(self, alive: np.ndarray, face_normals: np.ndarray) -> None:
+        # Edges by position pair, with the triangles on either side of each
+        edges = {}
+        for triangle in alive.tolist():
+            wedges = self.triangles[triangle]
+            for corner in range(3):
+                a = self.wedge_position[wedges[corner]]
+                b = self.wedge_position[wedges[(corner + 1) % 3]]
+                edges.setdefault((a, b) if a < b else (b, a), []).append(triangle)
+
+        # Borders, seams and hard edges get planes through the edge at right angles to each side,
+        # so moving off the edge line costs even where the surface itself is flat
+        rows = {triangle: row for row, triangle in enumerate(alive.tolist())}
+        features = [(a, b, triangle) for (a, b), sides in edges.items() if self.is_feature(a, b, sides)
+                    for triangle in sides]
+        if not features:
+            return
+        a, b, sides = np.array(features).T
+        directions = self.positions[b] - self.positions[a]
+        normals = unit_rows(np.cross(directions, face_normals[[rows[side] for side in sides]]))
+        quadrics = plane_quadrics(normals, self.positions[a], FEATURE_EDGE_WEIGHT)
+        np.add.at(self.quadrics, a, quadrics)
+        np.add.at(self.quadrics, b, quadrics)
+
+    def is_feature(self, a: int, b: int, sides: list) -> bool:
+        if len(sides) != 2:
+            return True
+        first, second = sides
+        for position in (a, b):
+            corner_first = self.corner_at(first, position)
+            corner_second = self.corner_at(second, position)
+            if self.triangles[first][corner_first] != self.triangles[second][corner_second]:
+                return True
+            normal_dot = self.normals[first, corner_first] @ self.normals[second, corner_second]
+            if normal_dot < SMOOTH_NORMAL_DOT:
+                return True
+        return False
+
+    def position_triangles(self, position: int) -> set:
+        return set().union(*(self.wedge_triangles[wedge] for wedge in self.position_wedges[position]))
+
+    def neighbours(self, position: int, triangles: set = None) -> set:
+        triangles = self.position_triangles(position) if triangles is None else triangles
+        result = {self.wedge_position[wedge] for triangle in triangles for wedge in self.triangles[triangle]}
+        result.discard(position)
+        return result
+
+    def collapse_cost(self, p: int, q: int) -> float:
+        # Half-edge collapse: p moves onto q, so the only candidate position is q's
+        x, y, z = self.positions[q].tolist()
+        v = np.array([x, y, z, 1.0])
+        return max(float(v @ (self.quadrics[p] + self.quadrics[q]) @ v), 0.0)
+
+    def collapse(self, p: int, q: int) -> bool:
+        # Moves p onto q and returns True, or leaves the mesh alone if that would break it
+        around_p = self.position_triangles(p)
+        around_q = self.position_triangles(q)
+        shared = around_p & around_q
+        if not shared:
+            return False
+
+        # Link condition: p and q may only share the neighbours across the triangles being removed,
+        # anything else would pinch the surface into a non-manifold edge
+        third = {self.wedge_position[wedge] for triangle in shared for wedge in self.triangles[triangle]} - {p, q}
+        if self.neighbours(p, around_p) & self.neighbours(q, around_q) != third:
+            return False
+
+        # Every wedge at p has to move onto the one wedge at q it shares an edge with, otherwise a seam would tear
+        mapping = {}
+        for triangle in shared:
+            wedges = self.triangles[triangle]
+            source = wedges[self.corner_at(triangle, p)]
+            if mapping.setdefault(source, wedges[self.corner_at(triangle, q)]) != wedges[self.corner_at(triangle, q)]:
+                return False
+        if not self.position_wedges[p] <= mapping.keys():
+            return False
+
+        # Triangles that stay must neither fold over nor collapse to a sliver, checked for all of them at once
+        moved = sorted(around_p - shared)
+        moved_corners = [self.corner_at(triangle, p) for triangle in moved]
+        points = self.positions[[[self.wedge_position[wedge] for wedge in self.triangles[triangle]]
+                                 for triangle in moved]].reshape(-1, 3, 3)
+        old = unit_rows(np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0]))
+        points[np.arange(len(moved)), moved_corners] = self.positions[q]
+        new = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+        lengths = np.linalg.norm(new, axis=1)
+        if np.any(lengths == 0) or np.any(np.einsum('ij,ij->i', old, new) < MIN_NORMAL_DOT * lengths):
+            return False
+
+        # Faceted triangles carry their face normal in every corner and get the new face normal
+        new /= lengths[:, None]
+        is_flat = np.einsum('tcj,tj->tc', self.normals[moved], old).min(axis=1, initial=1.0) >= SMOOTH_NORMAL_DOT
+        flat = [new[row] if is_flat[row] else None for row in range(len(moved))]
+
+        # Normals already at q, per wedge, for smooth corners arriving there
+        arriving = {}
+        for triangle in around_q - shared:
+            corner = self.corner_at(triangle, q)
+            arriving.setdefault(self.triangles[triangle][corner], []).append(self.normals[triangle, corner])
+
+        for triangle in shared:
+            self.alive[triangle] = False
+            for wedge in self.triangles[triangle]:
+                self.wedge_triangles[wedge].discard(triangle)
+            self.triangle_count -= 1
+
+        for triangle, corner, face_normal in zip(moved, moved_corners, flat):
+            source = self.triangles[triangle][corner]
+            target = mapping[source]
+            self.triangles[triangle][corner] = target
+            self.wedge_triangles[source].discard(triangle)
+            self.wedge_triangles[target].add(triangle)
+
+            if face_normal is not None:
+                self.normals[triangle] = face_normal
+                continue
+            normal = self.normals[triangle, corner]
+            candidates = arriving.get(target, [])
+            if candidates:
+                best = max(candidates, key=lambda candidate: candidate @ normal)
+                if best @ normal >= NORMAL_MATCH_DOT:
+                    self.normals[triangle, corner] = best
+
+        self.position_wedges[p] = set()
+        self.quadrics[q] += self.quadrics[p]
+        return True
+
+    def simplify(self, targets: list):
+        # Collapses the cheapest edge first, yielding (vertices, indices, error) each time the triangle count
+        # reaches the next target. Stops early, with a last partial level, once no edge can be collapsed.
+        edges = self.initial_edges()
+        versions = [0] * len(self.positions)
+        heap = list(zip(self.initial_costs(edges).tolist(), *edges.T.tolist(), [0] * len(edges), [0] * len(edges)))
+        heapq.heapify(heap)
+
+        previous = self.triangle_count
+        for target in sorted(targets, reverse=True):
+            while self.triangle_count > target and heap:
+                cost, p, q, version_p, version_q = heapq.heappop(heap)
+                if versions[p] != version_p or versions[q] != version_q or not self.position_wedges[p]:
+                    continue
+                if not self.collapse(p, q):
+                    continue
+                self.error = max(self.error, cost)
+
+                # Every edge at q has a new cost, older heap entries for them are skipped by version
+                versions[p] += 1
+                versions[q] += 1
+                for n in self.neighbours(q):
+                    heapq.heappush(heap, (self.collapse_cost(q, n), q, n, versions[q], versions[n]))
+                    heapq.heappush(heap, (self.collapse_cost(n, q), n, q, versions[n], versions[q]))
+
+            if self.triangle_count > target:
+                if self.triangle_count <= (previous + target) / 2:
+                    yield self.extract()
+                return
+            previous = self.triangle_count
+            yield self.extract()
+
+    def initial_edges(self) -> np.ndarray:
+        # Both directions of every edge, as (p, q) rows
+        alive = np.flatnonzero(self.alive)
+        wedge_positions = np.array(self.wedge_position, dtype=np.int64)
+        positions = wedge_positions[np.array(self.triangles, dtype=np.int64).reshape(-1, 3)[alive]]
+        edges = np.concatenate([positions[:, [0, 1]], positions[:, [1, 2]], positions[:, [2, 0]]])
+        return np.unique(np.concatenate([edges, edges[:, ::-1]]), axis=0)
+
+    def initial_costs(self, edges: np.ndarray) -> np.ndarray:
+        v = np.concatenate([self.positions[edges[:, 1]], np.ones((len(edges), 1))], axis=1)
+        quadrics = self.quadrics[edges[:, 0]] + self.quadrics[edges[:, 1]]
+        return np.maximum(np.einsum('ni,nij,nj->n', v, quadrics, v), 0.0)
+
+    def extract(self) -> tuple[np.ndarray, np.ndarray, float]:
+        # The current mesh as indexed records again, with its error as a distance in object space
+        alive = np.flatnonzero(self.alive)
+        wedges = np.array([self.triangles[triangle] for triangle in alive.tolist()], dtype=np.int64).reshape(-1, 3)
+        records = np.empty((len(alive), 3, 8), dtype=np.float32)
+        records[..., :3] = self.positions[np.array(self.wedge_position, dtype=np.int64)[wedges]]
+        records[..., 3:5] = self.texcoords[wedges]
+        records[..., 5:] = self.normals[alive]
+
+        unique, indices = index_vertices(records.reshape(-1, 8))
+        return unique.ravel(), indices.astype(index_dtype(len(unique))), math.sqrt(self.error)
+
+def build_lods(vertices: np.ndarray, indices: np.ndarray) -> list[tuple[np.ndarray, np.ndarray, float]]:
+    # The full mesh, then each coarser level as (vertices, indices, error), all from one decimation pass
+    levels = [(vertices, indices, 0.0)]
+    targets = []
+    triangles = len(indices) // 3
+    while len(targets) < LOD_MAX_LEVELS:
+        triangles = int(triangles * LOD_REDUCTION)
+        if triangles < LOD_MIN_TRIANGLES:
+            break
+        targets.append(triangles)
+    if targets:
+        levels.extend(QuadricSimplifier(vertices, indices).simplify(targets))
+    return levels
+
+def select_lod(errors, radius: float, screen_size, pixel_error: float = LOD_PIXEL_ERROR):
+    # Coarsest level whose error stays under pixel_error pixels, for one projected size or an array of them.
+    # screen_size is the bounding sphere's diameter in pixels, see TextureStreamer.projected_size.
+    errors = np.maximum.accumulate(np.asarray(errors, dtype=np.float64))
+    with np.errstate(divide='ignore'):
+        allowed = pixel_error * 2 * radius / np.asarray(screen_size, dtype=np.float64)
+    return np.maximum(np.searchsorted(errors, allowed, side='right') - 1, 0)
@@ -0,0 +1,548 @@
+import numpy as np
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+# Byte values OBJ treats as token separators
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[ord(c) for c in ' \t\r\n\v\f']] = True
+
+_SLASH = ord('/')
+_SPACE = ord(' ')
+_NEWLINE = ord('\n')
+
+# Streaming loads read the file in chunks of this many bytes
+STREAM_CHUNK_SIZE = 4 << 20
+
+# Parallel loads don't split files into ranges smaller than this
+PARALLEL_MIN_RANGE = 1 << 20
+
+# Line kinds
+_SKIP, _V, _VT, _VN, _F = range(5)
+
+# ObjBlock arrays a parallel worker sends back
+_BLOCK_ARRAYS = ('positions', 'texcoords', 'normals', 'corners', 'face_sizes', 'corner_before', 'material_faces')
+
+class ObjBlock:
+
+    def __init__(self) -> None:
+        # Vertex records as parsed, in file order
+        self.positions = np.zeros((0, 3), dtype=np.float32)
+        self.texcoords = np.zeros((0, 2), dtype=np.float32)
+        self.normals = np.zeros((0, 3), dtype=np.float32)
+
+        # One (v, vt, vn) row per face corner, raw OBJ indices with 0 meaning "not given"
+        self.corners = np.zeros((0, 3), dtype=np.int64)
+
+        # Number of corners of each face, in file order
+        self.face_sizes = np.zeros(0, dtype=np.int64)
+
+        # Records of each kind seen before each corner's line, only needed for negative indices
+        self.corner_before = None
+
+        # Faces before each usemtl line and the material it names, and the mtllib files, in file order
+        self.material_faces = np.zeros(0, dtype=np.int64)
+        self.material_names = []
+        self.libraries = []
+
+def parse_obj_block(data: bytes) -> ObjBlock:
+    block = ObjBlock()
+
+    if not data.endswith(b'\n'):
+        data += b'\n'
+    buf = np.frombuffer(data, dtype=np.uint8)
+    lines = _scan_lines(buf)
+    if lines is None:
+        return block
+    line_starts, line_ends, keywords, line_kinds, payload_counts = lines
+
+    # Blank out keywords and every line that isn't numeric data, leaving one stream of numbers
+    text = buf.copy()
+    byte_kinds = np.repeat(line_kinds, line_ends - line_starts + 1)
+    text[byte_kinds == _SKIP] = _SPACE
+    data_lines = line_kinds != _SKIP
+    text[keywords[data_lines]] = _SPACE
+    text[keywords[data_lines] + 1] = _SPACE
+
+    is_f = line_kinds == _F
+    block.face_sizes = payload_counts[is_f]
+    columns = _face_columns(text, block.face_sizes)
+    text[text == _SLASH] = _SPACE
+
+    # Vertex data goes through the float parser, face indices through the (cheaper) integer one
+    vertex_bytes = (byte_kinds >= _V) & (byte_kinds <= _VN)
+    values, value_kinds = _read_numbers(text[vertex_bytes], byte_kinds[vertex_bytes], np.float64)
+
+    block.positions = _vertex_records(values[value_kinds == _V], payload_counts[line_kinds == _V], 3)
+    block.texcoords = _vertex_records(values[value_kinds == _VT], payload_counts[line_kinds == _VT], 2)
+    block.normals = _vertex_records(values[value_kinds == _VN], payload_counts[line_kinds == _VN], 3)
+
+    face_bytes = byte_kinds == _F
+    indices, _ = _read_numbers(text[face_bytes], byte_kinds[face_bytes], np.int64)
+    if len(indices) != block.face_sizes.sum() * len(columns):
+        raise ValueError('malformed face record')
+    block.corners = np.zeros((block.face_sizes.sum(), 3), dtype=np.int64)
+    block.corners[:, columns] = indices.reshape(-1, len(columns))
+
+    # usemtl and mtllib lines are few, their names are read one line at a time
+    usemtl = _keyword_lines(buf, keywords, line_kinds, b'usemtl')
+    block.material_faces = np.searchsorted(np.flatnonzero(is_f), usemtl)
+    block.material_names = [_line_text(buf, keywords[line] + 6, line_ends[line]) for line in usemtl]
+    for line in _keyword_lines(buf, keywords, line_kinds, b'mtllib'):
+        block.libraries += _line_text(buf, keywords[line] + 6, line_ends[line]).split()
+
+    # Relative (negative) indices count back from the records defined so far
+    if (block.corners < 0).any():
+        face_lines = np.repeat(np.flatnonzero(is_f), block.face_sizes)
+        block.corner_before = np.stack([
+            np.searchsorted(np.flatnonzero(line_kinds == kind), face_lines)
+            for kind in (_V, _VT, _VN)
+        ], axis=1)
+
+    return block
+
+def _scan_lines(buf: np.ndarray):
+    tokens = _token_starts(_WHITESPACE[buf])
+    if len(tokens) == 0:
+        return None
+
+    # The first token of each non-blank line is its keyword, the rest is its payload
+    line_ends = np.flatnonzero(buf == _NEWLINE)
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    first = np.searchsorted(tokens, line_starts)
+    last = np.searchsorted(tokens, line_ends)
+    filled = first < last
+
+    keywords = line_ends.copy()
+    keywords[filled] = tokens[first[filled]]
+    payload_counts = last - first - 1
+
+    # Classify lines by keyword, blank lines point their keyword at their own newline
+    b0 = buf[keywords]
+    b1 = buf[np.minimum(keywords + 1, len(buf) - 1)]
+    single = _WHITESPACE[b1]
+    double = _WHITESPACE[buf[np.minimum(keywords + 2, len(buf) - 1)]]
+
+    line_kinds = np.zeros(len(line_starts), dtype=np.uint8)
+    line_kinds[(b0 == ord('v')) & single] = _V
+    line_kinds[(b0 == ord('v')) & (b1 == ord('t')) & double] = _VT
+    line_kinds[(b0 == ord('v')) & (b1 == ord('n')) & double] = _VN
+    line_kinds[(b0 == ord('f')) & single] = _F
+    line_kinds[~filled] = _SKIP
+
+    return line_starts, line_ends, keywords, line_kinds, payload_counts
+
+def _keyword_lines(buf: np.ndarray, keywords: np.ndarray, line_kinds: np.ndarray, keyword: bytes) -> np.ndarray:
+    # Lines starting with this keyword, among those that aren't vertex or face data
+    candidates = np.flatnonzero((line_kinds == _SKIP) & (buf[keywords] == keyword[0]))
+    end = len(keyword)
+    return np.array([
+        line for line in candidates.tolist()
+        if buf[keywords[line]:keywords[line] + end].tobytes() == keyword and _WHITESPACE[buf[keywords[line] + end]]
+    ], dtype=np.int64)
+
+def _line_text(buf: np.ndarray, start: int, end: int) -> str:
+    return buf[start:end].tobytes().decode('utf-8', 'replace').strip()
+
+def _token_starts(whitespace: np.ndarray) -> np.ndarray:
+    # A token starts on any non-whitespace byte that follows whitespace (or the start of the buffer)
+    start = ~whitespace
+    start[1:] &= whitespace[:-1]
+    return np.flatnonzero(start)
+
+def _face_columns(text: np.ndarray, face_sizes: np.ndarray) -> list[int]:
+    if len(face_sizes) == 0:
+        return [0, 1, 2]
+    if face_sizes.min() < 3:
+        raise ValueError('face with fewer than 3 corners')
+
+    # Work out which of v, v/vt, v//vn and v/vt/vn the faces use
+    slash = text == _SLASH
+    slashes = np.count_nonzero(slash)
+    doubles = np.count_nonzero(slash[1:] & slash[:-1])
+    n = face_sizes.sum()
+
+    if slashes == 0:
+        return [0]
+    if slashes == n and doubles == 0:
+        return [0, 1]
+    if slashes == 2 * n and doubles == n:
+        return [0, 2]
+    if slashes == 2 * n and doubles == 0:
+        return [0, 1, 2]
+    raise ValueError('mixed face formats are not supported')
+
+def _read_numbers(text: np.ndarray, byte_kinds: np.ndarray, dtype) -> tuple[np.ndarray, np.ndarray]:
+    # Every remaining token is a number, tag each with the kind of line it came from
+    kinds = byte_kinds[_token_starts(_WHITESPACE[text])]
+
+    values = np.fromstring(text.tobytes(), dtype=dtype, sep=' ')
+    if len(values) != len(kinds):
+        raise ValueError('malformed number in OBJ data')
+
+    return values, kinds
+
+def _vertex_records(values: np.ndarray, counts: np.ndarray, width: int) -> np.ndarray:
+    if len(counts) == 0:
+        return np.zeros((0, width), dtype=np.float32)
+    if counts.min() < width:
+        raise ValueError(f'vertex record with fewer than {width} components')
+    if len(values) != counts.sum():
+        raise ValueError('malformed vertex record')
+
+    # Keep the leading components of each record (drops w, vertex colours and the like)
+    if (counts == width).all():
+        values = values.reshape(-1, width)
+    else:
+        offsets = np.cumsum(counts) - counts
+        values = values[offsets[:, None] + np.arange(width)]
+
+    return values.astype(np.float32)
+
+def resolve_corners(block: ObjBlock, offsets=(0, 0, 0)) -> np.ndarray:
+    # Convert raw OBJ indices to 0-based record indices, -1 where a component was not given
+    raw = block.corners
+    resolved = raw - 1
+
+    negative = raw < 0
+    if negative.any():
+        relative = np.asarray(offsets, dtype=np.int64) + block.corner_before + raw
+        resolved[negative] = relative[negative]
+
+    resolved[raw == 0] = -1
+    return resolved
+
+def triangulate(face_sizes: np.ndarray) -> np.ndarray:
+    # Fan each polygon from its first corner: (0, i, i + 1) for i in 1 .. n - 2
+    triangle_counts = face_sizes - 2
+    face_starts = np.cumsum(face_sizes) - face_sizes
+
+    triangle_faces = np.repeat(np.arange(len(face_sizes)), triangle_counts)
+    triangle_starts = np.cumsum(triangle_counts) - triangle_counts
+    local = np.arange(len(triangle_faces)) - triangle_starts[triangle_faces] + 1
+
+    first = face_starts[triangle_faces]
+    return np.stack([first, first + local, first + local + 1], axis=1).ravel()
+
+def interleave(
+    positions: np.ndarray,
+    texcoords: np.ndarray,
+    normals: np.ndarray,
+    corners: np.ndarray,
+) -> np.ndarray:
+    # x, y, z, s, t, nx, ny, nz per corner, missing components are left as zeros
+    vertices = np.zeros((len(corners), 8), dtype=np.float32)
+
+    for data, column, (start, stop) in (
+        (positions, 0, (0, 3)),
+        (texcoords, 1, (3, 5)),
+        (normals,   2, (5, 8)),
+    ):
+        indices = corners[:, column]
+        if len(indices) and indices.min() >= 0:
+            vertices[:, start:stop] = data[indices]
+        else:
+            given = indices >= 0
+            vertices[given, start:stop] = data[indices[given]]
+
+    return vertices
+
+def index_corners(corners: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Collapse identical (v, vt, vn) corners, numbering the unique ones in order of first use
+    shifted = corners + 1
+    sizes = shifted.max(axis=0, initial=0) + 1
+    if float(sizes[0]) * float(sizes[1]) * float(sizes[2]) < 2**63:
+        keys = (shifted[:, 0] * sizes[1] + shifted[:, 1]) * sizes[2] + shifted[:, 2]
+    else:
+        keys = np.ascontiguousarray(shifted).view(np.dtype((np.void, 3 * shifted.itemsize))).ravel()
+
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    return corners[first[order]], rank[inverse.ravel()]
+
+def index_dtype(vertex_count: int):
+    # 16-bit indices whenever every vertex can be addressed with them
+    return np.uint16 if vertex_count <= 1 << 16 else np.uint32
+
+def read_obj(filename: str, workers: int = 1) -> ObjBlock:
+    if workers > 1:
+        return read_obj_parallel(filename, workers)
+
+    with open(filename, 'rb') as file:
+        block = parse_obj_block(file.read())
+
+    block.corners = resolve_corners(block)
+    block.corner_before = None
+    return block
+
+def load_obj(filename: str, workers: int = 1) -> np.ndarray:
+    block = read_obj(filename, workers)
+    corners = block.corners[triangulate(block.face_sizes)]
+
+    return interleave(block.positions, block.texcoords, block.normals, corners).ravel()
+
+def triangle_materials(block: ObjBlock) -> tuple[list, np.ndarray]:
+    # Material names in order of first use (None for faces before any usemtl) and each triangle's index into them
+    face_runs = np.searchsorted(block.material_faces, np.arange(len(block.face_sizes)), side='right') - 1
+    run_names = [None] + block.material_names
+
+    # A name can come back in a later run, runs without faces don't count as a use
+    numbers = {}
+    for run in np.unique(face_runs).tolist():
+        numbers.setdefault(run_names[run + 1], len(numbers))
+    run_numbers = np.array([numbers.get(name, 0) for name in run_names], dtype=np.int64)
+    return list(numbers), np.repeat(run_numbers[face_runs + 1], block.face_sizes - 2)
+
+def load_obj_submeshes(filename: str, workers: int = 1) -> tuple[np.ndarray, np.ndarray, list, list]:
+    # Like load_obj_indexed with each material's triangles next to each other: (vertices, indices, submeshes,
+    # libraries), a submesh being (material name, first index, index count), materials in order of first use
+    block = read_obj(filename, workers)
+    names, materials = triangle_materials(block)
+    triangles = triangulate(block.face_sizes).reshape(-1, 3)
+    if len(names) > 1:
+        triangles = triangles[np.argsort(materials, kind='stable')]
+    unique, indices = index_corners(block.corners[triangles.ravel()])
+    vertices = interleave(block.positions, block.texcoords, block.normals, unique).ravel()
+
+    counts = 3 * np.bincount(materials, minlength=len(names))
+    firsts = np.cumsum(counts) - counts
+    submeshes = [(name, int(first), int(count)) for name, first, count in zip(names, firsts, counts)]
+    return vertices, indices.astype(index_dtype(len(unique))), submeshes, list(dict.fromkeys(block.libraries))
+
+def load_obj_indexed(filename: str, workers: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    vertices, indices, _, _ = load_obj_submeshes(filename, workers)
+    return vertices, indices
+
+def load_mtl(filename: str) -> dict:
+    # Material name -> {'diffuse': Kd colour, 'texture': map_Kd path or None}, paths relative to the MTL file
+    materials = {}
+    material = None
+    directory = os.path.dirname(os.path.abspath(filename))
+    with open(filename, 'r') as file:
+        for line in file:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == 'newmtl':
+                material = materials[' '.join(words[1:])] = {'diffuse': (1.0, 1.0, 1.0), 'texture': None}
+            elif material is None:
+                continue
+            elif words[0] == 'Kd' and len(words) >= 4:
+                material['diffuse'] = tuple(float(word) for word in words[1:4])
+            elif words[0] == 'map_Kd' and len(words) >= 2:
+                # Options like -s or -bm come first, the file name is last
+                material['texture'] = os.path.normpath(os.path.join(directory, words[-1]))
+    return materials
+
+def load_obj_materials(filename: str, libraries: list) -> dict:
+    # Every material of an OBJ's mtllib files, relative to the OBJ. Exporters often name libraries that were
+    # never shipped with the model, those are left out and their materials drawn with the default texture.
+    materials = {}
+    directory = os.path.dirname(os.path.abspath(filename))
+    for library in libraries:
+        path = os.path.join(directory, library)
+        if os.path.exists(path):
+            materials.update(load_mtl(path))
+    return materials
+
+class GrowableArray:
+
+    def __init__(self, width: int, dtype=np.float32, capacity: int = 1024) -> None:
+        # Rows live in one typed array that doubles when full, instead of a list of Python lists
+        self.data = np.empty((capacity, width), dtype=dtype)
+        self.size = 0
+
+    def extend(self, rows: np.ndarray) -> None:
+        needed = self.size + len(rows)
+        if needed > len(self.data):
+            grown = np.empty((max(needed, 2 * len(self.data)), self.data.shape[1]), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = rows
+        self.size = needed
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+def read_obj_chunks(filename: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    # Yield newline-terminated blocks of whole lines, roughly chunk_size bytes each
+    with open(filename, 'rb') as file:
+        remainder = b''
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            data = remainder + chunk
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                remainder = data
+                continue
+            remainder = data[cut:]
+            yield data[:cut]
+        if remainder:
+            yield remainder + b'\n'
+
+def count_obj_triangles(filename: str, chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    # Cheap first pass that only counts face corners, used to size the output buffer up front
+    triangles = 0
+    for data in read_obj_chunks(filename, chunk_size):
+        lines = _scan_lines(np.frombuffer(data, dtype=np.uint8))
+        if lines is not None:
+            _, _, _, line_kinds, payload_counts = lines
+            triangles += int((payload_counts[line_kinds == _F] - 2).sum())
+    return triangles
+
+def stream_obj(filename: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    # Yield (n, 8) float32 batches of triangulated x, y, z, s, t, nx, ny, nz vertices, one per chunk
+    positions = GrowableArray(3)
+    texcoords = GrowableArray(2)
+    normals = GrowableArray(3)
+
+    for data in read_obj_chunks(filename, chunk_size):
+        block = parse_obj_block(data)
+
+        # Relative indices count back from everything read so far, not just this chunk
+        offsets = (positions.size, texcoords.size, normals.size)
+        corners = resolve_corners(block, offsets)
+
+        positions.extend(block.positions)
+        texcoords.extend(block.texcoords)
+        normals.extend(block.normals)
+        if len(block.face_sizes) == 0:
+            continue
+
+        try:
+            yield interleave(positions.view(), texcoords.view(), normals.view(), corners[triangulate(block.face_sizes)])
+        except IndexError:
+            raise ValueError(f'{filename}: face refers to a vertex that is not defined before it') from None
+
+def split_obj_ranges(filename: str, parts: int) -> list[tuple[int, int]]:
+    # Byte ranges of roughly equal size, each starting at the beginning of a line
+    size = os.path.getsize(filename)
+    parts = max(1, min(parts, size // PARALLEL_MIN_RANGE))
+
+    bounds = [0]
+    with open(filename, 'rb') as file:
+        for part in range(1, parts):
+            file.seek(max(size * part // parts - 1, bounds[-1]))
+            file.readline()
+            bounds.append(min(file.tell(), size))
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def _parse_obj_range(filename: str, start: int, end: int) -> dict:
+    # Worker side: parse one range and hand the arrays back through shared memory
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        block = parse_obj_block(file.read(end - start))
+
+    shared = {'material_names': block.material_names, 'libraries': block.libraries}
+    for name in _BLOCK_ARRAYS:
+        array = getattr(block, name)
+        if array is None:
+            continue
+        memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+        shared[name] = (memory.name, array.shape, array.dtype.str)
+        memory.close()
+
+        # The parent unlinks the segment, so this worker's tracker must not clean it up as a leak
+        resource_tracker.unregister(memory._name, 'shared_memory')
+
+    return shared
+
+def _take_shared_block(shared: dict) -> ObjBlock:
+    # Copy a worker's arrays out of shared memory and release it
+    block = ObjBlock()
+    block.material_names = shared.pop('material_names')
+    block.libraries = shared.pop('libraries')
+    for name, (memory_name, shape, dtype) in shared.items():
+        memory = shared_memory.SharedMemory(name=memory_name)
+        try:
+            setattr(block, name, np.ndarray(shape, dtype=dtype, buffer=memory.buf).copy())
+        finally:
+            memory.close()
+            memory.unlink()
+    return block
+
+def read_obj_parallel(filename: str, workers: int) -> ObjBlock:
+    ranges = split_obj_ranges(filename, workers)
+    if len(ranges) == 1:
+        return read_obj(filename)
+
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(_parse_obj_range, filename, start, end) for start, end in ranges]
+
+    # Collect every range, even after a failure, so no shared memory is left behind
+    blocks = []
+    error = None
+    for future in futures:
+        try:
+            blocks.append(_take_shared_block(future.result()))
+        except Exception as exception:
+            error = error or exception
+    if error is not None:
+        raise error
+
+    # Face indices are file-relative, so each range resolves against the records of the ranges before it
+    merged = ObjBlock()
+    corners = []
+    offsets = np.zeros(3, dtype=np.int64)
+    for block in blocks:
+        corners.append(resolve_corners(block, offsets))
+        offsets += (len(block.positions), len(block.texcoords), len(block.normals))
+
+    merged.positions = np.concatenate([block.positions for block in blocks])
+    merged.texcoords = np.concatenate([block.texcoords for block in blocks])
+    merged.normals = np.concatenate([block.normals for block in blocks])
+    merged.face_sizes = np.concatenate([block.face_sizes for block in blocks])
+    merged.corners = np.concatenate(corners)
+
+    # Material switches count faces from the start of their range, which starts after the faces of earlier ranges
+    face_offsets = np.cumsum([0] + [len(block.face_sizes) for block in blocks[:-1]])
+    merged.material_faces = np.concatenate([
+        block.material_faces + offset for block, offset in zip(blocks, face_offsets)
+    ]).astype(np.int64)
+    merged.material_names = [name for block in blocks for name in block.material_names]
+    merged.libraries = [library for block in blocks for library in block.libraries]
+    return merged
+
+def load_obj_reference(filename: str) -> list[float]:
+    # Original line-by-line loader, kept for benchmarks and for checking the NumPy parser against
+    v_data = defaultdict(list)
+    vertices = []
+
+    with open(filename, 'r') as file:
+        for line in file:
+            words = line.strip().split()
+            if words and words[0] in {'v', 'vt', 'vn'}:
+                v_data[words[0]].append([float(word) for word in words[1:] if word])
+            elif words and words[0] == 'f':
+                _read_face_data(words, v_data, vertices)
+
+    return vertices
+
+def _read_face_data(words: list[str], v_data: dict, vertices: list[float]) -> None:
+    v  = v_data['v']
+    vt = v_data['vt']
+    vn = v_data['vn']
+
+    # Pre-process to extract all indices
+    indices = [word.split('/') for word in words[1:]]
+
+    # Validate indices and convert them to integers (assumes indices are complete and correct)
+    indices = [(int(v_idx)-1 if v_idx else None,
+                int(vt_idx)-1 if vt_idx else None,
+                int(vn_idx)-1 if vn_idx else None) for v_idx, vt_idx, vn_idx in indices]
+
+    # Each face is a polygon, triangulate the polygon by creating triangles from consecutive vertices
+    for i in range(1, len(indices) - 1):
+        for index_set in (indices[0], indices[i], indices[i + 1]):
+            for idx, data_array in zip(index_set, (v, vt, vn)):
+                if idx is not None:  # Ensure the index is valid
+                    vertices.extend(data_array[idx])
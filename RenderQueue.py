@@ -0,0 +1,38 @@
+from OpenGL.GL import *
+import numpy as np
+
+class RenderQueue:
+
+    def __init__(self, sort: bool = True) -> None:
+        # One frame's draws, collected first and issued sorted by shader, then texture, then mesh,
+        # so each program, texture and VAO is bound once per run of draws sharing it.
+        # Unsorted, draws go out in submission order, which is what the state counters are compared against.
+        self.sort = sort
+        self.items = []
+        self.draws = 0
+
+    def submit(self, shader, texture, mesh, model_transform: np.ndarray, submesh: int = None, level: int = 0) -> None:
+        # A mesh, or one material's submesh of it, with its own model matrix
+        key = (shader.program, texture.texture, mesh.vao, -1 if submesh is None else submesh, level)
+        self.items.append((key, shader, texture, mesh, submesh, level, model_transform))
+
+    def flush(self, state) -> int:
+        # Issue every queued draw through the RenderState and empty the queue, returns the draws issued
+        if self.sort:
+            self.items.sort(key=lambda item: item[0])
+
+        # Decode uniforms and the model location only change with the shader or mesh
+        current = None
+        for _, shader, texture, mesh, submesh, level, model_transform in self.items:
+            shader.use(state)
+            texture.use(state)
+            if current != (shader, mesh):
+                current = (shader, mesh)
+                mesh.use_decode(shader, state)
+                model_location = shader.uniform('model')
+            state.uniform(glUniformMatrix4fv, model_location, 1, GL_FALSE, model_transform, track=False)
+            mesh.draw(level, state, submesh)
+
+        self.draws = len(self.items)
+        self.items = []
+        return self.draws
@@ -0,0 +1,145 @@
+from OpenGL.GL import *
+import numpy as np
+from collections import Counter
+
+class RenderState:
+
+    def __init__(self, tracking: bool = True) -> None:
+        # The last value sent to GL for each piece of state, a call setting the same value again is skipped.
+        # Only what goes through here is known, code that binds or sets things directly must invalidate() after.
+        # Without tracking every call is forwarded, the counters still say what a frame issued.
+        self.tracking = tracking
+        self.invalidate()
+
+        # Calls issued and skipped by kind, this frame's so far and the last finished frame's
+        self.issued = Counter()
+        self.skipped = Counter()
+        self.last_issued = Counter()
+        self.last_skipped = Counter()
+        self.frames = 0
+
+    def invalidate(self) -> None:
+        # Forget everything, the next call of each kind goes to GL whatever it sets
+        self.program = None
+        self.vertex_array = None
+        self.active_unit = None
+        self.textures = {}
+        self.buffers = {}
+        self.capabilities = {}
+        self.blend = None
+        self.depth = None
+        self.depth_write = None
+        self.uniforms = {}
+
+    def forget_textures(self) -> None:
+        # After texture uploads outside the cache, which bind on whichever unit is active
+        self.active_unit = None
+        self.textures = {}
+
+    def begin_frame(self) -> None:
+        self.last_issued, self.issued = self.issued, Counter()
+        self.last_skipped, self.skipped = self.skipped, Counter()
+        self.frames += 1
+
+    def changed(self, kind: str, current, value) -> bool:
+        # Count the call as issued or skipped, True when it has to reach GL
+        if self.tracking and current == value:
+            self.skipped[kind] += 1
+            return False
+        self.issued[kind] += 1
+        return True
+
+    # Program, vertex array, texture and uniform calls come per object, their checks are written out in place
+
+    def use_program(self, program: int) -> None:
+        if self.tracking and program == self.program:
+            self.skipped['program'] += 1
+            return
+        glUseProgram(program)
+        self.program = program
+        self.issued['program'] += 1
+
+    def bind_vertex_array(self, vertex_array: int) -> None:
+        if self.tracking and vertex_array == self.vertex_array:
+            self.skipped['vertex array'] += 1
+            return
+        glBindVertexArray(vertex_array)
+        self.vertex_array = vertex_array
+        self.issued['vertex array'] += 1
+
+    def bind_texture(self, unit: int, target, texture: int) -> None:
+        # Units by number, 0 for GL_TEXTURE0, each unit has a binding per target
+        key = (unit, target)
+        if self.tracking and self.textures.get(key) == texture:
+            self.skipped['texture'] += 1
+            return
+        self.issued['texture'] += 1
+        if self.changed('active texture', self.active_unit, unit):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            self.active_unit = unit
+        glBindTexture(target, texture)
+        self.textures[key] = texture
+
+    def bind_buffer(self, target, buffer: int) -> None:
+        # The element array binding belongs to the bound vertex array, every other target is global
+        key = (int(target), self.vertex_array if target == GL_ELEMENT_ARRAY_BUFFER else None)
+        if self.changed('buffer', self.buffers.get(key), buffer):
+            glBindBuffer(target, buffer)
+            self.buffers[key] = buffer
+
+    def enable(self, capability) -> None:
+        if self.changed('capability', self.capabilities.get(int(capability)), True):
+            glEnable(capability)
+            self.capabilities[int(capability)] = True
+
+    def disable(self, capability) -> None:
+        if self.changed('capability', self.capabilities.get(int(capability)), False):
+            glDisable(capability)
+            self.capabilities[int(capability)] = False
+
+    def blend_func(self, source, destination) -> None:
+        value = (int(source), int(destination))
+        if self.changed('blend func', self.blend, value):
+            glBlendFunc(source, destination)
+            self.blend = value
+
+    def depth_func(self, function) -> None:
+        if self.changed('depth func', self.depth, int(function)):
+            glDepthFunc(function)
+            self.depth = int(function)
+
+    def depth_mask(self, write: bool) -> None:
+        if self.changed('depth mask', self.depth_write, bool(write)):
+            glDepthMask(GL_TRUE if write else GL_FALSE)
+            self.depth_write = bool(write)
+
+    def uniform(self, setter, location: int, *args, track: bool = True) -> None:
+        # A glUniform* call for the program in use, e.g. uniform(glUniformMatrix4fv, location, 1, GL_FALSE, matrix).
+        # Programs keep their uniform values, so the value is remembered per program and location.
+        # Values that change on every draw, like model matrices, pass track=False and skip the comparison.
+        if location < 0:
+            return
+        key = (self.program, location)
+        if not (self.tracking and track and self.program is not None):
+            setter(location, *args)
+            self.uniforms.pop(key, None)
+            self.issued['uniform'] += 1
+            return
+
+        # Array arguments compare by content, the last one is the data
+        value = args[:-1] + (args[-1].tobytes(), ) if isinstance(args[-1], np.ndarray) else args
+        if self.uniforms.get(key) == value:
+            self.skipped['uniform'] += 1
+            return
+        setter(location, *args)
+        self.uniforms[key] = value
+        self.issued['uniform'] += 1
+
+    def stats(self) -> dict:
+        # The last finished frame's calls, in total and by kind
+        kinds = sorted(set(self.last_issued) | set(self.last_skipped))
+        return {
+            'issued': sum(self.last_issued.values()),
+            'skipped': sum(self.last_skipped.values()),
+            'kinds': {kind: (self.last_issued[kind], self.last_skipped[kind]) for kind in kinds},
+        }
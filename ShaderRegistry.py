@@ -0,0 +1,210 @@
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileShader
+from OpenGL.raw.GL.VERSION.GL_4_1 import glGetProgramBinary, glProgramBinary
+import ctypes
+import hashlib
+import os
+import pathlib
+import struct
+import tempfile
+
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+
+# Linked program binaries, one file per source hash, only valid for the driver that wrote them
+SHADER_CACHE_PATH = APP_PATH / '.shadercache'
+
+# File layout: magic, binary format enum, then the driver's binary
+_BINARY_HEADER = struct.Struct('<8sI')
+_BINARY_MAGIC = b'PGSHADER'
+
+def shader_source(filepath: str, defines: dict = None) -> str:
+    with open(filepath, 'r') as f:
+        source = f.read()
+    if not defines:
+        return source
+
+    # Variants get their #defines right after the #version line, which has to stay first
+    version, _, body = source.partition('\n')
+    lines = ''.join(f'#define {name} {value}\n' for name, value in sorted(defines.items()))
+    return f'{version}\n{lines}{body}'
+
+class ShaderProgram:
+
+    def __init__(self, program: int, key: str) -> None:
+        self.program = program
+        self.key = key
+
+        # Every active uniform and attribute once, name -> (location, GL type, array size)
+        self.uniforms = {}
+        for index in range(glGetProgramiv(program, GL_ACTIVE_UNIFORMS)):
+            name, size, kind = glGetActiveUniform(program, index)
+            name = name.decode()
+            location = glGetUniformLocation(program, name)
+            self.uniforms[name] = (location, int(kind), int(size))
+            if name.endswith('[0]'):
+                self.uniforms[name[:-3]] = self.uniforms[name]
+        self.attributes = {}
+        for index in range(glGetProgramiv(program, GL_ACTIVE_ATTRIBUTES)):
+            name, size, kind = glGetActiveAttrib(program, index)
+            name = name.decode()
+            self.attributes[name] = (glGetAttribLocation(program, name), int(kind), int(size))
+
+    def uniform(self, name: str) -> int:
+        # Location like glGetUniformLocation, -1 for names the linker dropped, without a driver round trip
+        entry = self.uniforms.get(name)
+        return entry[0] if entry else -1
+
+    def attribute(self, name: str) -> int:
+        entry = self.attributes.get(name)
+        return entry[0] if entry else -1
+
+    def use(self, state=None) -> None:
+        # Through a RenderState the call is skipped when the program is already in use
+        if state is not None:
+            state.use_program(self.program)
+            return
+        glUseProgram(self.program)
+
+def binary_format_count() -> int:
+    # Drivers without program binaries may report nothing or reject the query, both mean no formats
+    try:
+        count = glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS)
+    except (GLError, KeyError):
+        return 0
+    return int(count) if count is not None else 0
+
+class ShaderRegistry:
+
+    def __init__(self, cache_path: str = SHADER_CACHE_PATH, persist: bool = True) -> None:
+        # Binaries only persist if the driver offers at least one format, glProgramBinary is never called otherwise
+        self.cache_path = pathlib.Path(cache_path)
+        self.persist = persist and binary_format_count() > 0
+
+        # The driver is part of every key, a binary from another driver or version would be rejected anyway
+        self.driver = b'\n'.join(glGetString(name) or b'' for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+
+        self.programs = {}
+        self.compiled = 0
+        self.loaded = 0
+        self.reused = 0
+        self.rejected = 0
+
+    def program(self, vertex_path: str, fragment_path: str, defines: dict = None, vertex_format=None) -> ShaderProgram:
+        # A VertexFormat rewrites the vertex inputs to its encodings, each format is its own program
+        vertex_src = shader_source(vertex_path, defines)
+        if vertex_format is not None:
+            vertex_src = vertex_format.shader_source(vertex_src)
+        fragment_src = shader_source(fragment_path, defines)
+        return self.program_from_source(vertex_src, fragment_src)
+
+    def program_from_source(self, vertex_src: str, fragment_src: str) -> ShaderProgram:
+        # In process reuse first, then the binary on disk, then a full compile and link
+        digest = hashlib.sha256(self.driver)
+        for source in (vertex_src, fragment_src):
+            digest.update(b'\0')
+            digest.update(source.encode())
+        key = digest.hexdigest()
+
+        shader = self.programs.get(key)
+        if shader is not None:
+            self.reused += 1
+            return shader
+
+        program = self.load_binary(key) if self.persist else None
+        if program is None:
+            program = self.compile(vertex_src, fragment_src)
+            self.compiled += 1
+            if self.persist:
+                self.save_binary(key, program)
+        else:
+            self.loaded += 1
+
+        shader = ShaderProgram(program, key)
+        self.programs[key] = shader
+        return shader
+
+    def compile(self, vertex_src: str, fragment_src: str) -> int:
+        # Linked by hand rather than with compileProgram, the binary hint has to be set before linking
+        shaders = [compileShader(vertex_src, GL_VERTEX_SHADER), compileShader(fragment_src, GL_FRAGMENT_SHADER)]
+        program = glCreateProgram()
+        for shader in shaders:
+            glAttachShader(program, shader)
+        if self.persist:
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glLinkProgram(program)
+        for shader in shaders:
+            glDetachShader(program, shader)
+            glDeleteShader(shader)
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            log = glGetProgramInfoLog(program)
+            glDeleteProgram(program)
+            raise RuntimeError(f'shader link failed: {log.decode(errors="replace")}')
+        return program
+
+    def binary_path(self, key: str) -> pathlib.Path:
+        return self.cache_path / f'{key}.bin'
+
+    def load_binary(self, key: str):
+        try:
+            data = self.binary_path(key).read_bytes()
+            magic, binary_format = _BINARY_HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return None
+        if magic != _BINARY_MAGIC:
+            return None
+
+        # Drivers may refuse their own old binaries after an update, that only costs the compile
+        binary = data[_BINARY_HEADER.size:]
+        program = glCreateProgram()
+        try:
+            glProgramBinary(program, binary_format, binary, len(binary))
+        except GLError:
+            # A format this driver no longer lists is an invalid enum rather than a failed link
+            glDeleteProgram(program)
+            self.rejected += 1
+            return None
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            glDeleteProgram(program)
+            self.rejected += 1
+            return None
+        return program
+
+    def save_binary(self, key: str, program: int) -> None:
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if length == 0:
+            return
+        binary = (ctypes.c_ubyte * length)()
+        written = GLsizei()
+        binary_format = GLenum()
+        glGetProgramBinary(program, length, ctypes.byref(written), ctypes.byref(binary_format), binary)
+
+        # Write to a temporary file and rename, like the asset caches, so a crash never leaves half a binary
+        try:
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=self.cache_path, prefix='.', suffix='.tmp')
+            try:
+                with os.fdopen(handle, 'wb') as file:
+                    file.write(_BINARY_HEADER.pack(_BINARY_MAGIC, binary_format.value))
+                    file.write(bytes(binary)[:written.value])
+                os.replace(temporary, self.binary_path(key))
+            except BaseException:
+                # A failed write or rename leaves no .tmp file behind in the cache directory
+                os.unlink(temporary)
+                raise
+        except OSError:
+            # Read-only installs just compile every time
+            pass
+
+    def stats(self) -> dict:
+        return {
+            'programs': len(self.programs),
+            'compiled': self.compiled,
+            'loaded': self.loaded,
+            'reused': self.reused,
+            'rejected': self.rejected,
+        }
+
+    def delete(self) -> None:
+        for shader in self.programs.values():
+            glDeleteProgram(shader.program)
+        self.programs.clear()
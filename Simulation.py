@@ -0,0 +1,136 @@
+import hashlib
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Simulation steps per second, every step advances the state by exactly 1 / rate seconds
+SIMULATION_RATE = 60
+
+# Steps run back to back to catch up after a stall, further behind than this the backlog is dropped
+MAX_CATCH_UP_STEPS = 5
+
+def state_digest(state) -> str:
+    # SHA-256 of a snapshot's arrays, equal digests mean bit-identical states
+    digest = hashlib.sha256()
+    for array in state if isinstance(state, (tuple, list)) else (state, ):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+class RateMeter:
+
+    def __init__(self, window: int = 120) -> None:
+        # Times of the last `window` ticks, the rate is taken over them
+        self.stamps = deque(maxlen=window)
+
+    def tick(self) -> None:
+        self.stamps.append(time.perf_counter())
+
+    def rate(self) -> float:
+        if len(self.stamps) < 2 or self.stamps[-1] == self.stamps[0]:
+            return 0.0
+        return (len(self.stamps) - 1) / (self.stamps[-1] - self.stamps[0])
+
+class Snapshot:
+
+    def __init__(self, step: int, time: float, state) -> None:
+        # State after `step` steps, which is the state at `time` seconds on the simulation clock.
+        # Published snapshots are never modified, the render thread reads them without copying.
+        self.step = step
+        self.time = time
+        self.state = state
+
+class FixedStepSimulation:
+
+    def __init__(self, step, snapshot, rate: int = SIMULATION_RATE, max_catch_up: int = MAX_CATCH_UP_STEPS) -> None:
+        # step(time, dt) advances the state by dt, snapshot() returns a copy of the state.
+        # Both only ever run on the simulation thread once it has started.
+        self.step_function = step
+        self.snapshot_function = snapshot
+        self.rate = rate
+        self.dt = 1 / rate
+        self.max_catch_up = max_catch_up
+        self.steps = 0
+
+        # Double buffered: the last two snapshots, swapped as a pair under the lock
+        self.lock = threading.Lock()
+        first = Snapshot(0, 0.0, snapshot())
+        self.previous = first
+        self.latest = first
+
+        # Wall clock time of simulation time 0, moved forward when a backlog is dropped
+        self.origin = None
+
+        # Instrumentation: step rate, recent step durations, steps that ran late and steps dropped
+        self.meter = RateMeter(2 * rate)
+        self.step_times = deque(maxlen=rate)
+        self.late = 0
+        self.dropped = 0
+
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.origin = time.perf_counter() - self.steps * self.dt
+        self.thread = threading.Thread(target=self.run, name='simulation', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def run(self) -> None:
+        # Step n + 1 is computed once the wall clock reaches its time, so the latest snapshot is never in the future
+        while not self.stopping.is_set():
+            wait = self.origin + (self.steps + 1) * self.dt - time.perf_counter()
+            if wait > 0:
+                self.stopping.wait(wait)
+                continue
+
+            behind = int(-wait / self.dt)
+            if behind > self.max_catch_up:
+                # Too far behind to catch up without spiralling, skip the backlog and carry on from now
+                self.origin += behind * self.dt
+                self.dropped += behind
+            elif behind:
+                self.late += 1
+            self.advance()
+
+    def advance(self) -> Snapshot:
+        # One step on the calling thread, then publish it. Replays call this directly without the thread.
+        start = time.perf_counter()
+        self.step_function(self.steps * self.dt, self.dt)
+        self.steps += 1
+        snapshot = Snapshot(self.steps, self.steps * self.dt, self.snapshot_function())
+        self.step_times.append(time.perf_counter() - start)
+        self.meter.tick()
+
+        with self.lock:
+            self.previous, self.latest = self.latest, snapshot
+        return snapshot
+
+    def sample(self, now: float = None) -> tuple[Snapshot, Snapshot, float]:
+        # Called by the render thread: the two snapshots to blend and how far from the first to the second.
+        # Frames show the simulation one step in the past, so there is always a later snapshot to blend towards.
+        with self.lock:
+            previous, latest = self.previous, self.latest
+        if self.origin is None or previous is latest:
+            return previous, latest, 1.0
+        now = time.perf_counter() if now is None else now
+        alpha = (now - self.origin - latest.time) / self.dt
+        return previous, latest, min(max(alpha, 0.0), 1.0)
+
+    def stats(self) -> dict:
+        step_times = list(self.step_times)
+        return {
+            'steps': self.steps,
+            'target_hz': self.rate,
+            'rate_hz': self.meter.rate(),
+            'step_mean_ms': 1000 * sum(step_times) / len(step_times) if step_times else 0.0,
+            'step_max_ms': 1000 * max(step_times, default=0.0),
+            'late': self.late,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,111 @@
+from OpenGL.GL import *
+import numpy as np
+
+from AssetCache import load_texture_cached
+from ImageLoader import build_mipmaps
+
+# Side of every layer, images larger than a layer are packed from the first mip level that fits
+TEXTURE_ARRAY_LAYER_SIZE = 2048
+
+# Edge pixels repeated around each packed image, so filtering doesn't pick up its neighbours.
+# Mip levels stop where the padding runs out, coarser ones would mix neighbouring images.
+TEXTURE_ARRAY_PADDING = 8
+
+class TextureRegion:
+
+    def __init__(self, layer: int, rect: tuple[float, float, float, float]) -> None:
+        # Where one source image ended up: its layer, and u, v offset plus u, v size inside that layer
+        self.layer = layer
+        self.rect = rect
+
+    def instance_data(self) -> np.ndarray:
+        # The per-instance attribute values the array shaders read, rect then layer
+        return np.array([*self.rect, self.layer], dtype=np.float32)
+
+class TextureArray:
+
+    def __init__(
+        self,
+        filepaths: list[str],
+        layer_size: int = TEXTURE_ARRAY_LAYER_SIZE,
+        padding: int = TEXTURE_ARRAY_PADDING,
+    ) -> None:
+        self.layer_size = layer_size
+        self.padding = padding
+        self.max_level = padding.bit_length() - 1
+
+        # Largest mip level of every image that fits a layer with its padding, from the baked caches
+        images = []
+        for filepath in filepaths:
+            _, levels = load_texture_cached(filepath)
+            image = next((level for level in levels if max(level.shape[:2]) + 2 * padding <= layer_size), levels[-1])
+            images.append(image)
+
+        # Shelf packing, tallest first: fill a row left to right, start a new row below it, then a new layer
+        layers = []
+        placements = [None] * len(images)
+        align = 1 << self.max_level
+        for index in sorted(range(len(images)), key=lambda index: -images[index].shape[0]):
+            height, width = images[index].shape[:2]
+            box_width = -(-(width + 2 * padding) // align) * align
+            box_height = -(-(height + 2 * padding) // align) * align
+            if not layers or layers[-1]['x'] + box_width > layer_size:
+                if layers:
+                    layers[-1].update(x=0, y=layers[-1]['y'] + layers[-1]['row'], row=0)
+                if not layers or layers[-1]['y'] + box_height > layer_size:
+                    layers.append({'x': 0, 'y': 0, 'row': 0})
+            shelf = layers[-1]
+            placements[index] = (len(layers) - 1, shelf['x'], shelf['y'])
+            shelf['x'] += box_width
+            shelf['row'] = max(shelf['row'], box_height)
+
+        # Compose the layers on the CPU, each image surrounded by copies of its edge pixels
+        pixels = np.zeros((len(layers), layer_size, layer_size, 4), dtype=np.uint8)
+        self.regions = []
+        for image, (layer, x, y) in zip(images, placements):
+            height, width = image.shape[:2]
+            padded = np.pad(image, ((padding, padding), (padding, padding), (0, 0)), mode='edge')
+            pixels[layer, y:y + height + 2 * padding, x:x + width + 2 * padding] = padded
+            self.regions.append(TextureRegion(
+                layer, ((x + padding) / layer_size, (y + padding) / layer_size, width / layer_size, height / layer_size)
+            ))
+        self.region_of = dict(zip(filepaths, self.regions))
+        self.instance_table = np.stack([region.instance_data() for region in self.regions])
+        self.layer_count = len(layers)
+
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, self.texture)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAX_LEVEL, self.max_level)
+
+        # Every layer's mip chain, level by level, one glTexImage3D per level for all layers at once
+        chains = [build_mipmaps(layer)[:self.max_level + 1] for layer in pixels]
+        self.nbytes = 0
+        for level in range(self.max_level + 1):
+            data = np.ascontiguousarray(np.stack([chain[level] for chain in chains]))
+            glTexImage3D(
+                GL_TEXTURE_2D_ARRAY, level, GL_RGBA8, data.shape[2], data.shape[1], len(layers), 0,
+                GL_RGBA, GL_UNSIGNED_BYTE, data
+            )
+            self.nbytes += data.nbytes
+
+    def region(self, filepath: str) -> TextureRegion:
+        return self.region_of[filepath]
+
+    def instance_data(self, regions: np.ndarray) -> np.ndarray:
+        # (n, 5) per-instance attributes, from the index into filepaths each instance uses
+        return self.instance_table[regions]
+
+    def use(self, state=None) -> None:
+        # One bind covers every packed image
+        if state is not None:
+            state.bind_texture(0, GL_TEXTURE_2D_ARRAY, self.texture)
+            return
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, self.texture)
+
+    def delete(self) -> None:
+        glDeleteTextures(1, (self.texture, ))
@@ -0,0 +1,115 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from AssetCache import load_texture_cached
+from ImageLoader import decode_texture
+
+# Placeholder pixels shown until a texture has arrived, a 2x2 grey checker
+PLACEHOLDER_PIXELS = np.array([
+    [[96, 96, 96, 255], [160, 160, 160, 255]],
+    [[160, 160, 160, 255], [96, 96, 96, 255]],
+], dtype=np.uint8)
+
+def load_texture(filepath: str, cache: bool = True) -> list[np.ndarray]:
+    # Worker side of a request: the baked mip chain memory-mapped from its cache, or a full decode
+    if cache:
+        return load_texture_cached(filepath)[1]
+    return decode_texture(filepath)
+
+class TextureLoader:
+
+    def __init__(self, workers: int = 2, uploads_per_frame: int = 1, buffer_count: int = 2) -> None:
+        self.uploads_per_frame = uploads_per_frame
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='texture-decode')
+
+        # Requested materials with their decode futures, in request order
+        self.pending = deque()
+
+        # Called with each material once its texture is on the GPU
+        self.listeners = []
+
+        # Whether the last update() bound a texture, leaving the active unit's binding changed behind a RenderState
+        self.bound = False
+
+        # Ring of pixel unpack buffers, glTexImage2D reads from one while the next is being filled
+        self.buffers = np.atleast_1d(glGenBuffers(buffer_count)) if buffer_count else []
+        self.next_buffer = 0
+
+        self.placeholder = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.placeholder)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, 2, 2, 0, GL_RGBA, GL_UNSIGNED_BYTE, PLACEHOLDER_PIXELS)
+
+    def request(self, material, filepath: str, cache: bool = True) -> None:
+        self.pending.append((material, self.pool.submit(load_texture, filepath, cache)))
+
+    def cancel(self, material) -> None:
+        for entry in self.pending:
+            if entry[0] is material:
+                entry[1].cancel()
+                self.pending.remove(entry)
+                return
+
+    def update(self, limit: int = None) -> int:
+        # Called once per frame on the GL thread, uploads at most `limit` decoded images and returns how many
+        limit = self.uploads_per_frame if limit is None else limit
+        self.bound = False
+        uploaded = 0
+        for entry in list(self.pending):
+            if uploaded == limit:
+                break
+            material, future = entry
+            if not future.done():
+                continue
+            self.pending.remove(entry)
+            self.upload(material, future.result())
+            uploaded += 1
+        return uploaded
+
+    def upload(self, material, levels: list[np.ndarray]) -> None:
+        height, width = levels[0].shape[:2]
+        nbytes = sum(level.nbytes for level in levels)
+
+        # Orphan and refill the next buffer in the ring with every level back to back
+        buffer = int(self.buffers[self.next_buffer])
+        self.next_buffer = (self.next_buffer + 1) % len(self.buffers)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, buffer)
+        glBufferData(GL_PIXEL_UNPACK_BUFFER, nbytes, None, GL_STREAM_DRAW)
+        offset = 0
+        for level in levels:
+            glBufferSubData(GL_PIXEL_UNPACK_BUFFER, offset, level.nbytes, level)
+            offset += level.nbytes
+
+        # With the buffer bound, glTexImage2D's data argument is an offset into it instead of client memory
+        glBindTexture(GL_TEXTURE_2D, material.texture)
+        self.bound = True
+        offset = 0
+        for index, level in enumerate(levels):
+            level_height, level_width = level.shape[:2]
+            glTexImage2D(
+                GL_TEXTURE_2D, index, GL_RGBA, level_width, level_height, 0, GL_RGBA, GL_UNSIGNED_BYTE,
+                ctypes.c_void_p(offset)
+            )
+            offset += level.nbytes
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        material.loaded(width, height)
+        for listener in self.listeners:
+            listener(material)
+
+    def wait(self) -> None:
+        # Block until everything requested so far is on the GPU
+        while self.pending:
+            self.pending[0][1].result()
+            self.update(len(self.pending))
+
+    def delete(self) -> None:
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.pending.clear()
+        if len(self.buffers):
+            glDeleteBuffers(len(self.buffers), self.buffers)
+        glDeleteTextures(1, (self.placeholder, ))
@@ -0,0 +1,174 @@
+from OpenGL.GL import *
+import numpy as np
+import math
+
+from TextureLoader import TextureLoader
+
+# Pixel bytes uploaded per frame over all streaming textures, 4 MB is a 1024x1024 RGBA level
+DEFAULT_STREAM_BUDGET = 4 << 20
+
+def projected_size(radius: float, distance: float, fovy: float, viewport_height: int) -> float:
+    # On-screen height in pixels of a bounding sphere through a perspective projection with this vertical fov,
+    # for one distance or an array of them
+    if np.ndim(distance):
+        distance = np.asarray(distance, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            size = radius / (distance * math.tan(math.radians(fovy) / 2)) * viewport_height
+        return np.where(distance <= radius, math.inf, size)
+    if distance <= radius:
+        return math.inf
+    return radius / (distance * math.tan(math.radians(fovy) / 2)) * viewport_height
+
+def level_for_size(texture_size: int, screen_size: float) -> int:
+    # Finest mip level still needed for about one texel per pixel, 0 is full resolution
+    if screen_size >= texture_size:
+        return 0
+    if screen_size <= 1:
+        return max(0, texture_size.bit_length() - 1)
+    return int(math.log2(texture_size / screen_size))
+
+class TextureStream:
+
+    def __init__(self, material, levels: list) -> None:
+        self.material = material
+        self.levels = levels
+
+        # Finest level on the GPU, len(levels) while none is, and how many rows of the next finer one are uploaded
+        self.base_level = len(levels)
+        self.rows_uploaded = 0
+        self.wanted_level = 0
+
+    def resident_bytes(self) -> int:
+        return sum(level.nbytes for level in self.levels[self.base_level:])
+
+class TextureStreamer(TextureLoader):
+
+    def __init__(self, workers: int = 2, frame_budget: int = DEFAULT_STREAM_BUDGET, starts_per_frame: int = 1) -> None:
+        # Workers only map the baked mip chains, the pixels are copied out of them a budget at a time.
+        # Each new texture costs a driver allocation whatever its size, so only a few start streaming per frame.
+        super().__init__(workers, uploads_per_frame=starts_per_frame, buffer_count=0)
+        self.frame_budget = frame_budget
+        self.streams = {}
+        self.screen_sizes = {}
+        self.uploaded_bytes = 0
+
+    def request(self, material, filepath: str, cache: bool = True) -> None:
+        # Streaming reads levels straight from the baked cache, so it always uses one
+        super().request(material, filepath, True)
+
+    def cancel(self, material) -> None:
+        super().cancel(material)
+        self.streams.pop(material, None)
+        self.screen_sizes.pop(material, None)
+
+    def set_screen_size(self, material, pixels: float) -> None:
+        # Projected size of what the texture is drawn on, picks the finest level worth keeping resident
+        self.screen_sizes[material] = pixels
+
+    def upload(self, material, levels: list) -> None:
+        # Called by TextureLoader.update once a chain is mapped, nothing is copied yet
+        self.streams[material] = TextureStream(material, levels)
+        glBindTexture(GL_TEXTURE_2D, material.texture)
+        self.bound = True
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+
+    def update(self, budget: int = None) -> int:
+        # Called once per frame on the GL thread, returns the pixel bytes uploaded
+        super().update()
+        budget = self.frame_budget if budget is None else budget
+
+        for stream in self.streams.values():
+            levels = stream.levels
+            pixels = self.screen_sizes.get(stream.material, math.inf)
+            stream.wanted_level = min(level_for_size(max(levels[0].shape[:2]), pixels), len(levels) - 1)
+
+            # Levels two steps finer than needed are freed, one step is kept so sizes near a boundary don't thrash
+            if stream.base_level < stream.wanted_level - 1:
+                self.drop_levels(stream)
+
+        uploaded = 0
+        while True:
+            # Furthest from its wanted level first, so every texture gets something coarse before any gets detail
+            waiting = [stream for stream in self.streams.values() if stream.base_level > stream.wanted_level]
+            if not waiting:
+                break
+            stream = max(waiting, key=lambda stream: stream.base_level - stream.wanted_level)
+            nbytes = self.upload_rows(stream, budget - uploaded, force=uploaded == 0)
+            if nbytes == 0:
+                break
+            uploaded += nbytes
+
+        self.uploaded_bytes = uploaded
+        return uploaded
+
+    def upload_rows(self, stream: TextureStream, budget: int, force: bool = False) -> int:
+        # As many rows of the next finer level as fit the budget, at least one when forced
+        index = stream.base_level - 1
+        level = stream.levels[index]
+        height, width = level.shape[:2]
+        row_bytes = width * 4
+        rows = min(height - stream.rows_uploaded, budget // row_bytes)
+        if rows <= 0:
+            if not force:
+                return 0
+            rows = 1
+
+        # Storage for the whole level first, then rows into it, the level isn't sampled until it is complete
+        glBindTexture(GL_TEXTURE_2D, stream.material.texture)
+        self.bound = True
+        if stream.rows_uploaded == 0:
+            glTexImage2D(GL_TEXTURE_2D, index, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        first = stream.rows_uploaded
+        glTexSubImage2D(
+            GL_TEXTURE_2D, index, 0, first, width, rows, GL_RGBA, GL_UNSIGNED_BYTE, level[first:first + rows]
+        )
+        stream.rows_uploaded += rows
+
+        if stream.rows_uploaded == height:
+            stream.rows_uploaded = 0
+            self.set_base_level(stream, index)
+        return rows * row_bytes
+
+    def drop_levels(self, stream: TextureStream) -> None:
+        # Redefining a level as 0x0 frees its memory, sampling starts at the new base level anyway
+        glBindTexture(GL_TEXTURE_2D, stream.material.texture)
+        self.bound = True
+        first = stream.base_level - 1 if stream.rows_uploaded else stream.base_level
+        for index in range(first, stream.wanted_level):
+            glTexImage2D(GL_TEXTURE_2D, index, GL_RGBA, 0, 0, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        stream.rows_uploaded = 0
+        self.set_base_level(stream, stream.wanted_level)
+
+    def set_base_level(self, stream: TextureStream, index: int) -> None:
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_BASE_LEVEL, index)
+        stream.base_level = index
+
+        # Usable from the coarsest level on, its memory use follows the resident levels
+        material = stream.material
+        if not material.ready:
+            height, width = stream.levels[0].shape[:2]
+            material.loaded(width, height)
+        material.nbytes = stream.resident_bytes()
+        for listener in self.listeners:
+            listener(material)
+
+    def resident_bytes(self, material=None) -> int:
+        # GPU bytes of one streamed texture's resident levels, or of all of them
+        if material is not None:
+            stream = self.streams.get(material)
+            return stream.resident_bytes() if stream else 0
+        return sum(stream.resident_bytes() for stream in self.streams.values())
+
+    def stats(self) -> dict:
+        return {
+            'textures': len(self.streams),
+            'pending': len(self.pending),
+            'complete': sum(stream.base_level == stream.wanted_level for stream in self.streams.values()),
+            'resident_bytes': self.resident_bytes(),
+            'uploaded_bytes': self.uploaded_bytes,
+        }
+
+    def delete(self) -> None:
+        super().delete()
+        self.streams.clear()
+        self.screen_sizes.clear()
@@ -0,0 +1,144 @@
+import numpy as np
+
+class TransformStore:
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.count = 0
+        self.allocate(max(capacity, 1))
+
+    def allocate(self, capacity: int) -> None:
+        # Structure of arrays, one row per object, everything float32 like the shader inputs
+        old_count = self.count
+        positions = np.zeros((capacity, 3), dtype=np.float32)
+        eulers = np.zeros((capacity, 3), dtype=np.float32)
+        matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+        dirty = np.zeros(capacity, dtype=bool)
+        if old_count:
+            positions[:old_count] = self.positions[:old_count]
+            eulers[:old_count] = self.eulers[:old_count]
+            matrices[:old_count] = self.matrices[:old_count]
+            dirty[:old_count] = self.dirty[:old_count]
+
+        self.capacity = capacity
+        self.positions = positions
+        self.eulers = eulers
+        self.matrices = matrices
+        self.dirty = dirty
+
+        # Scratch space so update() never allocates: sines, cosines, products and a mask
+        self.sines = np.zeros((capacity, 3), dtype=np.float32)
+        self.cosines = np.zeros((capacity, 3), dtype=np.float32)
+        self.products = np.zeros((2, capacity), dtype=np.float32)
+        self.mask = np.zeros(capacity, dtype=bool)
+
+        # and for updates of only some rows: the moved rows' inputs and new matrices
+        self.moved_positions = np.zeros((capacity, 3), dtype=np.float32)
+        self.moved_eulers = np.zeros((capacity, 3), dtype=np.float32)
+        self.moved_matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+
+    def add(self, position, eulers) -> int:
+        return self.extend([position], [eulers]).start
+
+    def extend(self, positions, eulers) -> range:
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        eulers = np.asarray(eulers, dtype=np.float32).reshape(-1, 3)
+        start, stop = self.count, self.count + len(positions)
+        if stop > self.capacity:
+            self.allocate(max(stop, 2 * self.capacity))
+
+        self.positions[start:stop] = positions
+        self.eulers[start:stop] = eulers
+        self.dirty[start:stop] = True
+        self.count = stop
+        return range(start, stop)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def set_position(self, index, position) -> None:
+        self.positions[index] = position
+        self.dirty[index] = True
+
+    def set_eulers(self, index, eulers) -> None:
+        self.eulers[index] = eulers
+        self.dirty[index] = True
+
+    def rotate(self, axis: int, degrees: float, index=slice(None)) -> None:
+        # Spin objects (all by default) around one euler axis, wrapping past 360 like Cube did
+        angles = self.eulers[:self.count, axis]
+        mask = self.mask[:self.count]
+        if isinstance(index, slice) and index == slice(None):
+            np.add(angles, degrees, out=angles)
+            np.greater(angles, 360, out=mask)
+            np.subtract(angles, 360, out=angles, where=mask)
+            self.dirty[:self.count] = True
+        else:
+            angles[index] += degrees
+            angles[index] -= 360 * (angles[index] > 360)
+            self.dirty[index] = True
+
+    def update(self) -> int:
+        # Rebuild the model matrices of moved objects, returns how many were rebuilt
+        dirty = self.dirty[:self.count]
+        if dirty.all():
+            self.compose(self.positions[:self.count], self.eulers[:self.count], self.matrices[:self.count])
+            updated = self.count
+        else:
+            # Gather the moved rows into scratch, compose them there and scatter the matrices back once.
+            # The row indices are the one allocation left, 8 bytes per moved object. take() buffers its
+            # output unless the indices are clipped, which these, coming from the dirty flags, never need.
+            moved = np.flatnonzero(dirty)
+            updated = len(moved)
+            if updated == 0:
+                return 0
+            positions, eulers = self.moved_positions[:updated], self.moved_eulers[:updated]
+            matrices = self.moved_matrices[:updated]
+            np.take(self.positions, moved, axis=0, out=positions, mode='clip')
+            np.take(self.eulers, moved, axis=0, out=eulers, mode='clip')
+            self.compose(positions, eulers, matrices)
+            self.matrices[moved] = matrices
+
+        dirty[:] = False
+        return updated
+
+    def compose(self, positions: np.ndarray, eulers: np.ndarray, out: np.ndarray) -> None:
+        # Same matrix as Cube.model_transform(), identity @ rotation @ translation, but for every row at once.
+        # Row vector convention, so the rotation fills the top left 3x3 and the translation the bottom row.
+        n = len(positions)
+        sines, cosines = self.sines[:n], self.cosines[:n]
+        np.radians(eulers, out=sines)
+        np.cos(sines, out=cosines)
+        np.sin(sines, out=sines)
+
+        # pyrr's euler layout is (roll, pitch, yaw)
+        sR, sP, sY = sines.T
+        cR, cP, cY = cosines.T
+        a, b = self.products[:, :n]
+
+        np.multiply(cY, cP, out=out[:, 0, 0])
+        np.multiply(cY, sP, out=a)
+        np.multiply(sY, sR, out=b)
+        np.multiply(a, cR, out=out[:, 0, 1])
+        np.subtract(b, out[:, 0, 1], out=out[:, 0, 1])
+        np.multiply(sY, cR, out=b)
+        np.multiply(a, sR, out=out[:, 0, 2])
+        np.add(out[:, 0, 2], b, out=out[:, 0, 2])
+
+        out[:, 1, 0] = sP
+        np.multiply(cP, cR, out=out[:, 1, 1])
+        np.multiply(cP, sR, out=out[:, 1, 2])
+        np.negative(out[:, 1, 2], out=out[:, 1, 2])
+
+        np.multiply(sY, cP, out=out[:, 2, 0])
+        np.negative(out[:, 2, 0], out=out[:, 2, 0])
+        np.multiply(sY, sP, out=a)
+        np.multiply(cY, sR, out=b)
+        np.multiply(a, cR, out=out[:, 2, 1])
+        np.add(out[:, 2, 1], b, out=out[:, 2, 1])
+        np.multiply(cY, cR, out=b)
+        np.multiply(a, sR, out=out[:, 2, 2])
+        np.subtract(b, out[:, 2, 2], out=out[:, 2, 2])
+
+        out[:, :3, 3] = 0
+        out[:, 3, :3] = positions
+        out[:, 3, 3] = 1
@@ -0,0 +1,115 @@
+import numpy as np
+
+# Tom Forsyth's "Linear-Speed Vertex Cache Optimisation" scoring constants
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+def average_cache_miss_ratio(indices: np.ndarray, cache_size: int = 16) -> float:
+    # Transformed vertices per triangle for a FIFO post-transform cache, 3.0 means no reuse at all
+    if len(indices) == 0:
+        return 0.0
+
+    cache = [-1] * cache_size
+    cached = set()
+    head = 0
+    misses = 0
+
+    for index in indices.tolist():
+        if index in cached:
+            continue
+        misses += 1
+        cached.discard(cache[head])
+        cache[head] = index
+        cached.add(index)
+        head = (head + 1) % cache_size
+
+    return misses / (len(indices) // 3)
+
+def optimize_vertex_cache(indices: np.ndarray, vertex_count: int, cache_size: int = 32) -> np.ndarray:
+    # Reorder triangles (not vertices) so that consecutive triangles share recently used vertices
+    triangles = indices.reshape(-1, 3).tolist()
+    triangle_count = len(triangles)
+    if triangle_count == 0:
+        return indices.copy()
+
+    # Triangles still to be drawn around each vertex
+    adjacency = [[] for _ in range(vertex_count)]
+    for triangle, corners in enumerate(triangles):
+        for vertex in corners:
+            adjacency[vertex].append(triangle)
+
+    valence_scores = [0.0] + [VALENCE_BOOST_SCALE * n ** -VALENCE_BOOST_POWER for n in range(1, 64)]
+    position_scores = [
+        LAST_TRIANGLE_SCORE if position < 3 else
+        (1.0 - (position - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER
+        for position in range(cache_size)
+    ]
+
+    def vertex_score(vertex: int, position: int) -> float:
+        remaining = len(adjacency[vertex])
+        if remaining == 0:
+            return -1.0
+        score = position_scores[position] if 0 <= position < cache_size else 0.0
+        return score + valence_scores[min(remaining, 63)]
+
+    vertex_scores = [vertex_score(vertex, -1) for vertex in range(vertex_count)]
+    triangle_scores = [sum(vertex_scores[vertex] for vertex in corners) for corners in triangles]
+    emitted = [False] * triangle_count
+
+    order = []
+    cache = []
+    best = max(range(triangle_count), key=triangle_scores.__getitem__)
+    scan = 0
+
+    while len(order) < triangle_count:
+        # Emit the best triangle and retire it from its vertices' adjacency lists
+        emitted[best] = True
+        order.append(best)
+        corners = triangles[best]
+        for vertex in corners:
+            adjacency[vertex].remove(best)
+
+        # Move its vertices to the front of the LRU cache, keeping a few extra slots to score evictions
+        cache = corners + [vertex for vertex in cache if vertex not in corners]
+        evicted = cache[cache_size:]
+        del cache[cache_size:]
+
+        touched = set()
+        for position, vertex in enumerate(cache):
+            vertex_scores[vertex] = vertex_score(vertex, position)
+            touched.update(adjacency[vertex])
+        for vertex in evicted:
+            vertex_scores[vertex] = vertex_score(vertex, -1)
+            touched.update(adjacency[vertex])
+
+        # The next triangle is usually one that touches the cache, otherwise fall back to a scan
+        best = -1
+        best_score = -1.0
+        for triangle in touched:
+            score = sum(vertex_scores[vertex] for vertex in triangles[triangle])
+            triangle_scores[triangle] = score
+            if score > best_score:
+                best, best_score = triangle, score
+
+        if best < 0:
+            while scan < triangle_count and emitted[scan]:
+                scan += 1
+            if scan == triangle_count:
+                break
+            best = max(
+                (triangle for triangle in range(scan, triangle_count) if not emitted[triangle]),
+                key=triangle_scores.__getitem__,
+            )
+
+    return indices.reshape(-1, 3)[order].ravel()
+
+def optimize_submeshes(indices: np.ndarray, vertex_count: int, submeshes: list, cache_size: int = 32) -> np.ndarray:
+    # Reorder each (name, first, count) submesh's triangles on their own, so every material keeps its index range
+    if len(submeshes) <= 1:
+        return optimize_vertex_cache(indices, vertex_count, cache_size)
+    return np.concatenate([
+        optimize_vertex_cache(np.asarray(indices[first:first + count]), vertex_count, cache_size)
+        for _, first, count in submeshes
+    ])
@@ -0,0 +1,227 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+import re
+
+# Attribute locations every mesh shader agrees on, 2 to 7 are InstanceBatch's per-instance attributes
+POSITION_LOCATION = 0
+TEXCOORD_LOCATION = 1
+NORMAL_LOCATION = 8
+
+# Columns of each attribute in the loaded (x, y, z, s, t, nx, ny, nz) records, its shader input and location
+VERTEX_ATTRIBUTES = {
+    'position': (slice(0, 3), 'vertexPos', POSITION_LOCATION),
+    'texcoord': (slice(3, 5), 'vertexTexCoord', TEXCOORD_LOCATION),
+    'normal': (slice(5, 8), 'vertexNormal', NORMAL_LOCATION),
+}
+
+# Storage type, GL type and normalized flag of each encoding:
+# float16 converts back exactly as stored, snorm16 and unorm16 are quantized against the mesh's own range
+# and scaled back in the shader, oct32 is a unit normal folded onto an octahedron in two int16
+ENCODINGS = {
+    'float32': (np.float32, GL_FLOAT, GL_FALSE),
+    'float16': (np.float16, GL_HALF_FLOAT, GL_FALSE),
+    'snorm16': (np.int16, GL_SHORT, GL_TRUE),
+    'unorm16': (np.uint16, GL_UNSIGNED_SHORT, GL_TRUE),
+    'oct32': (np.int16, GL_SHORT, GL_TRUE),
+}
+
+# Encodings each attribute may use
+ATTRIBUTE_ENCODINGS = {
+    'position': ('float32', 'float16', 'snorm16'),
+    'texcoord': ('float32', 'float16', 'unorm16'),
+    'normal': ('float32', 'float16', 'oct32'),
+}
+
+# Position, texcoord and normal encodings of the named formats, float32 is the 32 byte layout meshes always had
+VERTEX_FORMATS = {
+    'float32': ('float32', 'float32', 'float32'),
+    'float16': ('float16', 'float16', 'oct32'),
+    'quantized': ('snorm16', 'unorm16', 'oct32'),
+}
+
+# GLSL for the octahedral decode, the inverse of octahedral_encode
+_OCTAHEDRAL_DECODE = '''vec3 decodeOctahedral(vec2 e) {
+    vec3 n = vec3(e, 1.0 - abs(e.x) - abs(e.y));
+    float t = max(-n.z, 0.0);
+    n.xy += vec2(n.x >= 0.0 ? -t : t, n.y >= 0.0 ? -t : t);
+    return normalize(n);
+}'''
+
+def octahedral_encode(normals: np.ndarray) -> np.ndarray:
+    # Unit vectors to points in [-1, 1]^2: project onto the octahedron, fold the lower half over the upper
+    normals = normals / np.maximum(np.abs(normals).sum(axis=1, keepdims=True), 1e-12)
+    encoded = normals[:, :2].copy()
+    lower = normals[:, 2] < 0
+    sign = np.where(encoded[lower] >= 0, 1.0, -1.0)
+    encoded[lower] = (1 - np.abs(encoded[lower][:, ::-1])) * sign
+    return encoded
+
+def octahedral_decode(encoded: np.ndarray) -> np.ndarray:
+    # Same steps as decodeOctahedral in the shader
+    normals = np.column_stack([encoded, 1 - np.abs(encoded).sum(axis=1)])
+    fold = np.maximum(-normals[:, 2], 0)[:, None]
+    normals[:, :2] += np.where(normals[:, :2] >= 0, -fold, fold)
+    return normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+def shader_inputs(*paths: str) -> set:
+    # Names of the vertex attributes declared by these shader files
+    names = set()
+    for path in paths:
+        with open(path, 'r') as f:
+            source = f.read()
+        names.update(re.findall(r'^\s*layout\s*\(\s*location\s*=\s*\d+\s*\)\s*in\s+\w+\s+(\w+)\s*;', source, re.M))
+    return names
+
+class VertexAttribute:
+
+    def __init__(self, name: str, encoding: str, offset: int) -> None:
+        self.name = name
+        self.encoding = encoding
+        self.offset = offset
+        self.columns, self.input_name, self.location = VERTEX_ATTRIBUTES[name]
+        self.dtype, self.gl_type, self.normalized = ENCODINGS[encoding]
+
+        # Components the shader reads, and those stored: every attribute starts 4 byte aligned,
+        # so three 16-bit values take the room of four
+        self.components = 2 if encoding == 'oct32' else self.columns.stop - self.columns.start
+        itemsize = np.dtype(self.dtype).itemsize
+        self.stored = self.components + (self.components * itemsize % 4) // itemsize
+        self.nbytes = self.stored * itemsize
+
+        # Quantized values only cover the mesh's own range, the shader scales them back with two uniforms
+        self.quantized = encoding in ('snorm16', 'unorm16')
+
+    def glsl(self, declaration: str, kind: str) -> str:
+        # Replacement for the shader's own declaration of this input
+        name = self.input_name
+        if self.quantized:
+            return '\n'.join([
+                f'layout (location = {self.location}) in {kind} {name}Encoded;',
+                f'uniform {kind} {name}Scale;',
+                f'uniform {kind} {name}Offset;',
+                f'#define {name} ({name}Offset + {name}Scale * {name}Encoded)',
+            ])
+        if self.encoding == 'oct32':
+            return '\n'.join([
+                f'layout (location = {self.location}) in vec2 {name}Encoded;',
+                _OCTAHEDRAL_DECODE,
+                f'#define {name} decodeOctahedral({name}Encoded)',
+            ])
+        return declaration
+
+class VertexFormat:
+
+    def __init__(self, position: str = 'float32', texcoord: str = 'float32', normal: str = 'float32') -> None:
+        # One encoding per attribute, None leaves the attribute out of the vertex buffer altogether
+        self.encodings = {'position': position, 'texcoord': texcoord, 'normal': normal}
+        for name, encoding in self.encodings.items():
+            if encoding is not None and encoding not in ATTRIBUTE_ENCODINGS[name]:
+                raise ValueError(f'{name} can not be stored as {encoding}')
+
+        self.attributes = []
+        offset = 0
+        for name, encoding in self.encodings.items():
+            if encoding is not None:
+                self.attributes.append(VertexAttribute(name, encoding, offset))
+                offset += self.attributes[-1].nbytes
+        self.stride = offset
+
+        # Interleaved records, one field per attribute
+        self.dtype = np.dtype({
+            'names': [attribute.name for attribute in self.attributes],
+            'formats': [(attribute.dtype, attribute.stored) for attribute in self.attributes],
+            'offsets': [attribute.offset for attribute in self.attributes],
+            'itemsize': self.stride,
+        })
+
+        # The float32 layout with every attribute is exactly the loaded records, uploaded without conversion
+        self.is_reference = all(encoding == 'float32' for encoding in self.encodings.values())
+        self.quantized = any(attribute.quantized for attribute in self.attributes)
+
+    @classmethod
+    def named(cls, name: str, consumed: set = None) -> 'VertexFormat':
+        # A format from VERTEX_FORMATS, without the attributes whose shader input isn't in `consumed`
+        encodings = dict(zip(('position', 'texcoord', 'normal'), VERTEX_FORMATS[name]))
+        if consumed is not None:
+            encodings = {
+                attribute: encoding if VERTEX_ATTRIBUTES[attribute][1] in consumed else None
+                for attribute, encoding in encodings.items()
+            }
+        return cls(**encodings)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, VertexFormat) and self.encodings == other.encodings
+
+    def __hash__(self) -> int:
+        return hash(tuple(self.encodings.items()))
+
+    def __repr__(self) -> str:
+        return f'VertexFormat({", ".join(f"{name}={encoding!r}" for name, encoding in self.encodings.items())})'
+
+    def decode_parameters(self, records: np.ndarray) -> dict:
+        # Scale and offset of every quantized attribute by uniform name, decoded = offset + scale * normalized
+        parameters = {}
+        for attribute in self.attributes:
+            if not attribute.quantized:
+                continue
+            values = records[:, attribute.columns]
+            low = values.min(axis=0) if len(values) else np.zeros(values.shape[1])
+            high = values.max(axis=0) if len(values) else np.zeros(values.shape[1])
+            if attribute.encoding == 'snorm16':
+                offset, scale = (low + high) / 2, (high - low) / 2
+            else:
+                offset, scale = low, high - low
+            parameters[f'{attribute.input_name}Scale'] = np.where(scale > 0, scale, 1).astype(np.float32)
+            parameters[f'{attribute.input_name}Offset'] = offset.astype(np.float32)
+        return parameters
+
+    def encode(self, records: np.ndarray, parameters: dict = None) -> np.ndarray:
+        # (n, 8) float32 records to n interleaved records of this format
+        parameters = self.decode_parameters(records) if parameters is None else parameters
+        encoded = np.zeros(len(records), dtype=self.dtype)
+        for attribute in self.attributes:
+            values = records[:, attribute.columns].astype(np.float64)
+            if attribute.quantized:
+                name = attribute.input_name
+                values = (values - parameters[f'{name}Offset']) / parameters[f'{name}Scale']
+                limit = np.iinfo(attribute.dtype).max
+                values = np.round(np.clip(values, -1 if attribute.encoding == 'snorm16' else 0, 1) * limit)
+            elif attribute.encoding == 'oct32':
+                values = np.round(np.clip(octahedral_encode(values), -1, 1) * np.iinfo(np.int16).max)
+            encoded[attribute.name][:, :attribute.components] = values
+        return encoded
+
+    def decode(self, encoded: np.ndarray, parameters: dict) -> np.ndarray:
+        # Back to (n, 8) float records the way the GPU reads them, left out attributes are zero
+        records = np.zeros((len(encoded), 8), dtype=np.float64)
+        for attribute in self.attributes:
+            values = encoded[attribute.name][:, :attribute.components].astype(np.float64)
+            if attribute.quantized:
+                name = attribute.input_name
+                values = np.maximum(values / np.iinfo(attribute.dtype).max, -1)
+                values = parameters[f'{name}Offset'] + parameters[f'{name}Scale'] * values
+            elif attribute.encoding == 'oct32':
+                values = octahedral_decode(np.maximum(values / np.iinfo(np.int16).max, -1))
+            records[:, attribute.columns] = values
+        return records
+
+    def shader_source(self, source: str) -> str:
+        # Swap the vertex shader's declarations of this format's attributes for inputs in the stored encoding
+        # plus a decode under the original name, so the shader body reads them as before
+        for attribute in self.attributes:
+            pattern = re.compile(
+                rf'^layout\s*\(\s*location\s*=\s*{attribute.location}\s*\)\s*in\s+(\w+)\s+{attribute.input_name}\s*;',
+                re.M,
+            )
+            source = pattern.sub(lambda match: attribute.glsl(match.group(0), match.group(1)), source)
+        return source
+
+    def setup_attributes(self) -> None:
+        # Describe the bound VBO's layout to the bound VAO
+        for attribute in self.attributes:
+            glEnableVertexAttribArray(attribute.location)
+            glVertexAttribPointer(
+                attribute.location, attribute.components, attribute.gl_type, attribute.normalized, self.stride,
+                ctypes.c_void_p(attribute.offset)
+            )
@@ -1,144 +1,446 @@
+import argparse
+import sys
+
+# Run as a script, --headless has to pick PyOpenGL's platform before OpenGL.GL is imported below
+if __name__ == '__main__' and '--headless' in sys.argv[1:]:
+    from Headless import use_headless_platform
+    use_headless_platform()
+
 import pygame
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram, compileShader
 import numpy as np
 import pyrr
 import time
+import os
 import pathlib
 
-from Cube import Cube, Mesh
-from Material import Material
+from AssetManager import AssetManager
+from FrameProfiler import FrameProfiler
+from Frustum import Frustum
+from RenderQueue import RenderQueue
+from RenderState import RenderState
+from Headless import OffscreenContext, save_png
+from ImageLoader import image_paths
+from InstanceBatch import InstanceBatch
+from ShaderRegistry import ShaderRegistry
+from Simulation import FixedStepSimulation, RateMeter
+from TextureArray import TextureArray
+from TextureLoader import TextureLoader
+from TextureStreamer import TextureStreamer, projected_size
+from TransformStore import TransformStore
+from VertexFormat import VERTEX_FORMATS, VertexFormat, shader_inputs
 
 APP_SIZE = (1280, 720)
+APP_FOVY = 45
 APP_PATH = pathlib.Path(__file__).parent.resolve()
 
+# Degrees per second the cubes spin, one degree per frame at 60 FPS like the per-frame update
+CUBE_SPIN_SPEED = 60
+
 class App:
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        cube_count=1,
+        instanced=False,
+        cull=True,
+        headless=False,
+        frames=None,
+        screenshot=None,
+        profile=False,
+        profile_output=None,
+        async_textures=True,
+        texture_array=False,
+        stream_textures=False,
+        fixed_step=False,
+        model=f'{APP_PATH}/models/cube.obj',
+        lods=False,
+        vertex_format='float32',
+        state_cache=True,
+        sort_draws=True,
+    ) -> None:
         # Initialize pygame
         pygame.init()
-        pygame.display.set_mode((APP_SIZE[0], APP_SIZE[1]), pygame.OPENGL | pygame.DOUBLEBUF)
+        if headless:
+            # Render into an offscreen framebuffer instead, call Headless.use_headless_platform() before importing this
+            pygame.display.set_mode((1, 1))
+            self.offscreen = OffscreenContext(APP_SIZE)
+        else:
+            pygame.display.set_mode((APP_SIZE[0], APP_SIZE[1]), pygame.OPENGL | pygame.DOUBLEBUF)
+            self.offscreen = None
         self.clock = pygame.time.Clock()
+        
+        # A fixed number of frames runs uncapped and records how long each one took
+        self.frame_limit = frames
+        self.frame_times = []
+        self.screenshot = screenshot
 
         # Initialize OpenGL
         glClearColor(0.1, 0.1, 0.1, 1.0)
         
+        # Program, texture, VAO, uniform and blend/depth changes go through one cache that drops calls
+        # setting what is already set, without the cache they all reach GL but are still counted
+        self.state = RenderState(tracking=state_cache)
+        
         # Enable and set up blending for transparency
-        glEnable(GL_BLEND)
-        glEnable(GL_DEPTH_TEST)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.state.enable(GL_BLEND)
+        self.state.enable(GL_DEPTH_TEST)
+        self.state.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        
+        # Per-cube draws are queued and sent sorted by shader, texture and mesh, or as submitted without sorting
+        self.render_queue = RenderQueue(sort=sort_draws)
         
-        # Load and use shaders from files
+        # Vertex buffers only hold the attributes the vertex shaders read, in the named format's encodings
+        self.vertex_format = VertexFormat.named(vertex_format, shader_inputs(*(
+            f'{APP_PATH}/shaders/{name}' for name in ('vertex.vert', 'vertex_instanced.vert', 'vertex_array.vert')
+        )))
+        
+        # Load and use shaders from files, each source is compiled once and its linked binary reused on later starts
+        self.shader_registry = ShaderRegistry()
         self.shader = self.create_shader(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
-        glUseProgram(self.shader)
         
-        # Set texture unit 0 as active uniform sampler location for texture named 'imageTexture' in fragment shader
-        glUniform1i(glGetUniformLocation(self.shader, 'imageTexture'), 0)
+        # Many cubes are drawn in one call with the model matrix as a per-instance attribute instead
+        self.instanced = instanced or texture_array
+        if self.instanced:
+            self.instanced_shader = self.create_shader(
+                f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'
+            )
         
-        # Define cube
-        self.cube = Cube(
-            position=[0, 0, -3],
-            eulers=[0, 0, 0]
-        )
+        # Cubes showing every image in images/ still take one draw, the images are packed into one array texture
+        if texture_array:
+            self.array_shader = self.create_shader(
+                f'{APP_PATH}/shaders/vertex_array.vert', f'{APP_PATH}/shaders/fragment_array.frag'
+            )
+            self.texture_array = TextureArray(image_paths(APP_PATH / 'images'))
+        else:
+            self.texture_array = None
+        
+        # Define cubes, one in front of the camera or a cloud of them, as rows of one transform store
+        self.cubes = self.create_cubes(cube_count)
         
-        self.cube_mesh = Mesh(f'{APP_PATH}/models/cube.obj')
+        # Fixed timestep mode: the simulation spins its own copy of the cubes on a thread,
+        # frames only blend its last two snapshots into self.cubes and never wait for it
+        self.simulation = None
+        if fixed_step:
+            self.simulated_cubes = self.create_cubes(cube_count)
+            self.simulation = FixedStepSimulation(self.simulate, self.simulation_snapshot)
+        self.render_rate = RateMeter()
+        
+        # Textures and meshes come from one manager, so shared files are loaded once and freed by budget
+        if stream_textures:
+            # Coarsest mip levels first, refined a few MB per frame up to what the nearest cube's size needs
+            self.texture_loader = TextureStreamer()
+        else:
+            self.texture_loader = TextureLoader() if async_textures else None
+        self.assets = AssetManager(loader=self.texture_loader)
+        # With lods every cube picks a simplified level of the model from its size on screen
+        self.lods = lods
+        self.cube_mesh = self.assets.mesh(model, lods=lods, vertex_format=self.vertex_format)
+        self.cube_instances = InstanceBatch(self.cube_mesh, cube_count, texture_array) if self.instanced else None
+        
+        # Cube i shows image i modulo the image count, as rows of per-instance region data
+        self.cube_regions = None
+        if texture_array:
+            image_count = len(self.texture_array.regions)
+            self.cube_regions = self.texture_array.instance_data(np.arange(cube_count) % image_count)
         
         # Load texture image
-        self.image_texture = Material(f'{APP_PATH}/images/me.jpg')
+        self.image_texture = self.assets.texture(f'{APP_PATH}/images/me.jpg')
+        
+        # Each of the model's materials shows its map_Kd texture, the image above if it has none
+        self.cube_textures = self.material_textures(self.cube_mesh)
+        self.submesh_order = sorted(range(len(self.cube_textures)), key=lambda i: self.cube_textures[i].texture)
         
         # Define a 4x4 projection transform with params
         projection_transform = pyrr.matrix44.create_perspective_projection(
-            fovy=45, aspect=APP_SIZE[0]/APP_SIZE[1], near=0.1, far=10, dtype=np.float32
+            fovy=APP_FOVY, aspect=APP_SIZE[0]/APP_SIZE[1], near=0.1, far=10, dtype=np.float32
         )
         
-        #! add comment
-        glUniformMatrix4fv(
-            glGetUniformLocation(self.shader, 'projection'), 1, GL_FALSE, projection_transform
-        )
+        # Objects outside the view frustum are dropped before drawing, the camera sits at the origin
+        self.frustum = Frustum(projection_transform) if cull else None
         
-        # Get location in shader where model matrix should go and stores it for efficiency
-        self.model_matrix_location = glGetUniformLocation(self.shader, 'model')
+        # Meshes, instance batches and textures bound their VAOs, buffers and textures directly while being built
+        self.state.invalidate()
         
-        self.main_loop()
-
-    def create_shader(self, vertex_file_path, fragment_file_path):
-        with open(vertex_file_path, 'r') as f:
-            vertex_src = ''.join(f.readlines())
+        for shader in self.shaders():
+            shader.use(self.state)
             
-        with open(fragment_file_path, 'r') as f:
-            fragment_src = ''.join(f.readlines())
+            # Set texture unit 0 as active uniform sampler location for texture named 'imageTexture' in fragment shader
+            self.state.uniform(glUniform1i, shader.uniform('imageTexture'), 0)
+            self.state.uniform(glUniform1i, shader.uniform('imageTextures'), 0)
             
-        shader = compileProgram(
-            compileShader(vertex_src, GL_VERTEX_SHADER),
-            compileShader(fragment_src, GL_FRAGMENT_SHADER)
-        )
+            # Projection never changes, so it is uploaded once per program
+            self.state.uniform(glUniformMatrix4fv, shader.uniform('projection'), 1, GL_FALSE, projection_transform)
+        
+        # Per-phase CPU and GPU timings of recent frames, left as None (one check per phase) unless asked for
+        self.profiler = FrameProfiler() if profile or profile_output else None
+        self.profile_output = profile_output
+        
+        self.main_loop()
+
+    @staticmethod
+    def create_cubes(count):
+        cubes = TransformStore(count)
+        if count == 1:
+            cubes.add(position=[0, 0, -3], eulers=[0, 0, 0])
+            return cubes
         
-        return shader
+        # Scatter cubes through the visible depth range with random orientations
+        rng = np.random.default_rng(0)
+        positions = rng.uniform([-4, -2.5, -9.5], [4, 2.5, -3], size=(count, 3))
+        eulers = rng.uniform(0, 360, size=(count, 3))
+        cubes.extend(positions, eulers)
+        return cubes
+
+    def material_textures(self, mesh) -> list:
+        # One texture per submesh, shared through the asset manager like any other and released at quit.
+        # Materials from a missing MTL file, or pointing at a missing image, get the default texture.
+        textures = []
+        for name, _, _ in mesh.submeshes:
+            path = mesh.materials.get(name, {}).get('texture')
+            if path is None or not os.path.exists(path):
+                path = f'{APP_PATH}/images/me.jpg'
+            textures.append(self.assets.texture(path))
+        return textures
+
+    def simulate(self, time, dt):
+        # Simulation thread only
+        self.simulated_cubes.rotate(axis=2, degrees=CUBE_SPIN_SPEED * dt)
+
+    def simulation_snapshot(self):
+        return self.simulated_cubes.eulers[:len(self.simulated_cubes)].copy()
+
+    def shaders(self):
+        shaders = [self.shader, self.instanced_shader] if self.instanced else [self.shader]
+        return shaders + [self.array_shader] if self.texture_array else shaders
+
+    def create_shader(self, vertex_file_path, fragment_file_path):
+        return self.shader_registry.program(vertex_file_path, fragment_file_path, vertex_format=self.vertex_format)
 
     def main_loop(self):
         start_time = time.time()
+        last_report = 0
         running = True
+        profiler = self.profiler
+        state = self.state
+        if self.simulation:
+            self.simulation.start()
 
         while running:
             # current_time = time.time() - start_time
+            # Frame times start before event polling, a slow event queue is part of the frame
+            frame_start = time.perf_counter()
+            if profiler:
+                profiler.begin_frame()
+            state.begin_frame()
             
             # Check events
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
-                    
-            # Update cube
-            self.cube.eulers[2] += 1
-            if (self.cube.eulers[2] > 360):
-                self.cube.eulers[2] -= 360
-
-            # Refresh screen
-            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
             
-            # Use shader program
-            glUseProgram(self.shader)
-            self.image_texture.use()
-            
-            # Create identity, multiply transformations progressively
-            model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
+            if profiler:
+                profiler.mark('events')
+                    
+            # Update cubes, every model matrix is rebuilt in one pass into the store's own buffer
+            if self.simulation:
+                # Angles between the last two simulation steps, the shortest way round as the spin wraps past 360
+                previous, latest, alpha = self.simulation.sample()
+                delta = (latest.state - previous.state + 180) % 360 - 180
+                np.add(previous.state, alpha * delta, out=self.cubes.eulers[:len(self.cubes)])
+                self.cubes.dirty[:len(self.cubes)] = True
+            else:
+                self.cubes.rotate(axis=2, degrees=1)
+            moved = self.cubes.update()
+            if profiler:
+                profiler.mark('update')
             
-            # Rotate cube around its own axis
-            model_transform = pyrr.matrix44.multiply(
-                m1=model_transform,
-                m2=pyrr.matrix44.create_from_eulers(
-                    eulers=np.radians(self.cube.eulers),
-                    dtype=np.float32
-                )
-            )
+            # Cull every cube in one pass, only the visible ones go on to be drawn
+            model_transforms = self.cubes.matrices[:len(self.cubes)]
+            cube_regions = self.cube_regions
+            if self.frustum:
+                visible = self.frustum.cull(model_transforms, self.cube_mesh)
+                model_transforms = model_transforms[visible]
+                if cube_regions is not None:
+                    cube_regions = cube_regions[visible]
             
-            # Translate cube to its position
-            model_transform = pyrr.matrix44.multiply(
-                m1=model_transform,
-                m2=pyrr.matrix44.create_from_translation(
-                    vec=self.cube.position,
-                    dtype=np.float32
+            # Coarser levels for objects further away, distances from the camera at the origin
+            levels = None
+            if self.lods:
+                distances = np.linalg.norm(model_transforms[:, 3, :3], axis=1)
+                levels = self.cube_mesh.lod_levels(
+                    projected_size(self.cube_mesh.bounding_radius, distances, APP_FOVY, APP_SIZE[1])
                 )
-            )
-            
-            glUniformMatrix4fv(self.model_matrix_location, 1, GL_FALSE, model_transform)
+            if profiler:
+                profiler.mark('cull')
             
-            glBindVertexArray(self.cube_mesh.vao)
+            # Textures decoded in the background go to the GPU a few per frame
+            if self.texture_loader:
+                if isinstance(self.texture_loader, TextureStreamer) and len(model_transforms):
+                    distance = np.linalg.norm(model_transforms[:, 3, :3], axis=1).min()
+                    size = projected_size(self.cube_mesh.bounding_radius, distance, APP_FOVY, APP_SIZE[1])
+                    for texture in self.cube_textures:
+                        self.texture_loader.set_screen_size(texture, size)
+                self.texture_loader.update()
+                
+                # Uploads bind textures behind the cache's back, frames without any keep the cached bindings
+                if self.texture_loader.bound:
+                    state.forget_textures()
+
+            # Refresh screen
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
             
-            # Draw cube using currently bound shader and VAO
-            glDrawArrays(GL_TRIANGLES, 0, self.cube_mesh.vertex_count)
+            if self.instanced:
+                # Upload the visible cubes' model matrices, then draw them all in one call
+                if self.texture_array:
+                    self.array_shader.use(state)
+                    self.cube_mesh.use_decode(self.array_shader, state)
+                    self.texture_array.use(state)
+                else:
+                    self.instanced_shader.use(state)
+                    self.cube_mesh.use_decode(self.instanced_shader, state)
+                if levels is not None:
+                    # Grouped by level so each level is one contiguous run of instances
+                    order = np.argsort(levels, kind='stable')
+                    level_counts = np.bincount(levels, minlength=len(self.cube_mesh.lod_errors))
+                    if cube_regions is not None:
+                        cube_regions = cube_regions[order]
+                    self.cube_instances.update(model_transforms[order], cube_regions, level_counts, state)
+                elif moved:
+                    self.cube_instances.update(model_transforms, cube_regions, state=state)
+                if profiler:
+                    profiler.mark('upload')
+                if self.texture_array:
+                    self.cube_instances.draw(state)
+                else:
+                    # One instanced draw per material, in texture order
+                    for submesh in self.submesh_order:
+                        self.cube_textures[submesh].use(state)
+                        self.cube_instances.draw(state, submesh)
+            else:
+                # Uniform uploads and draws alternate per cube, so here both count as draw time
+                if profiler:
+                    profiler.mark('upload')
+                
+                # Every material of every cube is one draw, the queue binds shader, texture and VAO as they change
+                queue = self.render_queue
+                for index, model_transform in enumerate(model_transforms):
+                    level = 0 if levels is None else levels[index]
+                    for submesh, texture in enumerate(self.cube_textures):
+                        queue.submit(self.shader, texture, self.cube_mesh, model_transform, submesh, level)
+                queue.flush(state)
+            if profiler:
+                profiler.mark('draw')
             
-            pygame.display.flip()
+            if self.offscreen:
+                # Nothing to present, wait for the frame so its time includes the rendering
+                glFinish()
+            else:
+                pygame.display.flip()
+            if profiler:
+                profiler.mark('present')
 
             # Timing
-            self.clock.tick(60)
+            self.render_rate.tick()
+            if self.frame_limit is None:
+                self.clock.tick(60)
+            else:
+                self.frame_times.append(time.perf_counter() - frame_start)
+                running = running and len(self.frame_times) < self.frame_limit
+            
+            # Show last frame's culling and GL call counters and the simulation and render rates about once a second
+            if pygame.time.get_ticks() - last_report >= 1000:
+                last_report = pygame.time.get_ticks()
+                calls = state.stats()
+                binds = calls['kinds'].get('texture', (0, 0))[0]
+                caption = [f'{calls["issued"]} GL state calls ({binds} texture binds), {calls["skipped"]} skipped']
+                if self.frustum:
+                    caption.append(
+                        f'{self.frustum.visible} visible, {self.frustum.culled} culled of {self.frustum.tested} tested'
+                    )
+                if self.simulation:
+                    stats = self.simulation.stats()
+                    caption.append(
+                        f'{stats["rate_hz"]:.0f} Hz simulation, {self.render_rate.rate():.0f} FPS, '
+                        f'{stats["dropped"]} steps dropped'
+                    )
+                pygame.display.set_caption(' | '.join(caption))
+        
+        if self.screenshot:
+            save_png(self.screenshot, APP_SIZE)
 
         self.quit()
 
     def quit(self):
-        self.cube_mesh.delete()
-        self.image_texture.delete()
-        glDeleteProgram(self.shader)
+        if self.simulation:
+            self.simulation.stop()
+        if self.profiler:
+            self.profiler.finish()
+            print(self.profiler.format_summary())
+            if self.profile_output:
+                self.profiler.export(self.profile_output)
+            self.profiler.delete()
+        if self.cube_instances:
+            self.cube_instances.delete()
+        self.assets.release(self.cube_mesh)
+        self.assets.release(self.image_texture)
+        for texture in self.cube_textures:
+            self.assets.release(texture)
+        self.assets.delete()
+        if self.texture_array:
+            self.texture_array.delete()
+        if self.texture_loader:
+            self.texture_loader.delete()
+        self.shader_registry.delete()
+        if self.offscreen:
+            self.offscreen.delete()
         pygame.quit()
 
 if __name__ == '__main__':
-    myApp = App()
+    parser = argparse.ArgumentParser(description='Spinning textured cubes')
+    parser.add_argument('--cubes', type=int, default=1, help='number of cubes to draw')
+    parser.add_argument('--instanced', action='store_true', help='draw all cubes with one instanced call')
+    parser.add_argument('--no-cull', dest='cull', action='store_false', help='draw cubes outside the view frustum too')
+    parser.add_argument('--sync-textures', dest='async_textures', action='store_false',
+                        help='decode textures on the render thread before the first frame')
+    parser.add_argument('--texture-array', action='store_true',
+                        help='give the cubes every image in images/, packed into one array texture (implies --instanced)')
+    parser.add_argument('--stream-textures', action='store_true',
+                        help='stream mip levels coarsest first, as fine as the nearest cube needs')
+    parser.add_argument('--fixed-step', action='store_true',
+                        help='simulate at a fixed 60 Hz on a thread, frames interpolate between its steps')
+    parser.add_argument('--model', default=f'{APP_PATH}/models/cube.obj', help='OBJ file drawn for every cube')
+    parser.add_argument('--lods', action='store_true',
+                        help='simplify the model into levels of detail and draw each cube at the level its size needs')
+    parser.add_argument('--vertex-format', choices=sorted(VERTEX_FORMATS), default='float32',
+                        help='encoding of the vertex attributes, float16 and quantized take less memory')
+    parser.add_argument('--no-state-cache', dest='state_cache', action='store_false',
+                        help='send every program, texture, VAO and uniform call to GL even if nothing changed')
+    parser.add_argument('--no-sort', dest='sort_draws', action='store_false',
+                        help='issue per-cube draws in scene order instead of sorted by shader, texture and mesh')
+    parser.add_argument('--profile', action='store_true', help='time each frame phase on the CPU and GPU')
+    parser.add_argument('--profile-output', help='export the profile on exit, .json, .csv or .trace.json (Chrome trace)')
+    parser.add_argument('--headless', action='store_true', help='render offscreen through EGL, needs --frames to end')
+    parser.add_argument('--frames', type=int, help='run this many uncapped frames, then quit')
+    parser.add_argument('--screenshot', help='save the last frame to this PNG file')
+    args = parser.parse_args()
+    
+    myApp = App(
+        cube_count=args.cubes,
+        instanced=args.instanced,
+        cull=args.cull,
+        headless=args.headless,
+        frames=args.frames,
+        screenshot=args.screenshot,
+        profile=args.profile,
+        profile_output=args.profile_output,
+        async_textures=args.async_textures,
+        texture_array=args.texture_array,
+        stream_textures=args.stream_textures,
+        fixed_step=args.fixed_step,
+        model=args.model,
+        lods=args.lods,
+        vertex_format=args.vertex_format,
+        state_cache=args.state_cache,
+        sort_draws=args.sort_draws,
+    )
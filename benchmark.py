@@ -0,0 +1,2006 @@
+import argparse
+import math
+import os
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+
+def write_synthetic_obj(filename: str, faces: int) -> None:
+    # Square grid of quads with one position, texcoord and normal per grid point
+    side = math.ceil(math.sqrt(faces))
+    u, v = np.meshgrid(np.linspace(0, 1, side + 1), np.linspace(0, 1, side + 1))
+    u, v = u.ravel(), v.ravel()
+    height = 0.1 * np.sin(8 * u) * np.cos(8 * v)
+
+    row = np.arange(faces) // side
+    col = np.arange(faces) % side
+    a = row * (side + 1) + col + 1
+    quads = np.stack([a, a + 1, a + side + 2, a + side + 1], axis=1)
+
+    with open(filename, 'w') as file:
+        file.write('# synthetic grid\n')
+        np.savetxt(file, np.stack([u, height, v], axis=1), fmt='v %.6f %.6f %.6f')
+        np.savetxt(file, np.stack([u, v], axis=1), fmt='vt %.6f %.6f')
+        np.savetxt(file, np.tile([0.0, 1.0, 0.0], (len(u), 1)), fmt='vn %.4f %.4f %.4f')
+        np.savetxt(file, np.repeat(quads, 3, axis=1), fmt='f' + ' %d/%d/%d' * 4)
+
+def write_material_obj(source: str, directory: str, materials: int, textures: list) -> str:
+    # Copy of an OBJ with its faces split into this many runs in file order, one material each (a face each for
+    # the cube), and an MTL file giving material i texture i modulo the texture count
+    name = pathlib.Path(source).stem
+    with open(source, 'r') as file:
+        source_lines = [line.rstrip('\n') for line in file if not line.startswith(('mtllib', 'usemtl'))]
+    faces = sum(line.startswith('f ') for line in source_lines)
+
+    lines = [f'mtllib {name}.mtl']
+    face, material = 0, None
+    for line in source_lines:
+        if line.startswith('f '):
+            if face * materials // faces != material:
+                material = face * materials // faces
+                lines.append(f'usemtl {name}{material}')
+            face += 1
+        lines.append(line)
+
+    filename = os.path.join(directory, f'{name}.obj')
+    with open(filename, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+    with open(os.path.join(directory, f'{name}.mtl'), 'w') as file:
+        for index in range(materials):
+            file.write(f'newmtl {name}{index}\nKd 0.8 0.8 0.8\nmap_Kd {textures[index % len(textures)]}\n\n')
+    return filename
+
+def best_time(function, *args, repeat: int = 3) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_obj(args) -> None:
+    from ObjLoader import load_obj, load_obj_reference
+
+    files = sorted(str(path) for path in (APP_PATH / 'models').glob('*.obj'))
+    with tempfile.TemporaryDirectory() as directory:
+        for faces in args.faces:
+            filename = f'{directory}/grid_{faces}.obj'
+            write_synthetic_obj(filename, faces)
+            files.append(filename)
+
+        print(f'{"file":<24} {"faces":>10} {"MB":>8} {"reference s":>12} {"numpy s":>10} {"speedup":>8} {"MB/s":>8}')
+        for filename in files:
+            path = pathlib.Path(filename)
+            megabytes = path.stat().st_size / 1e6
+            with open(filename, 'rb') as file:
+                faces = sum(1 for line in file if line.startswith(b'f '))
+
+            fast = best_time(load_obj, filename, repeat=args.repeat)
+            if faces <= args.reference_limit:
+                slow = best_time(load_obj_reference, filename, repeat=args.repeat)
+                reference = f'{slow:12.4f}'
+                speedup = f'{slow / fast:7.1f}x'
+            else:
+                reference = f'{"skipped":>12}'
+                speedup = f'{"-":>8}'
+
+            print(f'{path.name:<24} {faces:>10} {megabytes:8.2f} {reference} {fast:10.4f} {speedup} {megabytes / fast:8.1f}')
+
+def bench_indexed(args) -> None:
+    from ObjLoader import load_obj, load_obj_indexed
+    from VertexCache import average_cache_miss_ratio, optimize_vertex_cache
+
+    print(f'{"file":<16} {"triangles":>9} {"vertices":>9} {"array KB":>9} {"indexed KB":>10} {"saved":>6} '
+          f'{"ACMR array":>10} {"ACMR file":>9} {"ACMR opt":>8} {"opt s":>7}')
+    for path in sorted((APP_PATH / 'models').glob('*.obj')):
+        flat = load_obj(str(path))
+        vertices, indices = load_obj_indexed(str(path))
+        vertex_count = len(vertices) // 8
+
+        start = time.perf_counter()
+        optimized = optimize_vertex_cache(indices, vertex_count, args.cache_size)
+        elapsed = time.perf_counter() - start
+
+        indexed_bytes = vertices.nbytes + indices.nbytes
+        print(f'{path.name:<16} {len(indices) // 3:>9} {vertex_count:>9} {flat.nbytes / 1024:9.1f} '
+              f'{indexed_bytes / 1024:10.1f} {1 - indexed_bytes / flat.nbytes:6.0%} '
+              f'{3.0:10.3f} {average_cache_miss_ratio(indices, args.cache_size):9.3f} '
+              f'{average_cache_miss_ratio(optimized, args.cache_size):8.3f} {elapsed:7.3f}')
+
+def _peak_memory(mode: str, filename: str, results) -> None:
+    # Runs in a fresh process so ru_maxrss only sees this one load
+    import resource
+    from ObjLoader import count_obj_triangles, load_obj, load_obj_reference, stream_obj
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if mode == 'reference':
+        output = np.array(load_obj_reference(filename), dtype=np.float32)
+    elif mode == 'numpy':
+        output = load_obj(filename)
+    else:
+        # Stand-in for the pre-sized GL buffer that Mesh(stream=True) fills with glBufferSubData
+        output = np.empty((3 * count_obj_triangles(filename), 8), dtype=np.float32)
+        offset = 0
+        for batch in stream_obj(filename):
+            output[offset:offset + len(batch)] = batch
+            offset += len(batch)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux
+    results.put(((after - before) * 1024, output.nbytes))
+
+def bench_memory(args) -> None:
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        filename = f'{directory}/grid_{args.faces}.obj'
+        write_synthetic_obj(filename, args.faces)
+        megabytes = pathlib.Path(filename).stat().st_size / 1e6
+        print(f'{args.faces} faces, {megabytes:.1f} MB OBJ')
+
+        print(f'{"loader":<10} {"peak RSS MB":>12} {"output MB":>10} {"peak / output":>14}')
+        for mode in args.modes:
+            results = context.Queue()
+            process = context.Process(target=_peak_memory, args=(mode, filename, results))
+            process.start()
+            peak, output = results.get()
+            process.join()
+            print(f'{mode:<10} {peak / 1e6:12.1f} {output / 1e6:10.1f} {peak / output:14.2f}')
+
+def bench_parallel(args) -> None:
+    import os
+    from ObjLoader import load_obj
+
+    workers = args.workers or list(range(1, (os.cpu_count() or 1) + 1))
+    with tempfile.TemporaryDirectory() as directory:
+        filename = f'{directory}/grid_{args.faces}.obj'
+        write_synthetic_obj(filename, args.faces)
+        megabytes = pathlib.Path(filename).stat().st_size / 1e6
+        print(f'{args.faces} faces, {megabytes:.1f} MB OBJ, {os.cpu_count()} CPUs')
+
+        serial = load_obj(filename)
+        print(f'{"workers":>7} {"seconds":>8} {"MB/s":>7} {"speedup":>8} {"identical":>9}')
+        baseline = None
+        for count in workers:
+            elapsed = best_time(load_obj, filename, count, repeat=args.repeat)
+            baseline = baseline or elapsed
+            identical = load_obj(filename, count).tobytes() == serial.tobytes()
+            print(f'{count:>7} {elapsed:8.3f} {megabytes / elapsed:7.1f} {baseline / elapsed:7.2f}x {str(identical):>9}')
+
+def bench_transforms(args) -> None:
+    import tracemalloc
+    from app import App
+    from Cube import Cube
+
+    def pyrr_frame(cubes):
+        # The old per-object path: a Cube with its own arrays and a pyrr multiply chain per object
+        def frame():
+            for cube in cubes:
+                cube.eulers[2] += 1
+                if cube.eulers[2] > 360:
+                    cube.eulers[2] -= 360
+            return [cube.model_transform() for cube in cubes]
+        return frame
+
+    def store_frame(store):
+        def frame():
+            store.rotate(axis=2, degrees=1)
+            store.update()
+            return store.matrices
+        return frame
+
+    def partial_frame(store):
+        # Every tenth object moved, the rest are skipped by their dirty flags
+        def frame():
+            store.dirty[:len(store):10] = True
+            store.update()
+            return store.matrices
+        return frame
+
+    def static_frame(store):
+        # Nothing moved, the dirty flags skip every object
+        store.update()
+        return store.update
+
+    def measure(frame, frames):
+        frame()
+        start = time.process_time()
+        for _ in range(frames):
+            frame()
+        cpu = (time.process_time() - start) / frames * 1000
+
+        # Peak bytes allocated while building one frame's matrices, on top of what already exists
+        tracemalloc.start()
+        frame()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return cpu, peak
+
+    print(f'{"path":<8} {"objects":>8} {"CPU ms/frame":>13} {"peak KB/frame":>14}')
+    for count in args.objects:
+        store = App.create_cubes(count)
+        cubes = [Cube(position, eulers) for position, eulers in zip(store.positions[:count], store.eulers[:count])]
+        frames = max(1, min(args.frames, args.frames * 1000 // count))
+        for name, frame in (('pyrr', pyrr_frame(cubes)), ('store', store_frame(store)),
+                            ('partial', partial_frame(store)), ('static', static_frame(store))):
+            cpu, peak = measure(frame, frames)
+            print(f'{name:<8} {count:>8} {cpu:13.4f} {peak / 1024:14.1f}')
+
+        # Both paths must agree on the matrices they produce
+        error = np.abs(np.array(pyrr_frame(cubes)()) - store_frame(store)()[:count]).max()
+        print(f'{"":<8} {count:>8} max difference {error:g}')
+
+def open_window(size: tuple[int, int], headless: bool = False):
+    # A visible pygame window, or an offscreen context when the platform was set up by main()
+    import pygame
+
+    pygame.init()
+    if headless:
+        from Headless import OffscreenContext
+        pygame.display.set_mode((1, 1))
+        return OffscreenContext(size)
+    pygame.display.set_mode(size, pygame.OPENGL | pygame.DOUBLEBUF)
+    return None
+
+def time_frames(render, frames: int) -> float:
+    # Mean milliseconds per frame, waiting for the GPU to finish each one
+    from OpenGL.GL import glFinish
+
+    render()
+    glFinish()
+    start = time.perf_counter()
+    for _ in range(frames):
+        render()
+        glFinish()
+    return (time.perf_counter() - start) / frames * 1000
+
+def bench_instancing(args) -> None:
+    import pygame
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE,
+        glClear, glEnable, glUniformMatrix4fv,
+    )
+    from app import APP_SIZE, App
+    from Cube import Mesh
+    from InstanceBatch import InstanceBatch
+    from ShaderRegistry import ShaderRegistry
+
+    open_window(APP_SIZE, args.headless)
+    glEnable(GL_DEPTH_TEST)
+
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
+    instanced_shader = shaders.program(
+        f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'
+    )
+    model_location = shader.uniform('model')
+    mesh = Mesh(f'{APP_PATH}/models/cube.obj')
+    batch = InstanceBatch(mesh)
+
+    def per_object(cubes):
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            shader.use()
+            cubes.rotate(axis=2, degrees=1)
+            cubes.update()
+            for model_transform in cubes.matrices[:len(cubes)]:
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                mesh.draw()
+        return render
+
+    def instanced(cubes):
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            instanced_shader.use()
+            cubes.rotate(axis=2, degrees=1)
+            cubes.update()
+            batch.update(cubes.matrices[:len(cubes)])
+            batch.draw()
+        return render
+
+    def instanced_static(cubes):
+        # Matrices built once, so only the upload and the draw are left per frame
+        cubes.update()
+        matrices = cubes.matrices[:len(cubes)]
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            instanced_shader.use()
+            batch.update(matrices)
+            batch.draw()
+        return render
+
+    # Double the object count until a frame no longer fits in 1/60 s
+    budget = 1000 / 60
+    print(f'{"path":<16} {"objects":>8} {"ms/frame":>9}')
+    for name, path in (('per-object', per_object), ('instanced', instanced), ('instanced static', instanced_static)):
+        count, fits = 16, 0
+        while count <= args.max_objects:
+            milliseconds = time_frames(path(App.create_cubes(count)), args.frames)
+            print(f'{name:<16} {count:>8} {milliseconds:9.2f}')
+            if milliseconds > budget:
+                break
+            fits = count
+            count *= 2
+        print(f'{name:<16} {fits:>8} objects at 60 FPS')
+
+    batch.delete()
+    mesh.delete()
+    shaders.delete()
+    pygame.quit()
+
+def bench_culling(args) -> None:
+    import pygame
+    import pyrr
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE,
+        glClear, glEnable, glUniformMatrix4fv,
+    )
+    from app import APP_SIZE, App
+    from Cube import Mesh
+    from Frustum import Frustum
+    from InstanceBatch import InstanceBatch
+    from ShaderRegistry import ShaderRegistry
+
+    open_window(APP_SIZE, args.headless)
+    glEnable(GL_DEPTH_TEST)
+
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
+    instanced_shader = shaders.program(
+        f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'
+    )
+    model_location = shader.uniform('model')
+    mesh = Mesh(f'{APP_PATH}/models/cube.obj')
+    batch = InstanceBatch(mesh)
+    projection = pyrr.matrix44.create_perspective_projection(
+        fovy=45, aspect=APP_SIZE[0] / APP_SIZE[1], near=0.1, far=10, dtype=np.float32
+    )
+    frustum = Frustum(projection)
+
+    def per_object(cubes, cull):
+        def render():
+            matrices = cubes.matrices[:len(cubes)]
+            if cull:
+                matrices = matrices[frustum.cull(matrices, mesh)]
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            shader.use()
+            for model_transform in matrices:
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                mesh.draw()
+        return render
+
+    def instanced(cubes, cull):
+        def render():
+            matrices = cubes.matrices[:len(cubes)]
+            if cull:
+                matrices = matrices[frustum.cull(matrices, mesh)]
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            instanced_shader.use()
+            batch.update(matrices)
+            batch.draw()
+        return render
+
+    print(f'{"path":<12} {"objects":>8} {"visible":>8} {"culled":>8} {"cull ms":>8} '
+          f'{"ms/frame":>9} {"culled ms/frame":>16}')
+    for count in args.objects:
+        # The App's cube cloud spread wider than the view, so a known share falls outside it
+        cubes = App.create_cubes(count)
+        cubes.positions[:count] *= args.spread
+        cubes.dirty[:count] = True
+        cubes.update()
+
+        matrices = cubes.matrices[:count]
+        cull_time = best_time(frustum.cull, matrices, mesh, repeat=5) * 1000
+        for name, path in (('per-object', per_object), ('instanced', instanced)):
+            if name == 'per-object' and count > args.max_per_object:
+                continue
+            plain = time_frames(path(cubes, False), args.frames)
+            culled = time_frames(path(cubes, True), args.frames)
+            print(f'{name:<12} {frustum.tested:>8} {frustum.visible:>8} {frustum.culled:>8} {cull_time:8.3f} '
+                  f'{plain:9.2f} {culled:16.2f}')
+
+    batch.delete()
+    mesh.delete()
+    shaders.delete()
+    pygame.quit()
+
+def bench_assets(args) -> None:
+    import pygame
+    from AssetManager import AssetManager
+    from ImageLoader import image_paths
+    from Material import Material
+
+    open_window((64, 64), args.headless)
+    rng = np.random.default_rng(0)
+    sources = [pygame.image.load(path).convert_alpha() for path in image_paths(APP_PATH / 'images')]
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Scale the images/ set up to many textures of mixed sizes
+        filenames = []
+        for index in range(args.textures):
+            side = int(rng.choice(args.sizes))
+            filenames.append(f'{directory}/texture_{index}.png')
+            pygame.image.save(pygame.transform.smoothscale(sources[index % len(sources)], (side, side)), filenames[-1])
+
+        # Zipf-like popularity: a few textures are used all the time, most only now and then
+        popularity = 1 / np.arange(1, args.textures + 1) ** args.skew
+        requests = rng.choice(args.textures, size=args.requests, p=popularity / popularity.sum())
+
+        # Every use decodes and uploads again, and the texture is freed straight after
+        start = time.perf_counter()
+        for index in requests[:args.baseline_requests]:
+            Material(filenames[index]).delete()
+        baseline = (time.perf_counter() - start) / min(args.requests, args.baseline_requests)
+
+        print(f'{args.textures} textures, {args.requests} requests, no manager: {baseline * 1000:.3f} ms per use')
+        print(f'{"budget MB":>10} {"hit rate":>9} {"evictions":>10} {"peak MB":>8} {"final MB":>9} '
+              f'{"ms/use":>8} {"hit ms":>8}')
+        for budget in args.budgets:
+            manager = AssetManager(vram_budget=int(budget * 2**20))
+            peak = 0
+            hit_time = 0.0
+            start = time.perf_counter()
+            for index in requests:
+                hits = manager.hits
+                request_start = time.perf_counter()
+                texture = manager.texture(filenames[index])
+                if manager.hits > hits:
+                    hit_time += time.perf_counter() - request_start
+                peak = max(peak, manager.vram_bytes)
+                manager.release(texture)
+            elapsed = time.perf_counter() - start
+
+            print(f'{budget:10.0f} {manager.hits / len(requests):9.1%} {manager.evictions:>10} '
+                  f'{peak / 2**20:8.1f} {manager.vram_bytes / 2**20:9.1f} '
+                  f'{elapsed / len(requests) * 1000:8.3f} {hit_time / max(manager.hits, 1) * 1000:8.4f}')
+            manager.delete()
+
+def bench_textures(args) -> None:
+    from OpenGL.GL import GL_COLOR_BUFFER_BIT, glClear, glFinish
+    from ImageLoader import image_paths
+    from Material import Material
+    from TextureLoader import TextureLoader
+
+    open_window((64, 64), args.headless)
+    filenames = image_paths(APP_PATH / 'images') * args.copies
+
+    def frame_loop(materials, loader, frames):
+        # Frame times from the request on, until every texture is ready and at least `frames` frames ran
+        times = []
+        ready = None
+        requested = time.perf_counter()
+        while len(times) < frames or ready is None:
+            start = time.perf_counter()
+            if loader:
+                loader.update()
+            glClear(GL_COLOR_BUFFER_BIT)
+            for material in materials:
+                material.use()
+            glFinish()
+            times.append((time.perf_counter() - start) * 1000)
+            if ready is None and all(material.ready for material in materials):
+                ready = ((time.perf_counter() - requested) * 1000, len(times))
+        return np.array(times), ready
+
+    print(f'{len(filenames)} images, {args.frames} frames')
+    print(f'{"mode":<16} {"ready after ms":>14} {"frames":>7} {"max frame ms":>13} {"p95 frame ms":>13}')
+
+    # Synchronous loading stalls whichever frame asks for the textures
+    start = time.perf_counter()
+    materials = [Material(filename) for filename in filenames]
+    stall = (time.perf_counter() - start) * 1000
+    times, _ = frame_loop(materials, None, args.frames)
+    times[0] += stall
+    print(f'{"sync":<16} {stall:14.1f} {1:>7} {times.max():13.2f} {np.percentile(times, 95):13.2f}')
+    for material in materials:
+        material.delete()
+
+    for uploads in args.uploads_per_frame:
+        loader = TextureLoader(workers=args.workers, uploads_per_frame=uploads)
+        materials = [Material(filename, loader) for filename in filenames]
+        times, (ready, ready_frame) = frame_loop(materials, loader, args.frames)
+        print(f'{f"async {uploads}/frame":<16} {ready:14.1f} {ready_frame:>7} {times.max():13.2f} '
+              f'{np.percentile(times, 95):13.2f}')
+        for material in materials:
+            material.delete()
+        loader.delete()
+
+def bench_atlas(args) -> None:
+    import pygame
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE,
+        glClear, glEnable, glUniform1i, glUniformMatrix4fv,
+    )
+    from app import APP_SIZE, App
+    from Cube import Mesh
+    from ImageLoader import image_paths
+    from InstanceBatch import InstanceBatch
+    from Material import Material
+    from ShaderRegistry import ShaderRegistry
+    from TextureArray import TextureArray
+
+    open_window(APP_SIZE, args.headless)
+    glEnable(GL_DEPTH_TEST)
+
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
+    instanced_shader = shaders.program(
+        f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'
+    )
+    array_shader = shaders.program(
+        f'{APP_PATH}/shaders/vertex_array.vert', f'{APP_PATH}/shaders/fragment_array.frag'
+    )
+    array_shader.use()
+    glUniform1i(array_shader.uniform('imageTextures'), 0)
+    model_location = shader.uniform('model')
+    mesh = Mesh(f'{APP_PATH}/models/cube.obj')
+
+    # Every image in images/ once as its own texture and once packed into the array
+    filenames = image_paths(APP_PATH / 'images')
+    materials = [Material(filename) for filename in filenames]
+    start = time.perf_counter()
+    texture_array = TextureArray(filenames, args.layer_size)
+    pack_time = (time.perf_counter() - start) * 1000
+    print(f'{len(filenames)} images packed into {texture_array.layer_count} layers of {args.layer_size}px '
+          f'in {pack_time:.0f} ms, {texture_array.nbytes / 2**20:.1f} MB')
+
+    # Draws and texture binds issued by the last rendered frame
+    counts = {}
+
+    def per_object(cubes, images):
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            shader.use()
+            for model_transform, image in zip(cubes.matrices[:len(cubes)], images):
+                materials[image].use()
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                mesh.draw()
+            counts.update(draws=len(cubes), binds=len(cubes))
+        return render, []
+
+    def per_texture(cubes, images):
+        # Instanced, but still one draw per image since each needs its own texture bound
+        batches = []
+        for image in range(len(materials)):
+            batch = InstanceBatch(mesh)
+            batch.update(cubes.matrices[:len(cubes)][images == image])
+            batches.append(batch)
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            instanced_shader.use()
+            for material, batch in zip(materials, batches):
+                material.use()
+                batch.draw()
+            counts.update(draws=len(batches), binds=len(batches))
+        return render, batches
+
+    def array(cubes, images):
+        batch = InstanceBatch(mesh, regions=True)
+        batch.update(cubes.matrices[:len(cubes)], texture_array.instance_data(images))
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            array_shader.use()
+            texture_array.use()
+            batch.draw()
+            counts.update(draws=1, binds=1)
+        return render, [batch]
+
+    print(f'{"path":<20} {"objects":>8} {"draws":>7} {"binds":>7} {"ms/frame":>9}')
+    for count in args.objects:
+        # The App's cube cloud, cube i showing image i modulo the image count
+        cubes = App.create_cubes(count)
+        cubes.update()
+        images = np.arange(count) % len(filenames)
+
+        for name, path in (('per-object', per_object), ('instanced per image', per_texture), ('texture array', array)):
+            if name == 'per-object' and count > args.max_per_object:
+                continue
+            render, batches = path(cubes, images)
+            milliseconds = time_frames(render, args.frames)
+            print(f'{name:<20} {count:>8} {counts["draws"]:>7} {counts["binds"]:>7} {milliseconds:9.2f}')
+            for batch in batches:
+                batch.delete()
+
+    texture_array.delete()
+    for material in materials:
+        material.delete()
+    mesh.delete()
+    shaders.delete()
+    pygame.quit()
+
+def bench_streaming(args) -> None:
+    from OpenGL.GL import GL_COLOR_BUFFER_BIT, glClear, glFinish
+    from AssetCache import load_texture_cached
+    from Material import Material
+    from TextureStreamer import TextureStreamer
+
+    open_window((64, 64), args.headless)
+    filenames = [str(APP_PATH / 'images' / name) for name in args.images] * args.copies
+    for filename in set(filenames):
+        load_texture_cached(filename)
+
+    def frame_loop(materials, streamer, frames):
+        # Frame times until every texture shows something (first) and has all it wants (complete)
+        times = []
+        first = complete = None
+        while len(times) < frames or complete is None:
+            start = time.perf_counter()
+            if streamer:
+                streamer.update()
+            glClear(GL_COLOR_BUFFER_BIT)
+            for material in materials:
+                material.use()
+            glFinish()
+            times.append((time.perf_counter() - start) * 1000)
+            if first is None and all(material.ready for material in materials):
+                first = len(times)
+            done = streamer is None or not streamer.pending and streamer.stats()['complete'] == len(materials)
+            if complete is None and done:
+                complete = len(times)
+        return np.array(times), first, complete
+
+    print(f'{len(filenames)} textures, {args.frames} frames')
+    print(f'{"mode":<22} {"first frame":>11} {"complete":>9} {"max ms":>8} {"p95 ms":>8} {"resident MB":>12}')
+
+    # Every level of every texture uploaded before the first frame
+    start = time.perf_counter()
+    materials = [Material(filename) for filename in filenames]
+    stall = (time.perf_counter() - start) * 1000
+    times, _, _ = frame_loop(materials, None, args.frames)
+    times[0] += stall
+    resident = sum(material.nbytes for material in materials)
+    print(f'{"full upload":<22} {1:>11} {1:>9} {times.max():8.2f} {np.percentile(times, 95):8.2f} '
+          f'{resident / 2**20:12.1f}')
+    for material in materials:
+        material.delete()
+
+    for budget in args.budgets:
+        for screen_size in args.screen_sizes:
+            streamer = TextureStreamer(frame_budget=int(budget * 2**20))
+            materials = [Material(filename, streamer) for filename in filenames]
+            for material in materials:
+                streamer.set_screen_size(material, screen_size)
+            times, first, complete = frame_loop(materials, streamer, args.frames)
+            name = f'{budget:g} MB/frame, {screen_size:g}px'
+            print(f'{name:<22} {first:>11} {complete:>9} {times.max():8.2f} {np.percentile(times, 95):8.2f} '
+                  f'{streamer.resident_bytes() / 2**20:12.1f}')
+            for material in materials:
+                material.delete()
+            streamer.delete()
+
+def bench_shaders(args) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        # Mesa keeps its own on-disk shader cache, a fresh one keeps the source compiles cold
+        os.environ['MESA_SHADER_CACHE_DIR'] = f'{directory}/driver'
+        from ShaderRegistry import ShaderRegistry
+
+        open_window((64, 64), args.headless)
+        sources = [
+            (f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag'),
+            (f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'),
+            (f'{APP_PATH}/shaders/vertex_array.vert', f'{APP_PATH}/shaders/fragment_array.frag'),
+        ]
+        # Variants differ by a #define, like feature permutations of the same shaders
+        variants = [(*sources[index % len(sources)], {'VARIANT': index}) for index in range(args.variants)]
+
+        def startup(registry):
+            start = time.perf_counter()
+            for vertex_path, fragment_path, defines in variants:
+                registry.program(vertex_path, fragment_path, defines)
+            return (time.perf_counter() - start) * 1000
+
+        print(f'{args.variants} shader variants')
+        print(f'{"path":<30} {"ms":>9} {"ms/program":>11}')
+
+        def report(name, milliseconds):
+            print(f'{name:<30} {milliseconds:9.1f} {milliseconds / args.variants:11.3f}')
+
+        source = ShaderRegistry(persist=False)
+        report('source, cold driver cache', startup(source))
+        source.delete()
+        source = ShaderRegistry(persist=False)
+        report('source, warm driver cache', startup(source))
+        report('in-process reuse', startup(source))
+        source.delete()
+
+        # A second set of variants so the driver cache doesn't help the first registry start
+        variants = [(vertex, fragment, {**defines, 'BINARY': 1}) for vertex, fragment, defines in variants]
+        first = ShaderRegistry(f'{directory}/programs')
+        if not first.persist:
+            print('the driver offers no program binary formats')
+            return
+        report('registry, first start', startup(first))
+        first.delete()
+        warm = ShaderRegistry(f'{directory}/programs')
+        report('registry, binaries on disk', startup(warm))
+        print(warm.stats())
+        warm.delete()
+
+def drop_page_cache(filenames: list[str]) -> None:
+    # Ask the kernel to forget these files' cached pages so the next read comes from disk
+    for filename in filenames:
+        handle = os.open(filename, os.O_RDONLY)
+        try:
+            os.fsync(handle)
+            os.posix_fadvise(handle, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(handle)
+
+def bench_startup(args) -> None:
+    import shutil
+    from OpenGL.GL import glFinish
+    from AssetCache import TEXTURE_CACHE_SUFFIX, bake_texture, cache_path
+    from ImageLoader import image_paths
+    from Material import Material
+
+    open_window((64, 64), args.headless)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # A private copy of images/ so the caches written here don't touch the real ones
+        filenames = []
+        for path in image_paths(APP_PATH / 'images'):
+            filenames.append(shutil.copy(path, directory))
+        caches = [cache_path(filename, TEXTURE_CACHE_SUFFIX) for filename in filenames]
+
+        def load(cache):
+            # Startup is done once every texture and its mip chain is on the GPU
+            materials = [Material(filename, cache=cache) for filename in filenames]
+            glFinish()
+            for material in materials:
+                material.delete()
+
+        def timed(cache, files):
+            times = []
+            for _ in range(args.repeat):
+                if files:
+                    drop_page_cache(files)
+                start = time.perf_counter()
+                load(cache)
+                times.append((time.perf_counter() - start) * 1000)
+            return min(times)
+
+        start = time.perf_counter()
+        for filename in filenames:
+            bake_texture(filename)
+        bake = (time.perf_counter() - start) * 1000
+        source_bytes = sum(os.path.getsize(filename) for filename in filenames)
+        cache_bytes = sum(os.path.getsize(path) for path in caches)
+
+        print(f'{len(filenames)} images, {source_bytes / 2**20:.1f} MB on disk, '
+              f'{cache_bytes / 2**20:.1f} MB baked in {bake:.0f} ms')
+        print(f'{"path":<28} {"cold ms":>9} {"warm ms":>9}')
+        for name, cache, files in (
+            ('decode + glGenerateMipmap', False, filenames),
+            ('baked cache, mmap', True, caches),
+        ):
+            # Cold drops the files from the page cache before every run, warm reads them from memory
+            print(f'{name:<28} {timed(cache, files):9.1f} {timed(cache, None):9.1f}')
+
+def bench_primitives(args) -> None:
+    import contextlib
+    import ctypes
+    import io
+    import random
+    import sys
+    from OpenGL.GL import (
+        GL_ARRAY_BUFFER, GL_COLOR_BUFFER_BIT, GL_DYNAMIC_DRAW, GL_FALSE, GL_FLOAT, GL_TRIANGLE_STRIP,
+        glBindBuffer, glBindVertexArray, glBufferData, glBufferSubData, glClear, glDeleteBuffers,
+        glDeleteVertexArrays, glDrawArrays, glEnableVertexAttribArray, glGenBuffers, glGenVertexArrays,
+        glBufferStorage, glUniform1i, glVertexAttribPointer,
+    )
+
+    sys.path.insert(0, str(APP_PATH / 'playground'))
+    from app_playground import PLAYGROUND_PATH, DynamicVertexBuffer, Material, Rectangle
+    from ShaderRegistry import ShaderRegistry
+
+    open_window((256, 256), args.headless)
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{PLAYGROUND_PATH}/shaders/vertex.vert', f'{PLAYGROUND_PATH}/shaders/fragment.frag')
+    shader.use()
+    glUniform1i(shader.uniform('imageTexture'), 0)
+    material = Material(f'{APP_PATH}/images/middle_finger.jpg')
+    material.use()
+
+    def scatter(buffer, count, moving):
+        # Small rectangles spread over the screen so the frame measures uploads rather than fill rate,
+        # and a random subset of them that is animated each frame
+        random.seed(0)
+        rectangles = [
+            Rectangle(buffer, center=(random.uniform(-0.9, 0.9), random.uniform(-0.9, 0.9)), size=(0.02, 0.02))
+            for _ in range(count)
+        ]
+        animated = sorted(random.sample(range(count), round(count * moving)))
+        return rectangles, animated
+
+    def per_primitive(count, moving):
+        # What the playground did before: a VBO per primitive, reallocated by the colour update
+        # and uploaded again whole by the movement update
+        buffer = DynamicVertexBuffer(count * 4, ring=False)
+        rectangles, animated = scatter(buffer, count, moving)
+        vaos = np.atleast_1d(glGenVertexArrays(count))
+        vbos = np.atleast_1d(glGenBuffers(count))
+        for vao, vbo, rectangle in zip(vaos, vbos, rectangles):
+            glBindVertexArray(vao)
+            glBindBuffer(GL_ARRAY_BUFFER, vbo)
+            glBufferData(GL_ARRAY_BUFFER, rectangle.vertices.nbytes, rectangle.vertices, GL_DYNAMIC_DRAW)
+            for location, size, offset in ((0, 3, 0), (1, 3, 12), (2, 2, 24)):
+                glEnableVertexAttribArray(location)
+                glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(offset))
+        traffic = {'bytes': 0, 'calls': 0, 'seconds': 0.0}
+
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT)
+            traffic.update(bytes=0, calls=0, seconds=0.0)
+            now = time.perf_counter()
+            for index in animated:
+                rectangle = rectangles[index]
+                rectangle.update_colour(now)
+                start = time.perf_counter()
+                glBindBuffer(GL_ARRAY_BUFFER, vbos[index])
+                glBufferData(GL_ARRAY_BUFFER, rectangle.vertices.nbytes, rectangle.vertices, GL_DYNAMIC_DRAW)
+                traffic['seconds'] += time.perf_counter() - start
+                rectangle.update_movement()
+                start = time.perf_counter()
+                glBufferSubData(GL_ARRAY_BUFFER, 0, rectangle.vertices.nbytes, rectangle.vertices)
+                traffic['seconds'] += time.perf_counter() - start
+                traffic['bytes'] += 2 * rectangle.vertices.nbytes
+                traffic['calls'] += 2
+            buffer.dirty.clear()
+            for vao, rectangle in zip(vaos, rectangles):
+                glBindVertexArray(vao)
+                glDrawArrays(GL_TRIANGLE_STRIP, 0, rectangle.vertex_count)
+
+        def delete():
+            glDeleteVertexArrays(count, vaos)
+            glDeleteBuffers(count, vbos)
+            buffer.delete()
+        return render, traffic, delete
+
+    def shared(count, moving, ring):
+        buffer = DynamicVertexBuffer(count * 4, ring=ring)
+        rectangles, animated = scatter(buffer, count, moving)
+        buffer.flush()
+        traffic = {'bytes': 0, 'calls': 0, 'seconds': 0.0}
+
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT)
+            now = time.perf_counter()
+            for index in animated:
+                rectangles[index].update_colour(now)
+                rectangles[index].update_movement()
+            start = time.perf_counter()
+            uploaded = buffer.flush()
+            traffic.update(bytes=uploaded, calls=buffer.upload_calls, seconds=time.perf_counter() - start)
+            glBindVertexArray(buffer.vao)
+            for rectangle in rectangles:
+                rectangle.draw()
+        return render, traffic, buffer.delete
+
+    paths = [
+        ('per-primitive buffers', per_primitive),
+        ('shared, orphaned', lambda count, moving: shared(count, moving, False)),
+        ('shared, mapped ring', lambda count, moving: shared(count, moving, True)),
+    ]
+    if not glBufferStorage:
+        print('no GL 4.4 buffer storage, the mapped ring falls back to orphaning')
+    print(f'{"path":<24} {"primitives":>10} {"moving":>7} {"KB/frame":>9} {"uploads":>8} {"upload ms":>10} '
+          f'{"ms/frame":>9}')
+    for count in args.primitives:
+        for moving in args.moving:
+            for name, setup in paths:
+                render, traffic, delete = setup(count, moving)
+                # Bounces print their new direction, which would swamp the table
+                with contextlib.redirect_stdout(io.StringIO()):
+                    milliseconds = time_frames(render, args.frames)
+                print(f'{name:<24} {count:>10} {moving:>7.0%} {traffic["bytes"] / 1024:9.1f} {traffic["calls"]:>8} '
+                      f'{traffic["seconds"] * 1000:10.2f} {milliseconds:9.2f}')
+                delete()
+
+    material.delete()
+    shaders.delete()
+
+def bench_animation(args) -> None:
+    import contextlib
+    import io
+    import random
+    import sys
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_TRIANGLE_STRIP, glBindVertexArray, glClear, glMultiDrawArrays, glUniform1f,
+        glUniform1i,
+    )
+
+    sys.path.insert(0, str(APP_PATH / 'playground'))
+    from app_playground import GPU_ANIMATION_ATTRIBUTES, PLAYGROUND_PATH, DynamicVertexBuffer, Material, Rectangle
+    from ShaderRegistry import ShaderRegistry
+
+    open_window((256, 256), args.headless)
+    shaders = ShaderRegistry()
+    material = Material(f'{APP_PATH}/images/middle_finger.jpg')
+    material.use()
+
+    def scene(count, gpu):
+        defines = {'GPU_ANIMATION': 1} if gpu else None
+        shader = shaders.program(
+            f'{PLAYGROUND_PATH}/shaders/vertex.vert', f'{PLAYGROUND_PATH}/shaders/fragment.frag', defines
+        )
+        shader.use()
+        glUniform1i(shader.uniform('imageTexture'), 0)
+        if gpu:
+            buffer = DynamicVertexBuffer(count * 4, ring=False, attributes=GPU_ANIMATION_ATTRIBUTES)
+        else:
+            buffer = DynamicVertexBuffer(count * 4)
+
+        # Small rectangles spread over the screen, all drawn with one call so neither path pays per-draw overhead
+        random.seed(0)
+        rectangles = [
+            Rectangle(buffer, center=(random.uniform(-0.9, 0.9), random.uniform(-0.9, 0.9)), size=(0.02, 0.02),
+                      gpu_animation=gpu)
+            for _ in range(count)
+        ]
+        buffer.flush()
+        firsts = np.array([rectangle.first for rectangle in rectangles], dtype=np.int32)
+        counts = np.full(count, 4, dtype=np.int32)
+        timing = {'update': 0.0, 'bytes': 0}
+        start_time = time.perf_counter()
+
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT)
+            now = time.perf_counter() - start_time
+            start = time.perf_counter()
+            if gpu:
+                glUniform1f(shader.uniform('time'), now)
+            else:
+                for rectangle in rectangles:
+                    rectangle.update_colour(now)
+                    rectangle.update_movement()
+            timing.update(bytes=buffer.flush(), update=time.perf_counter() - start)
+            glBindVertexArray(buffer.vao)
+            glMultiDrawArrays(GL_TRIANGLE_STRIP, firsts + buffer.base_vertex, counts, count)
+        return render, timing, buffer
+
+    print(f'{"path":<6} {"primitives":>10} {"update ms":>10} {"KB/frame":>9} {"ms/frame":>9}')
+    for count in args.primitives:
+        for name, gpu in (('cpu', False), ('gpu', True)):
+            render, timing, buffer = scene(count, gpu)
+            # Bounces print their new direction, which would swamp the table
+            with contextlib.redirect_stdout(io.StringIO()):
+                milliseconds = time_frames(render, args.frames)
+            print(f'{name:<6} {count:>10} {timing["update"] * 1000:10.3f} {timing["bytes"] / 1024:9.1f} '
+                  f'{milliseconds:9.3f}')
+            buffer.delete()
+
+    material.delete()
+    shaders.delete()
+
+def bench_sprites(args) -> None:
+    import contextlib
+    import io
+    import random
+    import sys
+    from OpenGL.GL import GL_COLOR_BUFFER_BIT, glBindVertexArray, glClear, glUniform1i
+
+    sys.path.insert(0, str(APP_PATH / 'playground'))
+    from app_playground import PLAYGROUND_PATH, DynamicVertexBuffer, Material, Rectangle, SpriteBatch
+    from ShaderRegistry import ShaderRegistry
+
+    open_window((256, 256), args.headless)
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{PLAYGROUND_PATH}/shaders/vertex.vert', f'{PLAYGROUND_PATH}/shaders/fragment.frag')
+    shader.use()
+    glUniform1i(shader.uniform('imageTexture'), 0)
+    material = Material(f'{APP_PATH}/images/middle_finger.jpg')
+    material.use()
+
+    def steps_per_second(step, steps):
+        step()
+        start = time.perf_counter()
+        for _ in range(steps):
+            step()
+        return steps / (time.perf_counter() - start)
+
+    print(f'{"path":<22} {"sprites":>8} {"steps/s":>10} {"corners/step":>13} {"ms/frame":>9}')
+    for count in args.sprites:
+        if count <= args.max_per_object:
+            # One Rectangle.dvd_screensaver per sprite, Python loops over vertices and prints for corner hits
+            random.seed(0)
+            buffer = DynamicVertexBuffer(4 * count)
+            rectangles = [
+                Rectangle(buffer, center=(random.uniform(-0.9, 0.9), random.uniform(-0.9, 0.9)), size=(0.02, 0.02))
+                for _ in range(count)
+            ]
+
+            def step():
+                for rectangle in rectangles:
+                    rectangle.dvd_screensaver()
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                rate = steps_per_second(step, args.steps)
+            corners = output.getvalue().count('Corner hit!') / (args.steps + 1)
+            print(f'{"per-rectangle":<22} {count:>8} {rate:10.1f} {corners:13.2f} {"":>9}')
+            buffer.delete()
+
+        buffer = DynamicVertexBuffer(4 * count)
+        sprites = SpriteBatch(buffer, count, size=(0.02, 0.02), seed=0)
+        hits = []
+        rate = steps_per_second(lambda: hits.append(len(sprites.step(0.0))), args.steps)
+        print(f'{"sprite batch":<22} {count:>8} {rate:10.1f} {np.mean(hits):13.2f} {"":>9}')
+
+        # The same step with the upload and the single draw call, as a frame
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT)
+            sprites.step(0.0)
+            buffer.flush()
+            glBindVertexArray(buffer.vao)
+            sprites.draw()
+        milliseconds = time_frames(render, args.frames)
+        print(f'{"sprite batch, drawn":<22} {count:>8} {1000 / milliseconds:10.1f} {"":>13} {milliseconds:9.2f}')
+        buffer.delete()
+
+    material.delete()
+    shaders.delete()
+
+def bench_simulation(args) -> None:
+    import sys
+    from Simulation import FixedStepSimulation, RateMeter, state_digest
+
+    if args.scene == 'cubes':
+        from app import CUBE_SPIN_SPEED, App
+        from TransformStore import TransformStore
+
+        def scene():
+            # What app.py's fixed-step mode runs: the simulation's cubes and the render thread's copy
+            simulated, rendered = App.create_cubes(args.objects), App.create_cubes(args.objects)
+
+            def step(time, dt):
+                simulated.rotate(axis=2, degrees=CUBE_SPIN_SPEED * dt)
+                simulated.update()
+
+            def snapshot():
+                return simulated.eulers[:len(simulated)].copy()
+
+            def render(previous, latest, alpha):
+                delta = (latest - previous + 180) % 360 - 180
+                np.add(previous, alpha * delta, out=rendered.eulers[:len(rendered)])
+                rendered.dirty[:len(rendered)] = True
+                rendered.update()
+            return step, snapshot, render
+    else:
+        sys.path.insert(0, str(APP_PATH / 'playground'))
+        from app_playground import DynamicVertexBuffer, SpriteBatch
+
+        open_window((64, 64), args.headless)
+
+        def scene():
+            buffer = DynamicVertexBuffer(4 * args.objects, ring=False)
+            sprites = SpriteBatch(buffer, args.objects, size=(0.02, 0.02), seed=0)
+
+            def render(previous, latest, alpha):
+                sprites.interpolate(previous, latest, alpha)
+                buffer.flush()
+            return lambda time, dt: sprites.step(time, write=False), sprites.snapshot, render
+
+    def slow(step):
+        # Extra work per step standing in for a heavier simulation
+        def slowed(now, dt):
+            step(now, dt)
+            if args.step_cost:
+                time.sleep(args.step_cost / 1000)
+        return slowed
+
+    print(f'{args.objects} {args.scene}, {args.seconds:g} s per mode, {args.step_cost:g} ms extra per step')
+    print(f'{"mode":<12} {"sim Hz":>8} {"FPS":>8} {"step ms":>8} {"max ms":>8} {"late":>6} {"dropped":>8}')
+
+    # Lockstep: one step per frame like the original loops, whatever the frame rate
+    step, snapshot, render = scene()
+    step = slow(step)
+    meter = RateMeter(100_000)
+    step_times = []
+    steps = 0
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        step(steps / 60, 1 / 60)
+        steps += 1
+        state = snapshot()
+        step_times.append(time.perf_counter() - start)
+        render(state, state, 1.0)
+        meter.tick()
+    print(f'{"lockstep":<12} {meter.rate():8.1f} {meter.rate():8.1f} {1000 * np.mean(step_times):8.3f} '
+          f'{1000 * max(step_times):8.3f} {"":>6} {"":>8}')
+
+    # Fixed step on a thread, frames run uncapped and interpolate, every published snapshot's digest is recorded
+    step, snapshot, render = scene()
+    digests = []
+
+    def recorded():
+        state = snapshot()
+        digests.append(state_digest(state))
+        return state
+    simulation = FixedStepSimulation(slow(step), recorded)
+    meter = RateMeter(100_000)
+    simulation.start()
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        previous, latest, alpha = simulation.sample()
+        render(previous.state, latest.state, alpha)
+        meter.tick()
+    simulation.stop()
+    stats = simulation.stats()
+    print(f'{"fixed step":<12} {stats["steps"] / args.seconds:8.1f} {meter.rate():8.1f} {stats["step_mean_ms"]:8.3f} '
+          f'{stats["step_max_ms"]:8.3f} {stats["late"]:>6} {stats["dropped"]:>8}')
+
+    # Replay: the same number of steps from a fresh start without the thread or any waiting must match bit for bit
+    step, snapshot, render = scene()
+    replay = FixedStepSimulation(step, lambda: state_digest(snapshot()))
+    replayed = [replay.latest.state] + [replay.advance().state for _ in range(stats['steps'])]
+    identical = replayed == digests
+    print(f'replay of {stats["steps"]} steps: {"identical" if identical else "DIFFERENT"}')
+    if not identical:
+        first = next(index for index, (a, b) in enumerate(zip(replayed, digests)) if a != b)
+        raise SystemExit(f'replay diverged at step {first}')
+
+def bench_lods(args) -> None:
+    import pygame
+    import pyrr
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE,
+        glClear, glEnable, glUniformMatrix4fv,
+    )
+    from app import APP_FOVY, APP_SIZE
+    from Cube import Mesh
+    from Headless import save_png
+    from InstanceBatch import InstanceBatch
+    from MeshLod import build_lods
+    from ObjLoader import load_obj_indexed
+    from ShaderRegistry import ShaderRegistry
+    from TextureStreamer import projected_size
+    from TransformStore import TransformStore
+
+    # Levels of the bundled models and of a large synthetic grid, built without touching their caches
+    print(f'{"model":<16} {"level":>5} {"triangles":>10} {"vertices":>9} {"error":>9} {"error/radius":>13} '
+          f'{"bake s":>7}')
+    with tempfile.TemporaryDirectory() as directory:
+        grid = os.path.join(directory, 'grid.obj')
+        write_synthetic_obj(grid, args.grid_faces)
+        for filename in sorted(map(str, (APP_PATH / 'models').glob('*.obj'))) + [grid]:
+            vertices, indices = load_obj_indexed(filename)
+            positions = vertices.reshape(-1, 8)[:, :3]
+            radius = np.linalg.norm(positions - (positions.min(axis=0) + positions.max(axis=0)) / 2, axis=1).max()
+            start = time.perf_counter()
+            levels = build_lods(vertices, indices)
+            bake = time.perf_counter() - start
+            name = pathlib.Path(filename).name
+            for level, (level_vertices, level_indices, error) in enumerate(levels):
+                print(f'{name:<16} {level:>5} {len(level_indices) // 3:>10} {len(level_vertices) // 8:>9} '
+                      f'{error:9.4f} {error / radius:13.5f} {f"{bake:7.2f}" if level == 0 else "":>7}')
+
+    open_window(APP_SIZE, args.headless)
+    glEnable(GL_DEPTH_TEST)
+
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
+    instanced_shader = shaders.program(
+        f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'
+    )
+    model_location = shader.uniform('model')
+    meshes = {False: Mesh(args.model), True: Mesh(args.model, lods=True)}
+    batches = {lods: InstanceBatch(mesh, args.objects) for lods, mesh in meshes.items()}
+
+    # Objects scattered through the view between near and far multiples of the model's radius,
+    # so most of them are a few dozen pixels across or less
+    radius = meshes[True].bounding_radius
+    rng = np.random.default_rng(0)
+    depth = rng.uniform(args.near, args.far, args.objects) * radius
+    half_height = math.tan(math.radians(APP_FOVY) / 2)
+    spread = rng.uniform(-0.9, 0.9, (args.objects, 2)) * [half_height * APP_SIZE[0] / APP_SIZE[1], half_height]
+    objects = TransformStore(args.objects)
+    objects.extend(np.column_stack([spread * depth[:, None], -depth]), rng.uniform(0, 360, (args.objects, 3)))
+    objects.update()
+    matrices = objects.matrices[:args.objects]
+    distances = np.linalg.norm(matrices[:, 3, :3], axis=1)
+
+    projection = pyrr.matrix44.create_perspective_projection(
+        fovy=APP_FOVY, aspect=APP_SIZE[0] / APP_SIZE[1], near=0.1 * radius, far=2 * args.far * radius,
+        dtype=np.float32
+    )
+    for program in (shader, instanced_shader):
+        program.use()
+        glUniformMatrix4fv(program.uniform('projection'), 1, GL_FALSE, projection)
+
+    def choose_levels(mesh, lods):
+        # Level selection is part of the frame, as it would be with a moving camera
+        if not lods:
+            return np.zeros(args.objects, dtype=np.int64)
+        return mesh.lod_levels(projected_size(radius, distances, APP_FOVY, APP_SIZE[1]))
+
+    def per_object(lods):
+        mesh = meshes[lods]
+        def render():
+            levels = choose_levels(mesh, lods).tolist()
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            shader.use()
+            for model_transform, level in zip(matrices, levels):
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                mesh.draw(level)
+        return render
+
+    def instanced(lods):
+        mesh, batch = meshes[lods], batches[lods]
+        def render():
+            levels = choose_levels(mesh, lods)
+            order = np.argsort(levels, kind='stable')
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            instanced_shader.use()
+            batch.update(matrices[order], None, np.bincount(levels, minlength=len(mesh.lod_errors)))
+            batch.draw()
+        return render
+
+    levels = choose_levels(meshes[True], True)
+    histogram = np.bincount(levels, minlength=len(meshes[True].lod_errors))
+    print(f'\n{args.objects} x {pathlib.Path(args.model).name} at {args.near:g}-{args.far:g} radii, '
+          f'objects per level {histogram.tolist()}')
+    print(f'{"path":<12} {"lods":>5} {"triangles":>10} {"ms/frame":>9}')
+    for name, path in (('per-object', per_object), ('instanced', instanced)):
+        for lods in (False, True):
+            mesh = meshes[lods]
+            triangles = sum(mesh.lod_triangles(level) for level in choose_levels(mesh, lods).tolist())
+            milliseconds = time_frames(path(lods), args.frames)
+            print(f'{name:<12} {"on" if lods else "off":>5} {triangles:>10} {milliseconds:9.2f}')
+            if args.png:
+                save_png(f'{args.png}-{name}-{"lod" if lods else "full"}.png', APP_SIZE)
+
+    for batch in batches.values():
+        batch.delete()
+    for mesh in meshes.values():
+        mesh.delete()
+    shaders.delete()
+    pygame.quit()
+
+def bench_formats(args) -> None:
+    import pygame
+    import pyrr
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE,
+        glClear, glEnable, glUniformMatrix4fv,
+    )
+    from app import APP_FOVY, APP_SIZE
+    from Cube import Mesh
+    from Headless import read_pixels
+    from InstanceBatch import InstanceBatch
+    from Material import Material
+    from ObjLoader import load_obj_indexed
+    from ShaderRegistry import ShaderRegistry
+    from TransformStore import TransformStore
+    from VertexFormat import VERTEX_FORMATS, VertexFormat, shader_inputs
+
+    # Decoded attributes against the float32 records, every attribute kept so normals are measured too
+    print(f'{"model":<16} {"format":<10} {"bytes/vertex":>12} {"VBO bytes":>10} {"position":>10} {"rel. pos":>9} '
+          f'{"texcoord":>9} {"normal deg":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        grid = os.path.join(directory, 'grid.obj')
+        write_synthetic_obj(grid, args.grid_faces)
+        for filename in sorted(map(str, (APP_PATH / 'models').glob('*.obj'))) + [grid]:
+            vertices, _ = load_obj_indexed(filename)
+            records = vertices.reshape(-1, 8).astype(np.float64)
+            diagonal = np.linalg.norm(records[:, :3].max(axis=0) - records[:, :3].min(axis=0))
+            for name in args.formats:
+                vertex_format = VertexFormat.named(name)
+                parameters = vertex_format.decode_parameters(vertices.reshape(-1, 8))
+                decoded = vertex_format.decode(vertex_format.encode(vertices.reshape(-1, 8), parameters), parameters)
+                position = np.abs(decoded[:, :3] - records[:, :3]).max()
+                texcoord = np.abs(decoded[:, 3:5] - records[:, 3:5]).max()
+                # Angle between directions, exported normals are not always unit length
+                normals = records[:, 5:] / np.linalg.norm(records[:, 5:], axis=1, keepdims=True)
+                directions = decoded[:, 5:] / np.linalg.norm(decoded[:, 5:], axis=1, keepdims=True)
+                cosines = np.clip(np.einsum('ij,ij->i', directions, normals), -1, 1)
+                print(f'{pathlib.Path(filename).name:<16} {name:<10} {vertex_format.stride:>12} '
+                      f'{vertex_format.stride * len(records):>10} {position:10.2e} {position / diagonal:9.2e} '
+                      f'{texcoord:9.2e} {np.degrees(np.arccos(cosines)).max():10.4f}')
+
+    open_window(APP_SIZE, args.headless)
+    glEnable(GL_DEPTH_TEST)
+
+    # What the app draws: only the attributes its shaders read, with each format's own shader variant
+    vertex_path, fragment_path = f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'
+    consumed = shader_inputs(vertex_path)
+    shaders = ShaderRegistry()
+    texture = Material(f'{APP_PATH}/images/me.jpg')
+
+    probe = Mesh(args.model)
+    radius = probe.bounding_radius
+    probe.delete()
+    rng = np.random.default_rng(0)
+    depth = rng.uniform(args.near, args.far, args.objects) * radius
+    half_height = math.tan(math.radians(APP_FOVY) / 2)
+    spread = rng.uniform(-0.9, 0.9, (args.objects, 2)) * [half_height * APP_SIZE[0] / APP_SIZE[1], half_height]
+    objects = TransformStore(args.objects)
+    objects.extend(np.column_stack([spread * depth[:, None], -depth]), rng.uniform(0, 360, (args.objects, 3)))
+    objects.update()
+    projection = pyrr.matrix44.create_perspective_projection(
+        fovy=APP_FOVY, aspect=APP_SIZE[0] / APP_SIZE[1], near=0.1 * radius, far=2 * args.far * radius,
+        dtype=np.float32
+    )
+
+    print(f'\n{args.objects} x {pathlib.Path(args.model).name}, attributes read: {", ".join(sorted(consumed))}')
+    print(f'{"format":<10} {"bytes/vertex":>12} {"VBO bytes":>10} {"ms/frame":>9} {"pixels off":>11} {"mean diff":>10}')
+    reference = None
+    for name in args.formats:
+        vertex_format = VertexFormat.named(name, consumed)
+        mesh = Mesh(args.model, vertex_format=vertex_format)
+        batch = InstanceBatch(mesh, args.objects)
+        batch.update(objects.matrices[:args.objects])
+        shader = shaders.program(vertex_path, fragment_path, vertex_format=vertex_format)
+        shader.use()
+        glUniformMatrix4fv(shader.uniform('projection'), 1, GL_FALSE, projection)
+
+        def render():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            shader.use()
+            mesh.use_decode(shader)
+            texture.use()
+            batch.draw()
+
+        milliseconds = time_frames(render, args.frames)
+
+        # The last frame against the float32 one: share of pixels visibly off and the mean channel difference
+        pixels = read_pixels(APP_SIZE).astype(np.int16)
+        if reference is None:
+            reference = pixels
+        difference = np.abs(pixels - reference)
+        print(f'{name:<10} {vertex_format.stride:>12} {mesh.vertex_bytes:>10} '
+              f'{milliseconds:9.2f} {(difference.max(axis=-1) > 8).mean():11.2%} {difference.mean():10.4f}')
+        batch.delete()
+        mesh.delete()
+
+    texture.delete()
+    shaders.delete()
+    pygame.quit()
+
+def bench_arena(args) -> None:
+    import pygame
+    import pyrr
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE, GL_RASTERIZER_DISCARD,
+        glBindVertexArray, glClear, glDisable, glEnable, glFinish, glUniformMatrix4fv,
+    )
+    from app import APP_FOVY, APP_SIZE
+    from Cube import Mesh
+    from GeometryArena import ArenaBatch, GeometryArena
+    from Headless import save_png
+    from ObjLoader import load_obj_indexed
+    from ShaderRegistry import ShaderRegistry
+    from TransformStore import TransformStore
+
+    open_window(APP_SIZE, args.headless)
+    glEnable(GL_DEPTH_TEST)
+
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
+    instanced_shader = shaders.program(
+        f'{APP_PATH}/shaders/vertex_instanced.vert', f'{APP_PATH}/shaders/fragment.frag'
+    )
+    model_location = shader.uniform('model')
+
+    # The same models once as Meshes with a VAO and buffers each, and once as ranges of a shared arena
+    filenames = [f'{APP_PATH}/models/{name}.obj' for name in args.models]
+    meshes = [Mesh(filename) for filename in filenames]
+    arena = GeometryArena()
+    ranges = [arena.load(filename) for filename in filenames]
+    batch = ArenaBatch(arena, args.objects)
+
+    # Objects take turns between the models, scaled to one size and spread over the view
+    kinds = np.arange(args.objects) % len(meshes)
+    rng = np.random.default_rng(0)
+    depth = rng.uniform(args.near, args.far, args.objects)
+    half_height = math.tan(math.radians(APP_FOVY) / 2)
+    spread = rng.uniform(-0.9, 0.9, (args.objects, 2)) * [half_height * APP_SIZE[0] / APP_SIZE[1], half_height]
+    objects = TransformStore(args.objects)
+    objects.extend(np.column_stack([spread * depth[:, None], -depth]), rng.uniform(0, 360, (args.objects, 3)))
+    objects.update()
+    matrices = objects.matrices[:args.objects].copy()
+    matrices[:, :3, :3] /= np.array([mesh.bounding_radius for mesh in meshes], dtype=np.float32)[kinds, None, None]
+    order = np.argsort(kinds, kind='stable')
+    groups = [matrices[kinds == kind] for kind in range(len(meshes))]
+
+    projection = pyrr.matrix44.create_perspective_projection(
+        fovy=APP_FOVY, aspect=APP_SIZE[0] / APP_SIZE[1], near=0.1, far=2 * args.far, dtype=np.float32
+    )
+    for program in (shader, instanced_shader):
+        program.use()
+        glUniformMatrix4fv(program.uniform('projection'), 1, GL_FALSE, projection)
+
+    # Each path returns its render function with the draw calls and state changes (VAO binds, uniform sets,
+    # buffer uploads) one frame issues
+    def mesh_vaos():
+        # Scene order, every draw binds its mesh's VAO
+        scene = list(zip(matrices, (meshes[kind] for kind in kinds.tolist())))
+        def render():
+            shader.use()
+            for model_transform, mesh in scene:
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                mesh.draw()
+        return render, args.objects, 2 * args.objects
+
+    def mesh_vaos_sorted():
+        # Sorted by mesh, a VAO bind only where the mesh changes
+        scene = [(matrices[index], meshes[kind]) for index, kind in zip(order.tolist(), kinds[order].tolist())]
+        def render():
+            shader.use()
+            bound = None
+            for model_transform, mesh in scene:
+                if mesh is not bound:
+                    glBindVertexArray(mesh.vao)
+                    bound = mesh
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                mesh.draw_bound()
+        return render, args.objects, args.objects + len(meshes)
+
+    def arena_per_object():
+        # One VAO for every model, each object still its own base-vertex draw
+        scene = list(zip(matrices, (ranges[kind] for kind in kinds.tolist())))
+        def render():
+            shader.use()
+            arena.bind()
+            for model_transform, mesh in scene:
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                mesh.draw_bound()
+        return render, args.objects, args.objects + 1
+
+    def arena_multi_draw():
+        # Every object of every model in one indirect multi-draw, matrices and commands uploaded each frame
+        def render():
+            instanced_shader.use()
+            batch.update(list(zip(ranges, groups)))
+            batch.draw()
+        return render, 1 if batch.indirect else len(meshes), 3 if batch.indirect else 2 + 2 * len(meshes)
+
+    def measure(render) -> tuple[float, float]:
+        # CPU milliseconds to submit a frame, and milliseconds until the GPU has finished it.
+        # With --discard nothing is rasterized, which on a software renderer is most of the frame.
+        submit = total = 0.0
+        for frame in range(args.frames + 1):
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            if args.discard:
+                glEnable(GL_RASTERIZER_DISCARD)
+            start = time.perf_counter()
+            render()
+            submitted = time.perf_counter()
+            glFinish()
+            if frame:
+                submit += submitted - start
+                total += time.perf_counter() - start
+        glDisable(GL_RASTERIZER_DISCARD)
+        return submit / args.frames * 1000, total / args.frames * 1000
+
+    print(f'{args.objects} objects of {", ".join(args.models)}, indirect multi-draw '
+          f'{"available" if batch.indirect else "unavailable, one instanced draw per model"}')
+    print(f'{"path":<20} {"draws":>6} {"state":>6} {"submit ms":>10} {"frame ms":>9}')
+    for name, path in (
+        ('mesh VAOs', mesh_vaos),
+        ('mesh VAOs sorted', mesh_vaos_sorted),
+        ('arena per-object', arena_per_object),
+        ('arena multi-draw', arena_multi_draw),
+    ):
+        render, draws, state_changes = path()
+        submit, frame = measure(render)
+        print(f'{name:<20} {draws:>6} {state_changes:>6} {submit:10.2f} {frame:9.2f}')
+        if args.png:
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            render()
+            save_png(f'{args.png}-{name.replace(" ", "-")}.png', APP_SIZE)
+
+    # Allocator churn: load copies of the models, free a random half, load more, and see how scattered the
+    # free space gets before a defragment packs it back together
+    records = [load_obj_indexed(filename) for filename in filenames]
+    churn = GeometryArena(vertex_capacity=args.churn * 1024, index_capacity=args.churn * 4096)
+    live = []
+    start = time.perf_counter()
+    for round in range(4):
+        live += [churn.add(*records[index]) for index in rng.integers(len(records), size=args.churn)]
+        rng.shuffle(live)
+        for mesh in live[len(live) // 2:]:
+            churn.remove(mesh)
+        live = live[:len(live) // 2]
+    churning = time.perf_counter() - start
+    stats = churn.stats()
+    start = time.perf_counter()
+    churn.defragment()
+    glFinish()
+    defragmenting = time.perf_counter() - start
+    print(f'\nchurn of {4 * args.churn} adds and removes in {churning * 1000:.1f} ms, '
+          f'{stats["meshes"]} meshes live, {stats["relocations"]} relocations')
+    print(f'{"":<20} {"vertex KiB":>10} {"capacity":>9} {"frag":>6} {"index KiB":>10} {"capacity":>9} {"frag":>6}')
+    for label, stats in (('before defragment', stats), (f'after, {defragmenting * 1000:.1f} ms', churn.stats())):
+        print(f'{label:<20} {stats["vertex_bytes"] / 1024:10.0f} {stats["vertex_capacity_bytes"] / 1024:9.0f} '
+              f'{stats["vertex_fragmentation"]:6.2f} {stats["index_bytes"] / 1024:10.0f} '
+              f'{stats["index_capacity_bytes"] / 1024:9.0f} {stats["index_fragmentation"]:6.2f}')
+
+    churn.delete()
+    batch.delete()
+    arena.delete()
+    for mesh in meshes:
+        mesh.delete()
+    shaders.delete()
+    pygame.quit()
+
+def _submit_cost(release: bool, args, results) -> None:
+    # Runs in a fresh process, PyOpenGL's error checking is fixed once OpenGL.GL is imported
+    from Headless import use_headless_platform, use_release_mode
+    use_headless_platform()
+    if release:
+        use_release_mode()
+
+    import pygame
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE, GL_RASTERIZER_DISCARD, GL_TEXTURE0,
+        GL_TEXTURE_2D, glActiveTexture, glBindTexture, glBindVertexArray, glClear, glEnable, glFinish,
+        glUniformMatrix4fv, glUseProgram,
+    )
+    from app import APP_SIZE, App
+    from Cube import Mesh
+    from ImageLoader import image_paths
+    from Material import Material
+    from RenderState import RenderState
+    from ShaderRegistry import ShaderRegistry
+
+    open_window(APP_SIZE, True)
+    glEnable(GL_DEPTH_TEST)
+
+    # Only the submission is measured, nothing is rasterized
+    glEnable(GL_RASTERIZER_DISCARD)
+
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
+    model_location = shader.uniform('model')
+    meshes = [Mesh(f'{APP_PATH}/models/{name}.obj') for name in args.models]
+    materials = [Material(filepath) for filepath in image_paths(APP_PATH / 'images')[:args.textures]]
+
+    # Each object sets its program, texture, VAO and model matrix before its draw, as a renderer that knows
+    # nothing about the previous object would. In scene order the mesh and texture change from one object
+    # to the next, sorted they only change between runs of objects.
+    cubes = App.create_cubes(args.objects)
+    cubes.update()
+    matrices = cubes.matrices[:args.objects]
+    rng = np.random.default_rng(0)
+    objects = list(zip(
+        matrices, rng.integers(len(meshes), size=args.objects).tolist(),
+        rng.integers(len(materials), size=args.objects).tolist(),
+    ))
+    sorted_objects = sorted(objects, key=lambda item: (item[2], item[1]))
+
+    def direct(scene):
+        def render():
+            for model_transform, mesh, material in scene:
+                glUseProgram(shader.program)
+                glActiveTexture(GL_TEXTURE0)
+                glBindTexture(GL_TEXTURE_2D, materials[material].texture)
+                glUniformMatrix4fv(model_location, 1, GL_FALSE, model_transform)
+                meshes[mesh].draw()
+        return render
+
+    def tracked(scene, state):
+        def render():
+            for model_transform, mesh, material in scene:
+                shader.use(state)
+                materials[material].use(state)
+                state.uniform(glUniformMatrix4fv, model_location, 1, GL_FALSE, model_transform, track=False)
+                meshes[mesh].draw(state=state)
+        return render
+
+    rows = []
+    for name, scene in (('scene order', objects), ('sorted', sorted_objects)):
+        state = RenderState()
+        for path, render in (('direct', direct(scene)), ('tracked', tracked(scene, state))):
+            submit = math.inf
+            for repeat in range(args.repeat):
+                glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+                state.begin_frame()
+                start = time.perf_counter()
+                render()
+                submit = min(submit, time.perf_counter() - start)
+                glFinish()
+            state.begin_frame()
+            issued, skipped = (state.stats()['issued'], state.stats()['skipped']) if path == 'tracked' else (
+                5 * args.objects, 0
+            )
+            rows.append((name, path, issued, skipped, submit / args.objects * 1e6))
+
+    for mesh in meshes:
+        mesh.delete()
+    for material in materials:
+        material.delete()
+    shaders.delete()
+    pygame.quit()
+    results.put(rows)
+
+def bench_state(args) -> None:
+    import multiprocessing
+
+    # The same submission with PyOpenGL's per-call error checks and in release mode, each in its own process
+    context = multiprocessing.get_context('spawn')
+    print(f'{args.objects} objects, {len(args.models)} meshes and {args.textures} textures, '
+          f'program + texture + model matrix + VAO + draw per object')
+    print(f'{"error checks":<13} {"order":<12} {"path":<8} {"issued":>7} {"skipped":>8} {"us/object":>10}')
+    for release in (False, True):
+        results = context.Queue()
+        process = context.Process(target=_submit_cost, args=(release, args, results))
+        process.start()
+        rows = results.get()
+        process.join()
+        for name, path, issued, skipped, microseconds in rows:
+            print(f'{"off" if release else "on":<13} {name:<12} {path:<8} {issued:>7} {skipped:>8} '
+                  f'{microseconds:10.2f}')
+
+def bench_materials(args) -> None:
+    import pygame
+    import pyrr
+    from OpenGL.GL import (
+        GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_FALSE, GL_RASTERIZER_DISCARD,
+        glClear, glDisable, glEnable, glFinish, glUniformMatrix4fv,
+    )
+    from app import APP_FOVY, APP_SIZE
+    from AssetManager import AssetManager
+    from Cube import Mesh
+    from Headless import read_pixels, save_png
+    from ImageLoader import image_paths
+    from RenderQueue import RenderQueue
+    from RenderState import RenderState
+    from ShaderRegistry import ShaderRegistry
+    from TransformStore import TransformStore
+
+    open_window(APP_SIZE, args.headless)
+    glEnable(GL_DEPTH_TEST)
+
+    shaders = ShaderRegistry()
+    shader = shaders.program(f'{APP_PATH}/shaders/vertex.vert', f'{APP_PATH}/shaders/fragment.frag')
+    assets = AssetManager()
+    default = assets.texture(f'{APP_PATH}/images/me.jpg')
+
+    # Each model with its faces split between materials, loaded into one buffer with a submesh per material
+    directory = tempfile.mkdtemp()
+    images = [str(path) for path in image_paths(APP_PATH / 'images')]
+    meshes, textures = [], []
+    print(f'{"model":<12} {"triangles":>9} {"submeshes":>10}  triangles per material')
+    for name in args.models:
+        filename = write_material_obj(f'{APP_PATH}/models/{name}.obj', directory, args.materials, images)
+        mesh = Mesh(filename, cache=False)
+        meshes.append(mesh)
+        textures.append([
+            assets.texture(mesh.materials[material]['texture']) if material in mesh.materials else default
+            for material, _, _ in mesh.submeshes
+        ])
+        counts = ', '.join(f'{material} {count // 3}' for material, _, count in mesh.submeshes)
+        print(f'{name:<12} {mesh.index_count // 3:>9} {len(mesh.submeshes):>10}  {counts}')
+
+    # Objects take turns between the models, scaled to one size and spread over the view
+    kinds = np.arange(args.objects) % len(meshes)
+    rng = np.random.default_rng(0)
+    depth = rng.uniform(4, 20, args.objects)
+    half_height = math.tan(math.radians(APP_FOVY) / 2)
+    spread = rng.uniform(-0.9, 0.9, (args.objects, 2)) * [half_height * APP_SIZE[0] / APP_SIZE[1], half_height]
+    objects = TransformStore(args.objects)
+    objects.extend(np.column_stack([spread * depth[:, None], -depth]), rng.uniform(0, 360, (args.objects, 3)))
+    objects.update()
+    matrices = objects.matrices[:args.objects].copy()
+    matrices[:, :3, :3] /= np.array([mesh.bounding_radius for mesh in meshes], dtype=np.float32)[kinds, None, None]
+
+    projection = pyrr.matrix44.create_perspective_projection(
+        fovy=APP_FOVY, aspect=APP_SIZE[0] / APP_SIZE[1], near=0.1, far=40, dtype=np.float32
+    )
+    shader.use()
+    glUniformMatrix4fv(shader.uniform('projection'), 1, GL_FALSE, projection)
+
+    # Every path submits through a RenderQueue and RenderState, the counters are what one frame sent to GL
+    def one_texture(queue):
+        # What the loader did before: the whole mesh in one draw with one texture
+        for model_transform, kind in zip(matrices, kinds.tolist()):
+            queue.submit(shader, default, meshes[kind], model_transform)
+
+    def per_material(queue):
+        for model_transform, kind in zip(matrices, kinds.tolist()):
+            for submesh, texture in enumerate(textures[kind]):
+                queue.submit(shader, texture, meshes[kind], model_transform, submesh)
+
+    def measure(submit, queue) -> tuple:
+        # Counters of the last frame, CPU milliseconds to submit a frame and milliseconds until it finished
+        state = RenderState()
+        submit_time = total = 0.0
+        for frame in range(args.frames + 1):
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            if args.discard:
+                glEnable(GL_RASTERIZER_DISCARD)
+            state.begin_frame()
+            start = time.perf_counter()
+            submit(queue)
+            queue.flush(state)
+            submitted = time.perf_counter()
+            glFinish()
+            if frame:
+                submit_time += submitted - start
+                total += time.perf_counter() - start
+        glDisable(GL_RASTERIZER_DISCARD)
+        state.begin_frame()
+        return state.stats(), queue.draws, submit_time / args.frames * 1000, total / args.frames * 1000
+
+    print(f'\n{args.objects} objects, {args.materials} materials per model, {len(images)} textures')
+    print(f'{"path":<12} {"draws":>6} {"programs":>9} {"textures":>9} {"VAOs":>6} {"issued":>7} {"skipped":>8} '
+          f'{"submit ms":>10} {"frame ms":>9}')
+    frames = {}
+    for name, submit, queue in (
+        ('one texture', one_texture, RenderQueue()),
+        ('scene order', per_material, RenderQueue(sort=False)),
+        ('sorted', per_material, RenderQueue()),
+    ):
+        calls, draws, submit_time, frame = measure(submit, queue)
+        kinds_issued = {kind: issued for kind, (issued, _) in calls['kinds'].items()}
+        print(f'{name:<12} {draws:>6} {kinds_issued.get("program", 0):>9} {kinds_issued.get("texture", 0):>9} '
+              f'{kinds_issued.get("vertex array", 0):>6} {calls["issued"]:>7} {calls["skipped"]:>8} '
+              f'{submit_time:10.2f} {frame:9.2f}')
+
+        # One more frame, rasterized, to compare and save
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        submit(queue)
+        queue.flush(RenderState())
+        frames[name] = read_pixels(APP_SIZE).copy()
+        if args.png:
+            save_png(f'{args.png}-{name.replace(" ", "-")}.png', APP_SIZE)
+
+    # Only fragments at exactly equal depth, where objects or faces of different materials meet, depend on order
+    different = np.count_nonzero((frames['scene order'] != frames['sorted']).any(axis=2))
+    print(f'\nsorted frame: {different} of {APP_SIZE[0] * APP_SIZE[1]} pixels differ from the scene order frame')
+
+    for mesh in meshes:
+        mesh.delete()
+    assets.delete()
+    shaders.delete()
+    pygame.quit()
+
+def bench_frames(args) -> None:
+    import random
+    import sys
+    from Headless import frame_time_stats, use_headless_platform, use_release_mode, write_frame_stats
+
+    # Must happen before anything below imports OpenGL
+    use_headless_platform(args.platform)
+    if args.release:
+        use_release_mode()
+    random.seed(0)
+
+    frame_count = args.warmup + args.frames
+    if args.scene == 'cube':
+        from app import App
+        app = App(cube_count=args.cubes, instanced=args.instanced, cull=args.cull,
+                  texture_array=args.texture_array, headless=True, frames=frame_count, screenshot=args.png,
+                  profile_output=args.profile_output, fixed_step=args.fixed_step, model=args.model, lods=args.lods,
+                  vertex_format=args.vertex_format, state_cache=args.state_cache, sort_draws=args.sort_draws)
+    else:
+        sys.path.insert(0, str(APP_PATH / 'playground'))
+        from app_playground import App
+        app = App(headless=True, frames=frame_count, screenshot=args.png, gpu_animation=args.gpu_animation,
+                  sprite_count=args.sprites, fixed_step=args.fixed_step)
+
+    # The first frames pay for lazy driver work such as shader compiles, so they are left out
+    stats = frame_time_stats(app.frame_times[args.warmup:])
+    stats = {'scene': args.scene, 'platform': args.platform, **stats}
+    print(f'{args.scene} scene, {stats["frames"]} frames on {args.platform}')
+    print(f'{"mean":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8} {"FPS":>8}')
+    print(f'{stats["mean_ms"]:8.3f} {stats["p50_ms"]:8.3f} {stats["p95_ms"]:8.3f} {stats["p99_ms"]:8.3f} '
+          f'{stats["max_ms"]:8.3f} {stats["fps"]:8.1f}')
+    if args.scene == 'cube':
+        calls = app.state.stats()
+        print(f'GL state calls in the last frame: {calls["issued"]} issued, {calls["skipped"]} skipped')
+    if args.output:
+        write_frame_stats(args.output, stats)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Performance benchmarks for the playground renderer')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    obj = commands.add_parser('obj', help='OBJ parsing throughput, NumPy parser vs the line-by-line loader')
+    obj.add_argument('--faces', type=int, nargs='*', default=[100_000, 1_000_000, 4_000_000],
+                     help='sizes of the synthetic grid meshes to generate')
+    obj.add_argument('--reference-limit', type=int, default=1_000_000,
+                     help='skip the slow reference loader above this many faces')
+    obj.add_argument('--repeat', type=int, default=3)
+    obj.set_defaults(run=bench_obj)
+
+    indexed = commands.add_parser('indexed', help='vertex memory and ACMR of indexed vs non-indexed meshes')
+    indexed.add_argument('--cache-size', type=int, default=16, help='simulated post-transform cache entries')
+    indexed.set_defaults(run=bench_indexed)
+
+    memory = commands.add_parser('memory', help='peak RSS of the whole-file, NumPy and streaming OBJ loaders')
+    memory.add_argument('--faces', type=int, default=500_000)
+    memory.add_argument('--modes', nargs='*', default=['reference', 'numpy', 'stream'],
+                        choices=['reference', 'numpy', 'stream'])
+    memory.set_defaults(run=bench_memory)
+
+    parallel = commands.add_parser('parallel', help='OBJ parsing scaling from 1 to N worker processes')
+    parallel.add_argument('--faces', type=int, default=2_000_000)
+    parallel.add_argument('--workers', type=int, nargs='*', help='worker counts to try (default: 1 .. CPU count)')
+    parallel.add_argument('--repeat', type=int, default=3)
+    parallel.set_defaults(run=bench_parallel)
+
+    instancing = commands.add_parser('instancing', help='cubes per frame at 60 FPS, per-object vs instanced draws')
+    instancing.add_argument('--frames', type=int, default=30)
+    instancing.add_argument('--max-objects', type=int, default=1 << 20)
+    instancing.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    instancing.set_defaults(run=bench_instancing)
+
+    transforms = commands.add_parser('transforms', help='per-frame CPU time and allocations, pyrr chain vs TransformStore')
+    transforms.add_argument('--objects', type=int, nargs='*', default=[1, 1000, 100_000])
+    transforms.add_argument('--frames', type=int, default=100)
+    transforms.set_defaults(run=bench_transforms)
+
+    culling = commands.add_parser('culling', help='frustum culling counters, cost and frame time with and without it')
+    culling.add_argument('--objects', type=int, nargs='*', default=[1000, 10_000, 100_000])
+    culling.add_argument('--spread', type=float, default=3.0, help='scale applied to the cube cloud positions')
+    culling.add_argument('--frames', type=int, default=10)
+    culling.add_argument('--max-per-object', type=int, default=10_000, help='skip per-object draws above this')
+    culling.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    culling.set_defaults(run=bench_culling)
+
+    assets = commands.add_parser('assets', help='texture reuse and VRAM under a budget with the asset manager')
+    assets.add_argument('--textures', type=int, default=2000)
+    assets.add_argument('--sizes', type=int, nargs='*', default=[64, 128, 256, 512])
+    assets.add_argument('--requests', type=int, default=20_000)
+    assets.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of texture popularity')
+    assets.add_argument('--budgets', type=float, nargs='*', default=[16, 64, 256, 1024], help='VRAM budgets in MB')
+    assets.add_argument('--baseline-requests', type=int, default=2000, help='requests timed without the manager')
+    assets.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    assets.set_defaults(run=bench_assets)
+
+    textures = commands.add_parser('textures', help='frame stalls of synchronous vs background texture loading')
+    textures.add_argument('--copies', type=int, default=1, help='times to load the images/ set')
+    textures.add_argument('--frames', type=int, default=60)
+    textures.add_argument('--workers', type=int, default=2)
+    textures.add_argument('--uploads-per-frame', type=int, nargs='*', default=[1, 4])
+    textures.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    textures.set_defaults(run=bench_textures)
+
+    atlas = commands.add_parser('atlas', help='draw calls and frame time, one texture per image vs one texture array')
+    atlas.add_argument('--objects', type=int, nargs='*', default=[100, 1000, 10_000])
+    atlas.add_argument('--frames', type=int, default=10)
+    atlas.add_argument('--layer-size', type=int, default=2048)
+    atlas.add_argument('--max-per-object', type=int, default=10_000, help='skip per-object draws above this')
+    atlas.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    atlas.set_defaults(run=bench_atlas)
+
+    streaming = commands.add_parser('streaming', help='frame times and resident memory of mip streaming vs full uploads')
+    streaming.add_argument('--images', nargs='*', default=['anthony_wilbur.jpg', 'swirl_texture.jpg'])
+    streaming.add_argument('--copies', type=int, default=4, help='textures made from each image')
+    streaming.add_argument('--frames', type=int, default=60)
+    streaming.add_argument('--budgets', type=float, nargs='*', default=[2, 8], help='upload MB per frame')
+    streaming.add_argument('--screen-sizes', type=float, nargs='*', default=[4096, 512],
+                           help='projected pixels the textures are drawn at')
+    streaming.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    streaming.set_defaults(run=bench_streaming)
+
+    shaders = commands.add_parser('shaders', help='startup time of many shader variants, source vs cached binaries')
+    shaders.add_argument('--variants', type=int, default=64)
+    shaders.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    shaders.set_defaults(run=bench_shaders)
+
+    startup = commands.add_parser('startup', help='cold and warm texture loading, image decode vs baked mip caches')
+    startup.add_argument('--repeat', type=int, default=3, help='runs per path, the fastest is reported')
+    startup.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    startup.set_defaults(run=bench_startup)
+
+    primitives = commands.add_parser('primitives', help='upload bytes and frame time of animated playground rectangles')
+    primitives.add_argument('--primitives', type=int, nargs='*', default=[1000, 5000])
+    primitives.add_argument('--moving', type=float, nargs='*', default=[1.0, 0.1],
+                            help='fraction of the rectangles animated each frame')
+    primitives.add_argument('--frames', type=int, default=30)
+    primitives.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    primitives.set_defaults(run=bench_primitives)
+
+    animation = commands.add_parser('animation', help='frame time of playground animation on the CPU vs in the shader')
+    animation.add_argument('--primitives', type=int, nargs='*', default=[10, 1000, 100_000])
+    animation.add_argument('--frames', type=int, default=10)
+    animation.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    animation.set_defaults(run=bench_animation)
+
+    sprites = commands.add_parser('sprites', help='steps per second of bouncing sprites, per rectangle vs one batch')
+    sprites.add_argument('--sprites', type=int, nargs='*', default=[1000, 10_000, 100_000])
+    sprites.add_argument('--steps', type=int, default=100)
+    sprites.add_argument('--frames', type=int, default=10)
+    sprites.add_argument('--max-per-object', type=int, default=10_000, help='skip per-rectangle steps above this')
+    sprites.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    sprites.set_defaults(run=bench_sprites)
+
+    simulation = commands.add_parser('simulation', help='simulation and render rates, lockstep vs fixed step on a thread')
+    simulation.add_argument('--scene', choices=['cubes', 'sprites'], default='cubes')
+    simulation.add_argument('--objects', type=int, default=100_000)
+    simulation.add_argument('--seconds', type=float, default=3)
+    simulation.add_argument('--step-cost', type=float, default=0, help='extra milliseconds of work per step')
+    simulation.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    simulation.set_defaults(run=bench_simulation)
+
+    lods = commands.add_parser('lods', help='triangles per level of detail and frame time of many distant objects')
+    lods.add_argument('--model', default=f'{APP_PATH}/models/hex_prism.obj')
+    lods.add_argument('--objects', type=int, default=2000)
+    lods.add_argument('--near', type=float, default=10, help='closest object distance in model radii')
+    lods.add_argument('--far', type=float, default=150, help='farthest object distance in model radii')
+    lods.add_argument('--grid-faces', type=int, default=20_000, help='quads of the simplified synthetic grid')
+    lods.add_argument('--frames', type=int, default=10)
+    lods.add_argument('--png', help='save the last frame of each path to files starting with this prefix')
+    lods.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    lods.set_defaults(run=bench_lods)
+
+    formats = commands.add_parser('formats', help='vertex bytes, decode error and frame time of each vertex format')
+    formats.add_argument('--formats', nargs='*', default=['float32', 'float16', 'quantized'])
+    formats.add_argument('--model', default=f'{APP_PATH}/models/hex_prism.obj')
+    formats.add_argument('--objects', type=int, default=2000)
+    formats.add_argument('--near', type=float, default=10, help='closest object distance in model radii')
+    formats.add_argument('--far', type=float, default=150, help='farthest object distance in model radii')
+    formats.add_argument('--grid-faces', type=int, default=20_000, help='quads of the synthetic grid')
+    formats.add_argument('--frames', type=int, default=10)
+    formats.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    formats.set_defaults(run=bench_formats)
+
+    arena = commands.add_parser('arena', help='draw calls, state changes and submit time, Mesh VAOs vs one arena')
+    arena.add_argument('--models', nargs='*', default=['cube', 'sphere', 'hex_prism'])
+    arena.add_argument('--objects', type=int, default=3000)
+    arena.add_argument('--near', type=float, default=10, help='closest object distance in object radii')
+    arena.add_argument('--far', type=float, default=60, help='farthest object distance in object radii')
+    arena.add_argument('--churn', type=int, default=500, help='meshes added per round of the allocator churn')
+    arena.add_argument('--frames', type=int, default=20)
+    arena.add_argument('--discard', action='store_true', help='time frames with rasterization turned off')
+    arena.add_argument('--png', help='save the last frame of each path to files starting with this prefix')
+    arena.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    arena.set_defaults(run=bench_arena)
+
+    state = commands.add_parser('state', help='per-object submit cost with and without the GL state cache')
+    state.add_argument('--objects', type=int, default=2000)
+    state.add_argument('--models', nargs='*', default=['cube', 'sphere', 'hex_prism'])
+    state.add_argument('--textures', type=int, default=4)
+    state.add_argument('--repeat', type=int, default=20, help='frames submitted, the fastest counts')
+    state.set_defaults(run=bench_state)
+
+    materials = commands.add_parser('materials', help='state changes and submit time of multi-material draws, sorted')
+    materials.add_argument('--models', nargs='*', default=['cube', 'sphere', 'hex_prism'])
+    materials.add_argument('--materials', type=int, default=6, help='materials the faces of each model take turns on')
+    materials.add_argument('--objects', type=int, default=1000)
+    materials.add_argument('--frames', type=int, default=20)
+    materials.add_argument('--discard', action='store_true', help='time frames with rasterization turned off')
+    materials.add_argument('--png', help='save the last frame of each path to files starting with this prefix')
+    materials.add_argument('--headless', action='store_true', help='render offscreen through EGL')
+    materials.set_defaults(run=bench_materials)
+
+    frames = commands.add_parser('frames', help='headless fixed-frame render benchmark with frame-time percentiles')
+    frames.add_argument('--scene', choices=['cube', 'playground'], default='cube')
+    frames.add_argument('--platform', choices=['egl', 'osmesa'], default='egl')
+    frames.add_argument('--frames', type=int, default=300)
+    frames.add_argument('--warmup', type=int, default=10, help='frames run before timing starts')
+    frames.add_argument('--cubes', type=int, default=1)
+    frames.add_argument('--instanced', action='store_true')
+    frames.add_argument('--no-cull', dest='cull', action='store_false')
+    frames.add_argument('--texture-array', action='store_true', help='cube scene with every image packed in one array')
+    frames.add_argument('--gpu-animation', action='store_true', help='playground scene animated by its shader')
+    frames.add_argument('--sprites', type=int, default=0, help='playground scene with a swarm of bouncing sprites')
+    frames.add_argument('--fixed-step', action='store_true', help='simulate on a thread at 60 Hz, frames interpolate')
+    frames.add_argument('--model', default=f'{APP_PATH}/models/cube.obj', help='cube scene: OBJ drawn for every cube')
+    frames.add_argument('--lods', action='store_true', help='cube scene: draw each cube at its level of detail')
+    frames.add_argument('--vertex-format', default='float32', help='cube scene: float32, float16 or quantized')
+    frames.add_argument('--no-state-cache', dest='state_cache', action='store_false',
+                        help='cube scene: every GL state call is issued, even if nothing changed')
+    frames.add_argument('--no-sort', dest='sort_draws', action='store_false',
+                        help='cube scene: per-cube draws in scene order instead of sorted by shader, texture and mesh')
+    frames.add_argument('--release', action='store_true', help='turn off PyOpenGL error checking and logging')
+    frames.add_argument('--png', help='save the final frame to this PNG file')
+    frames.add_argument('--output', help='write the statistics to this JSON file')
+    frames.add_argument('--profile-output', help='cube scene only: per-phase profile as .json, .csv or .trace.json')
+    frames.set_defaults(run=bench_frames)
+
+    args = parser.parse_args()
+    if getattr(args, 'headless', False):
+        # Has to happen before the benchmark imports OpenGL
+        from Headless import use_headless_platform
+        use_headless_platform()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
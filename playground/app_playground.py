@@ -1,19 +1,67 @@
 import pygame
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram, compileShader
 import numpy as np
 import time
 import math
 import random
 import ctypes
+import pathlib
+import sys
+
+PLAYGROUND_SIZE = (600, 600)
+PLAYGROUND_PATH = pathlib.Path(__file__).parent.resolve()
+
+# Vertices the shared dynamic buffer holds, every primitive's vertices live in it side by side
+DYNAMIC_BUFFER_CAPACITY = 1024
+
+# Dirty ranges closer than this many bytes are uploaded as one, a vertex is 32 bytes
+DIRTY_MERGE_GAP = 32
+
+# Above this fraction of the buffer dirty, orphaning and uploading everything beats partial updates
+ORPHAN_FRACTION = 0.5
+
+# Floats per vertex attribute: position, colour, texture coordinates
+VERTEX_ATTRIBUTES = (3, 3, 2)
+
+# With the animation on the GPU the colour slot holds each channel's phase, and every vertex also carries
+# its primitive's centre and velocity, then half width, half height and colour speed
+GPU_ANIMATION_ATTRIBUTES = (3, 3, 2, 4, 3)
+
+# The CPU updates move a fixed step per frame, the shader moves the same distance per 1/60 s
+GPU_ANIMATION_FRAME_RATE = 60
+
+# Sprite quad corners relative to the centre in units of its size, and their texture coordinates,
+# in triangle strip order: top-left, bottom-left, top-right, bottom-right
+SPRITE_CORNERS = np.array([(-0.5, 0.5), (-0.5, -0.5), (0.5, 0.5), (0.5, -0.5)], dtype=np.float32)
+SPRITE_TEXCOORDS = np.array([(0.0, 1.0), (0.0, 0.0), (1.0, 1.0), (1.0, 0.0)], dtype=np.float32)
+
+# Shared modules (shader registry, headless context) live in the repository root
+sys.path.insert(0, str(PLAYGROUND_PATH.parent))
+from ShaderRegistry import ShaderRegistry
+from Simulation import FixedStepSimulation
 
 class App:
 
-    def __init__(self) -> None:
+    def __init__(
+        self, headless=False, frames=None, screenshot=None, ring_buffer=True, gpu_animation=False, sprite_count=0,
+        fixed_step=False
+    ) -> None:
         # Initialize pygame
         pygame.init()
-        pygame.display.set_mode((600, 600), pygame.OPENGL | pygame.DOUBLEBUF)
+        if headless:
+            # Offscreen framebuffer on a software GL context, only reachable through the root benchmark.py
+            from Headless import OffscreenContext
+            pygame.display.set_mode((1, 1))
+            self.offscreen = OffscreenContext(PLAYGROUND_SIZE)
+        else:
+            pygame.display.set_mode(PLAYGROUND_SIZE, pygame.OPENGL | pygame.DOUBLEBUF)
+            self.offscreen = None
         self.clock = pygame.time.Clock()
+        
+        # A fixed number of frames runs uncapped and records how long each one took
+        self.frame_limit = frames
+        self.frame_times = []
+        self.screenshot = screenshot
 
         # Initialize OpenGL
         glClearColor(0.1, 0.1, 0.1, 1.0)
@@ -22,40 +70,75 @@ class App:
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         
-        # Load and use shaders from files
-        self.shader = self.create_shader("shaders/vertex.vert", "shaders/fragment.frag")
-        glUseProgram(self.shader)
+        # Load and use shaders from files, compiled once and loaded as a linked binary on later starts.
+        # The GPU animation variant moves and colours the primitives from a time uniform.
+        self.gpu_animation = gpu_animation
+        self.shader_registry = ShaderRegistry()
+        self.shader = self.create_shader(
+            f"{PLAYGROUND_PATH}/shaders/vertex.vert", f"{PLAYGROUND_PATH}/shaders/fragment.frag",
+            {"GPU_ANIMATION": 1} if gpu_animation else None
+        )
+        self.shader.use()
         
         # Set texture unit 0 as active uniform sampler location for texture named 'imageTexture' in fragment shader
-        glUniform1i(glGetUniformLocation(self.shader, "imageTexture"), 0)
-        
-        self.triangle = Triangle()
-        self.rectangle = Rectangle()
+        glUniform1i(self.shader.uniform("imageTexture"), 0)
+        
+        # One vertex buffer for every primitive, uploaded once per frame, or only once at all with GPU animation
+        if gpu_animation:
+            if sprite_count:
+                raise ValueError("sprites are simulated on the CPU, they can't be combined with gpu_animation")
+            if fixed_step:
+                raise ValueError("the shader animates from the time uniform, there is nothing to step with fixed_step")
+            self.vertex_buffer = DynamicVertexBuffer(
+                DYNAMIC_BUFFER_CAPACITY, ring=False, attributes=GPU_ANIMATION_ATTRIBUTES
+            )
+        else:
+            self.vertex_buffer = DynamicVertexBuffer(DYNAMIC_BUFFER_CAPACITY + 4 * sprite_count, ring=ring_buffer)
+        self.triangle = Triangle(self.vertex_buffer, gpu_animation=gpu_animation)
+        self.rectangle = Rectangle(self.vertex_buffer, gpu_animation=gpu_animation)
+        
+        # A swarm of bouncing sprites stepped together, with a count of the corners they and the rectangle hit.
+        # The simulation thread counts into its own total, so neither thread's += can lose the other's hits.
+        self.sprites = SpriteBatch(self.vertex_buffer, sprite_count) if sprite_count else None
+        self.corner_hits = 0
+        self.simulated_corner_hits = 0
+        
+        # Fixed timestep mode: the rectangle and the swarm are stepped 60 times a second on a thread,
+        # frames interpolate their snapshots
+        self.simulation = None
+        if fixed_step:
+            self.simulation = FixedStepSimulation(self.simulate, self.snapshot)
         
         # Load glitch texture
-        self.image_texture = Material("images/middle_finger.jpg")
+        self.image_texture = Material(f"{PLAYGROUND_PATH.parent}/images/middle_finger.jpg")
         
         self.main_loop()
 
-    def create_shader(self, vertex_file_path, fragment_file_path):
-        with open(vertex_file_path, 'r') as f:
-            vertex_src = ''.join(f.readlines())
-            
-        with open(fragment_file_path, 'r') as f:
-            fragment_src = ''.join(f.readlines())
-            
-        shader = compileProgram(
-            compileShader(vertex_src, GL_VERTEX_SHADER),
-            compileShader(fragment_src, GL_FRAGMENT_SHADER)
-        )
-        
-        return shader
+    def create_shader(self, vertex_file_path, fragment_file_path, defines=None):
+        return self.shader_registry.program(vertex_file_path, fragment_file_path, defines)
 
+    def simulate(self, time, dt):
+        # Simulation thread only, the vertices are written by the render thread from the snapshots
+        hits = self.rectangle.update_movement(write=False)
+        if self.sprites:
+            hits += len(self.sprites.step(time, write=False))
+        self.simulated_corner_hits += hits
+        
+    def snapshot(self):
+        return self.rectangle.snapshot(), self.sprites.snapshot() if self.sprites else None
+        
+    def total_corner_hits(self):
+        return self.corner_hits + self.simulated_corner_hits
+        
     def main_loop(self):
         start_time = time.time()
         running = True
+        if self.simulation:
+            self.simulation.start()
 
         while running:
+            # Frame times start before event polling, like the cube scene's
+            frame_start = time.perf_counter()
             current_time = time.time() - start_time
             
             # Check events
@@ -66,72 +149,236 @@ class App:
             # Refresh screen
             glClear(GL_COLOR_BUFFER_BIT)
             
-            # Use shader program and bind VAO for triangle
-            glUseProgram(self.shader)
+            # Use shader program and bind the shared VAO
+            self.shader.use()
             self.image_texture.use()
-            glBindVertexArray(self.rectangle.vao)
+            glBindVertexArray(self.vertex_buffer.vao)
+            
+            if self.gpu_animation:
+                # The vertices never change, the shader works out colour and position from the time
+                glUniform1f(self.shader.uniform("time"), current_time)
+            else:
+                self.rectangle.update_colour(current_time)
             
-            self.rectangle.update_colour(current_time)
-            self.rectangle.update_movement()
+            # self.corner_hits += self.rectangle.dvd_screensaver()
             
-            # self.rectangle.dvd_screensaver()
+            if self.simulation:
+                previous, latest, alpha = self.simulation.sample()
+                self.rectangle.interpolate(previous.state[0], latest.state[0], alpha)
+                if self.sprites:
+                    self.sprites.interpolate(previous.state[1], latest.state[1], alpha)
+            else:
+                if not self.gpu_animation:
+                    self.corner_hits += self.rectangle.update_movement()
+                if self.sprites:
+                    self.corner_hits += len(self.sprites.step(current_time))
             
-            # Draw triangle using currently bound shader and VAO
-            glDrawArrays(GL_TRIANGLE_STRIP, 0, self.rectangle.vertex_count)
+            # Everything the updates changed goes to the GPU in one go, before any draw reads it
+            self.vertex_buffer.flush()
             
-            pygame.display.flip()
+            # Draw rectangle using currently bound shader and VAO
+            self.rectangle.draw()
+            if self.sprites:
+                self.sprites.draw()
+            
+            if self.offscreen:
+                # Nothing to present, wait for the frame so its time includes the rendering
+                glFinish()
+            else:
+                pygame.display.flip()
 
             # Timing
-            self.clock.tick(360)
+            if self.frame_limit is None:
+                self.clock.tick(360)
+            else:
+                self.frame_times.append(time.perf_counter() - frame_start)
+                running = running and len(self.frame_times) < self.frame_limit
+        
+        if self.screenshot:
+            from Headless import save_png
+            save_png(self.screenshot, PLAYGROUND_SIZE)
 
         self.quit()
 
     def quit(self):
-        self.triangle.delete()
-        self.rectangle.delete()
+        if self.simulation:
+            self.simulation.stop()
+        self.vertex_buffer.delete()
         self.image_texture.delete()
-        glDeleteProgram(self.shader)
+        self.shader_registry.delete()
+        if self.offscreen:
+            self.offscreen.delete()
         pygame.quit()
 
-class Triangle:
+def merge_ranges(ranges, gap=DIRTY_MERGE_GAP):
+    # Sorted (start, stop) ranges with overlapping and nearly touching ones joined
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [(start, stop) for start, stop in merged]
+
+class DynamicVertexBuffer:
     
-    def __init__(self) -> None:
-        self.vertex_count = 3
-        
-        # convert to type readable by graphics card
-        # x, y, z, r, g, b, s, t
-        self.vertices = np.array([
-             0.0,   0.25, 0.0, 0.0, 0.0, 1.0, 0.5, 0.0,
-            -0.25, -0.25, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0,
-             0.25, -0.25, 0.0, 0.0, 1.0, 0.0, 1.0, 1.0
-        ], dtype = np.float32)
+    def __init__(self, capacity, ring=True, segments=3, attributes=VERTEX_ATTRIBUTES) -> None:
+        # CPU copy of every vertex (x, y, z, r, g, b, s, t by default), primitives write into their slice of it
+        self.attributes = attributes
+        self.vertex_stride = sum(attributes)
+        self.capacity = capacity
+        self.vertices = np.zeros(capacity * self.vertex_stride, dtype=np.float32)
+        self.vertex_count = 0
+        
+        # Byte ranges written since the last flush, and what the last flush sent
+        self.dirty = []
+        self.uploaded_bytes = 0
+        self.upload_calls = 0
+        
+        # A persistently mapped ring needs buffer storage (GL 4.4), without it the buffer is orphaned instead
+        self.ring = ring and bool(glBufferStorage)
+        self.segments = segments if self.ring else 1
+        self.segment = 0
+        
+        # Added to every draw's first vertex, the ring segment the GPU reads this frame
+        self.base_vertex = 0
         
-        self.vertex_stride = 8
-        
-        # create VAO and VBO and binds them
         self.vao = glGenVertexArrays(1)
         glBindVertexArray(self.vao)
         self.vbo = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         
-        # send the buffer vertex data to the VBO
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
-        
-        # set up position attribute
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-        
-        # set up colour attribute
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
+        if self.ring:
+            # Mapped once for the buffer's lifetime, coherent so written bytes need no explicit flush
+            flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+            size = self.segments * self.vertices.nbytes
+            glBufferStorage(GL_ARRAY_BUFFER, size, None, flags)
+            pointer = glMapBufferRange(GL_ARRAY_BUFFER, 0, size, flags)
+            self.mapped = np.ctypeslib.as_array(
+                ctypes.cast(pointer, ctypes.POINTER(ctypes.c_float)), shape=(self.segments, len(self.vertices))
+            )
+            
+            # Per segment: the fence of the last frame that drew from it, and the ranges it is behind on
+            self.fences = [None] * self.segments
+            self.stale = [[] for _ in range(self.segments)]
+        else:
+            glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, None, GL_STREAM_DRAW)
+        
+        # set up position, colour and texture attributes, then any extra ones at the following locations
+        offset = 0
+        for location, size in enumerate(attributes):
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, self.vertex_stride * 4, ctypes.c_void_p(offset))
+            offset += size * 4
+        
+    def allocate(self, vertices):
+        # Copies a primitive's initial vertices in, returns its first vertex and a view to update them through
+        count = len(vertices) // self.vertex_stride
+        if self.vertex_count + count > self.capacity:
+            raise ValueError(f"dynamic vertex buffer full: {self.capacity} vertices")
+        first = self.vertex_count
+        self.vertex_count += count
+        
+        view = self.vertices[first * self.vertex_stride : self.vertex_count * self.vertex_stride]
+        view[:] = vertices
+        self.mark_dirty(first * self.vertex_stride * 4, self.vertex_count * self.vertex_stride * 4)
+        return first, view
+        
+    def mark_dirty(self, start, stop):
+        # Byte range of self.vertices that changed, nothing is uploaded until flush
+        self.dirty.append((start, stop))
+        
+    def flush(self):
+        # Called once per frame after all updates and before the draws, returns the bytes uploaded
+        ranges = merge_ranges(self.dirty)
+        self.dirty.clear()
+        self.uploaded_bytes = 0
+        self.upload_calls = 0
+        
+        if self.ring:
+            self.flush_ring(ranges)
+        elif ranges:
+            self.flush_orphan(ranges)
+        return self.uploaded_bytes
+        
+    def flush_orphan(self, ranges):
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        used = self.vertex_count * self.vertex_stride * 4
+        if sum(stop - start for start, stop in ranges) > used * ORPHAN_FRACTION:
+            # Orphan: the driver hands out fresh storage instead of waiting for draws still reading the old one
+            glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, None, GL_STREAM_DRAW)
+            ranges = [(0, used)]
+        for start, stop in ranges:
+            glBufferSubData(GL_ARRAY_BUFFER, start, stop - start, self.vertices[start // 4 : stop // 4])
+            self.uploaded_bytes += stop - start
+            self.upload_calls += 1
+        
+    def flush_ring(self, ranges):
+        # Every segment misses this frame's changes until it is written next
+        for index in range(self.segments):
+            self.stale[index] = merge_ranges(self.stale[index] + ranges)
+        
+        # Fence the segment last frame's draws read, then move on to the oldest one
+        self.fences[self.segment] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.segment = (self.segment + 1) % self.segments
+        fence = self.fences[self.segment]
+        if fence is not None:
+            # Only blocks if the GPU is more than segments - 1 frames behind
+            while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1_000_000_000) == GL_TIMEOUT_EXPIRED:
+                pass
+            glDeleteSync(fence)
+            self.fences[self.segment] = None
+        
+        # Bring the segment up to date by copying only what changed since it was last written
+        segment = self.mapped[self.segment]
+        for start, stop in self.stale[self.segment]:
+            segment[start // 4 : stop // 4] = self.vertices[start // 4 : stop // 4]
+            self.uploaded_bytes += stop - start
+            self.upload_calls += 1
+        self.stale[self.segment] = []
+        self.base_vertex = self.segment * self.capacity
         
-        # set up texture attribute
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(24))
+    def delete(self):
+        if self.ring:
+            for fence in self.fences:
+                if fence is not None:
+                    glDeleteSync(fence)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            glUnmapBuffer(GL_ARRAY_BUFFER)
+            self.mapped = None
+        glDeleteVertexArrays(1, (self.vao, ))
+        glDeleteBuffers(1, (self.vbo, ))
+
+class Triangle:
+    
+    def __init__(self, buffer, gpu_animation=False) -> None:
+        self.vertex_count = 3
+        self.vertex_stride = buffer.vertex_stride
+        self.colour_speed = 4
         
         self.movement_direction = 1
         self.movement_angle = (random.randrange(0.0, 1.0), random.randrange(0.0, 1.0))
         
+        # convert to type readable by graphics card
+        # x, y, z, r, g, b, s, t
+        vertices = np.array([
+             0.0,   0.25, 0.0, 0.0, 0.0, 1.0, 0.5, 0.0,
+            -0.25, -0.25, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0,
+             0.25, -0.25, 0.0, 0.0, 1.0, 0.0, 1.0, 1.0
+        ], dtype = np.float32).reshape(3, 8)
+        
+        if gpu_animation:
+            # Each vertex's colour phases as in update_colour, then the motion update_movement would make
+            vertices[:, 3:6] = np.array([(0, 2, 4), (2, 4, 0), (4, 0, 2)]) * math.pi / 3
+            velocity = 0.001 * GPU_ANIMATION_FRAME_RATE * (self.movement_direction + np.array(self.movement_angle))
+            animation = [0.0, 0.0, *velocity, 0.25, 0.25, self.colour_speed]
+            vertices = np.hstack([vertices, np.tile(np.array(animation, dtype=np.float32), (3, 1))])
+        
+        # the vertices live in the shared dynamic buffer, self.vertices is this triangle's view of them
+        self.buffer = buffer
+        self.first, self.vertices = buffer.allocate(vertices.ravel())
+        self.offset = self.first * self.vertex_stride * 4
+        
     def update_movement(self):
         movement_speed = 0.001
         
@@ -147,10 +394,12 @@ class Triangle:
             self.vertices[2 * self.vertex_stride + 0] >= 1.0 or self.vertices[2 * self.vertex_stride + 0] <= -1.0 or
             self.vertices[2 * self.vertex_stride + 1] >= 1.0 or self.vertices[2 * self.vertex_stride + 1] <= -1.0
         ):
-            print(self.movement_angle)
             self.movement_direction *= -1
             self.movement_angle = (random.uniform(0.0, 0.2), random.uniform(0.0, 0.2))
         
+        # Positions of all three vertices changed
+        self.mark_dirty(0, 3, 0, 2)
+        
         # Update vertex positions to move in a circle
         # self.vertices[0 * self.vertex_stride + 0] = math.sin(position_speed * time + 1.0) * radius - 0.75
         # self.vertices[0 * self.vertex_stride + 1] = math.cos(position_speed * time + 1.0) * radius - 0.75
@@ -161,7 +410,7 @@ class Triangle:
         
         
     def update_colour(self, time):        
-        colour_speed = 4
+        colour_speed = self.colour_speed
         brightness = 1
         
         # Update colors to cycle through RGB smoothly
@@ -181,53 +430,57 @@ class Triangle:
             brightness * (0.5 * math.sin(colour_speed * time + 2 * math.pi / 3)+ 0.5)
         )
         
-        # Update the VBO with the new vertex data
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_DYNAMIC_DRAW)
+        # Only the colours changed, the buffer uploads them with everything else at the next flush
+        self.mark_dirty(0, 3, 3, 6)
         
-    def delete(self):
-        # delete VAO and VBO
-        glDeleteVertexArrays(1, (self.vao, ))
-        glDeleteBuffers(1, (self.vbo, ))
+    def mark_dirty(self, first_vertex, last_vertex, first_float, last_float):
+        # Floats first_float up to last_float of these vertices, as bytes of the shared buffer
+        start = self.offset + (first_vertex * self.vertex_stride + first_float) * 4
+        stop = self.offset + ((last_vertex - 1) * self.vertex_stride + last_float) * 4
+        self.buffer.mark_dirty(start, stop)
+        
+    def draw(self):
+        glDrawArrays(GL_TRIANGLES, self.buffer.base_vertex + self.first, self.vertex_count)
 
 class Rectangle:
     
-    def __init__(self) -> None:
+    def __init__(self, buffer, center=(0.0, 0.0), size=(0.5, 0.5), gpu_animation=False) -> None:
         self.vertex_count = 4  # Rectangles have four vertices
+        self.vertex_stride = buffer.vertex_stride
+        self.colour_speed = 4
+        self.movement_speed = 0.01
         
-        # Vertices array for a rectangle (x, y, z, r, g, b, s, t)
-        self.vertices = np.array([
-             -0.25,  0.25, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0,  # Top-left
-             -0.25, -0.25, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0,  # Bottom-left
-              0.25, -0.25, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0,  # Bottom-right
-              0.25,  0.25, 0.0, 1.0, 1.0, 0.0, 1.0, 1.0,  # Top-right
-        ], dtype=np.float32)
-        
-        self.vertex_stride = 8
-        
-        # Create and bind VAO and VBO
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-        self.vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
-        
-        # Set up vertex attributes
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(24))
-        
-        self.center = np.array([0.0, 0.0])  # Initial center of the rectangle
-        self.width = 0.5
-        self.height = 0.5
+        self.center = np.array(center, dtype=float)  # Initial center of the rectangle
+        self.width, self.height = size
         self.movement_direction = np.array([random.uniform(-1, 1), random.uniform(-1, 1)])
         self.movement_direction /= np.linalg.norm(self.movement_direction)  # Normalize the direction vector
         self.precision = 2  # Default precision: 1 decimal place
         
         self.velocity = np.array([0.005, 0.005])
+        
+        # Vertices array for a rectangle (x, y, z, r, g, b, s, t)
+        corners = np.array([(-0.5, 0.5), (-0.5, -0.5), (0.5, -0.5), (0.5, 0.5)]) * size  # TL, BL, BR, TR
+        vertices = np.array([
+            [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0],  # Top-left
+            [0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0],  # Bottom-left
+            [0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0],  # Bottom-right
+            [0.0, 0.0, 0.0, 1.0, 1.0, 0.0, 1.0, 1.0],  # Top-right
+        ], dtype=np.float32)
+        
+        if gpu_animation:
+            # Corners relative to the centre and colour phases as in update_colour, the shader does the rest
+            vertices[:, 0:2] = corners
+            vertices[:, 3:6] = (np.arange(4)[:, None] + np.arange(3)) * math.pi / 3
+            velocity = self.movement_direction * self.movement_speed * GPU_ANIMATION_FRAME_RATE
+            animation = [*self.center, *velocity, self.width / 2, self.height / 2, self.colour_speed]
+            vertices = np.hstack([vertices, np.tile(np.array(animation, dtype=np.float32), (4, 1))])
+        else:
+            vertices[:, 0:2] = corners + self.center
+        
+        # kept in the shared dynamic buffer, self.vertices is this rectangle's view of it
+        self.buffer = buffer
+        self.first, self.vertices = buffer.allocate(vertices.ravel())
+        self.offset = self.first * self.vertex_stride * 4
 
     def update_color(self):
         t = time.time()
@@ -236,12 +489,15 @@ class Rectangle:
             self.vertices[idx:idx+3] = (0.5 * np.sin(t + (i + 0) * np.pi / 3) + 0.5,
                                         0.5 * np.sin(t + (i + 1) * np.pi / 3) + 0.5,
                                         0.5 * np.sin(t + (i + 2) * np.pi / 3) + 0.5)
+        self.mark_dirty(0, 4, 3, 6)
 
     def dvd_screensaver(self):
+        # Returns 1 if this step hit a corner, counted like SpriteBatch.step's corners instead of printed every frame
         # Update position of vertices
         for i in range(4):
             self.vertices[i * self.vertex_stride] += self.velocity[0]
             self.vertices[i * self.vertex_stride + 1] += self.velocity[1]
+        self.mark_dirty(0, 4, 0, 2)
         
         # Collision detection and response
         min_x = min(self.vertices[i * self.vertex_stride] for i in range(4))
@@ -249,21 +505,21 @@ class Rectangle:
         min_y = min(self.vertices[i * self.vertex_stride + 1] for i in range(4))
         max_y = max(self.vertices[i * self.vertex_stride + 1] for i in range(4))
 
-        if min_x <= -1 or max_x >= 1:
+        hit_horizontal = min_x <= -1 or max_x >= 1
+        hit_vertical = min_y <= -1 or max_y >= 1
+        if hit_horizontal:
             self.velocity[0] *= -1
             self.update_color()
-            if min_x <= -1 and min_y <= -1 or max_x >= 1 and max_y >= 1:
-                print("Corner hit!")
 
-        if min_y <= -1 or max_y >= 1:
+        if hit_vertical:
             self.velocity[1] *= -1
             self.update_color()
-            if min_y <= -1 and min_x <= -1 or max_y >= 1 and max_x >= 1:
-                print("Corner hit!")
+        return int(hit_horizontal and hit_vertical)
         
     #! yeah this doesn't really work 100% lol please fix
-    def update_movement(self):
-        movement_speed = 0.01
+    def update_movement(self, write=True):
+        # Returns 1 if this step hit a corner, like dvd_screensaver. Without write only the centre moves.
+        movement_speed = self.movement_speed
         
         # Move the rectangle
         self.center += self.movement_direction * movement_speed
@@ -291,36 +547,45 @@ class Rectangle:
         if hit_horizontal or hit_vertical:
             self.movement_direction /= np.linalg.norm(self.movement_direction)
             self.movement_direction = np.round(self.movement_direction, self.precision)
-            print(f"[{self.movement_direction[0]}, {self.movement_direction[1]}]")  # Formatted output
-        
-        # Check if hit the corner
-        if hit_horizontal and hit_vertical:
-            print("Hit corner!")
 
+        if write:
+            self.write_positions()
+        return int(hit_horizontal and hit_vertical)
+        
+    def snapshot(self):
+        # Copy of the centre, for drawing while the next step runs
+        return self.center.copy()
+        
+    def interpolate(self, previous, latest, alpha):
+        self.write_positions(previous + alpha * (latest - previous))
+        
+    def write_positions(self, center=None):
+        # Corners around the current centre, or around one blended between two snapshots
+        center = self.center if center is None else center
+        
         # Update vertices based on the new center
         # Top-left vertex
         self.vertices[0 * self.vertex_stride : 0 * self.vertex_stride + 3] = [
-            self.center[0] - self.width / 2, self.center[1] + self.height / 2, 0.0
+            center[0] - self.width / 2, center[1] + self.height / 2, 0.0
         ]
         # Bottom-left vertex
         self.vertices[1 * self.vertex_stride : 1 * self.vertex_stride + 3] = [
-            self.center[0] - self.width / 2, self.center[1] - self.height / 2, 0.0
+            center[0] - self.width / 2, center[1] - self.height / 2, 0.0
         ]
         # Bottom-right vertex
         self.vertices[2 * self.vertex_stride : 2 * self.vertex_stride + 3] = [
-            self.center[0] + self.width / 2, self.center[1] - self.height / 2, 0.0
+            center[0] + self.width / 2, center[1] - self.height / 2, 0.0
         ]
         # Top-right vertex
         self.vertices[3 * self.vertex_stride : 3 * self.vertex_stride + 3] = [
-            self.center[0] + self.width / 2, self.center[1] + self.height / 2, 0.0
+            center[0] + self.width / 2, center[1] + self.height / 2, 0.0
         ]
 
-        # Update the vertex buffer with the new positions
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferSubData(GL_ARRAY_BUFFER, 0, self.vertices.nbytes, self.vertices)
+        # Only the positions changed, uploaded with the rest of the frame's changes at the next flush
+        self.mark_dirty(0, 4, 0, 3)
         
     def update_colour(self, time):        
-        colour_speed = 4
+        colour_speed = self.colour_speed
         brightness = 1
         # Update colors cycling through RGB smoothly for all vertices
         for i in range(4):
@@ -329,15 +594,86 @@ class Rectangle:
                 brightness * (0.5 * math.sin(colour_speed * time + (i+1) * math.pi / 3)+ 0.5),
                 brightness * (0.5 * math.sin(colour_speed * time + (i+2) * math.pi / 3)+ 0.5)
             )
-        # Update the VBO with the new vertex data
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_DYNAMIC_DRAW)
+        # Only the colours changed
+        self.mark_dirty(0, 4, 3, 6)
         
-    def delete(self):
-        # Delete VAO and VBO
-        glDeleteVertexArrays(1, (self.vao,))
-        glDeleteBuffers(1, (self.vbo,))
+    def mark_dirty(self, first_vertex, last_vertex, first_float, last_float):
+        # Floats first_float up to last_float of these vertices, as bytes of the shared buffer
+        start = self.offset + (first_vertex * self.vertex_stride + first_float) * 4
+        stop = self.offset + ((last_vertex - 1) * self.vertex_stride + last_float) * 4
+        self.buffer.mark_dirty(start, stop)
+        
+    def draw(self):
+        glDrawArrays(GL_TRIANGLE_STRIP, self.buffer.base_vertex + self.first, self.vertex_count)
         
+class SpriteBatch:
+    
+    def __init__(self, buffer, count, size=(0.1, 0.1), speed=0.005, seed=None) -> None:
+        # Every sprite is one row of these arrays, so the whole swarm moves and collides in a few NumPy operations
+        rng = np.random.default_rng(seed)
+        self.count = count
+        self.sizes = np.tile(np.array(size, dtype=np.float32), (count, 1))
+        self.centers = rng.uniform(self.sizes / 2 - 1.0, 1.0 - self.sizes / 2).astype(np.float32)
+        self.velocities = (speed * rng.choice((-1.0, 1.0), (count, 2))).astype(np.float32)
+        self.colours = rng.uniform(0.0, 1.0, (count, 3)).astype(np.float32)
+        
+        # Sprites that hit a wall in the last step, either axis
+        self.bounced = np.zeros(count, dtype=bool)
+        
+        # Four vertices per sprite in the shared buffer, texture coordinates never change
+        self.vertex_count = 4
+        self.vertex_stride = buffer.vertex_stride
+        vertices = np.zeros((count, 4, self.vertex_stride), dtype=np.float32)
+        vertices[:, :, 6:8] = SPRITE_TEXCOORDS
+        self.buffer = buffer
+        self.first, view = buffer.allocate(vertices.ravel())
+        self.vertices = view.reshape(count, 4, self.vertex_stride)
+        
+        # Every sprite is its own strip, all of them drawn with one glMultiDrawArrays
+        self.firsts = self.first + 4 * np.arange(count, dtype=np.int32)
+        self.counts = np.full(count, 4, dtype=np.int32)
+        self.write_vertices()
+        
+    def step(self, time, write=True):
+        # Move every sprite, bounce the ones past a wall and return the indices of those that hit a corner
+        self.centers += self.velocities
+        half = self.sizes / 2
+        hits = (self.centers - half <= -1.0) | (self.centers + half >= 1.0)
+        self.velocities[hits] *= -1
+        
+        # Sprites that overshot are put back against the wall, so they can't stay outside and bounce again
+        np.clip(self.centers, half - 1.0, 1.0 - half, out=self.centers)
+        
+        # A bounce changes the colour like dvd_screensaver does, a corner is both walls in the same step
+        self.bounced = hits.any(axis=1)
+        self.colours[self.bounced] = 0.5 * np.sin(time + np.arange(3) * math.pi / 3) + 0.5
+        corners = np.flatnonzero(hits.all(axis=1))
+        
+        if write:
+            self.write_vertices()
+        return corners
+        
+    def snapshot(self):
+        # Copies of what the vertices are made from, for drawing while the next step runs
+        return self.centers.copy(), self.colours.copy()
+        
+    def interpolate(self, previous, latest, alpha):
+        # Centres blended between two snapshots, colours switch at the later one
+        centers = previous[0] + alpha * (latest[0] - previous[0])
+        self.write_vertices(centers, latest[1])
+        
+    def write_vertices(self, centers=None, colours=None):
+        # Positions and colours of the whole swarm, one dirty range for the buffer
+        centers = self.centers if centers is None else centers
+        colours = self.colours if colours is None else colours
+        self.vertices[:, :, 0:2] = centers[:, None, :] + SPRITE_CORNERS * self.sizes[:, None, :]
+        self.vertices[:, :, 3:6] = colours[:, None, :]
+        start = self.first * self.vertex_stride * 4
+        self.buffer.mark_dirty(start, start + self.vertices.nbytes)
+        
+    def draw(self):
+        glMultiDrawArrays(GL_TRIANGLE_STRIP, self.firsts + self.buffer.base_vertex, self.counts, self.count)
+
 class Material:
     
     def __init__(self, filepath) -> None:
@@ -7,8 +7,31 @@ layout (location = 2) in vec2 vertexTexCoord;
 out vec3 fragmentColor;
 out vec2 fragmentTexCoord;
 
+#ifdef GPU_ANIMATION
+// Per-primitive constants, repeated on each of its vertices: centre and velocity, then half size and colour speed.
+// vertexPos is relative to the centre and vertexColor holds each channel's phase.
+layout (location = 3) in vec4 primitiveMotion;
+layout (location = 4) in vec3 primitiveShape;
+
+uniform float time;
+
+// Where a point moving at constant velocity has got to after bouncing between low and high, a triangle wave
+vec2 bounce(vec2 start, vec2 velocity, vec2 low, vec2 high) {
+    vec2 span = high - low;
+    vec2 travelled = mod(start - low + velocity * time, 2.0 * span);
+    return low + span - abs(travelled - span);
+}
+#endif
+
 void main() {
+#ifdef GPU_ANIMATION
+    vec2 halfSize = primitiveShape.xy;
+    vec2 centre = bounce(primitiveMotion.xy, primitiveMotion.zw, halfSize - 1.0, 1.0 - halfSize);
+    gl_Position = vec4(vertexPos.xy + centre, vertexPos.z, 1.0);
+    fragmentColor = 0.5 * sin(primitiveShape.z * time + vertexColor) + 0.5;
+#else
     gl_Position = vec4(vertexPos, 1.0);
     fragmentColor = vertexColor;
+#endif
     fragmentTexCoord = vertexTexCoord;
 }
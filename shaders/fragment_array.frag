@@ -0,0 +1,11 @@
+#version 330 core
+
+in vec3 fragmentTexCoord;
+
+uniform sampler2DArray imageTextures;
+
+out vec4 color;
+
+void main() {
+    color = texture(imageTextures, fragmentTexCoord);
+}
@@ -0,0 +1,18 @@
+#version 330 core
+
+layout (location = 0) in vec3 vertexPos;
+layout (location = 1) in vec2 vertexTexCoord;
+layout (location = 2) in mat4 instanceModel;
+layout (location = 6) in vec4 instanceTexRect;
+layout (location = 7) in float instanceTexLayer;
+
+uniform mat4 projection;
+
+out vec3 fragmentTexCoord;
+
+void main() {
+    gl_Position = projection * instanceModel * vec4(vertexPos, 1.0);
+    
+    // The mesh's 0..1 coordinates land in this instance's image inside the texture array
+    fragmentTexCoord = vec3(instanceTexRect.xy + vertexTexCoord * instanceTexRect.zw, instanceTexLayer);
+}
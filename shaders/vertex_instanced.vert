@@ -0,0 +1,14 @@
+#version 330 core
+
+layout (location = 0) in vec3 vertexPos;
+layout (location = 1) in vec2 vertexTexCoord;
+layout (location = 2) in mat4 instanceModel;
+
+uniform mat4 projection;
+
+out vec2 fragmentTexCoord;
+
+void main() {
+    gl_Position = projection * instanceModel * vec4(vertexPos, 1.0);
+    fragmentTexCoord = vertexTexCoord;
+}
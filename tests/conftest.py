@@ -0,0 +1,28 @@
+import pathlib
+import sys
+
+import pytest
+
+# The modules live at the repository root, not in a package
+APP_PATH = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(APP_PATH))
+
+@pytest.fixture(scope='session')
+def gl_context():
+    # One offscreen EGL context for every test that needs GL, skipped where there is none
+    from Headless import use_headless_platform
+    use_headless_platform()
+
+    import pygame
+    from Headless import OffscreenContext
+
+    pygame.init()
+    try:
+        pygame.display.set_mode((1, 1))
+        context = OffscreenContext((64, 64))
+    except Exception as exception:
+        pygame.quit()
+        pytest.skip(f'no offscreen GL context: {exception}')
+    yield context
+    context.delete()
+    pygame.quit()
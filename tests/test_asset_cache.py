@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+
+def test_touched_source_returns_copies_and_refreshes_the_stamp(tmp_path):
+    from AssetCache import read_cache, read_cache_header, write_cache
+
+    source = tmp_path / 'source.bin'
+    source.write_bytes(b'unchanged')
+    path = str(tmp_path / 'source.bin.cache')
+    write_cache(path, str(source), 'test', {}, {'values': np.arange(16, dtype=np.float32)})
+
+    # Same content, newer mtime
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    _, arrays = read_cache(path, str(source), 'test')
+    assert not isinstance(arrays['values'], np.memmap)
+    assert np.array_equal(arrays['values'], np.arange(16))
+    assert read_cache_header(path)['source']['mtime_ns'] == stat.st_mtime_ns + 10**9
+
+    _, arrays = read_cache(path, str(source), 'test')
+    assert isinstance(arrays['values'], np.memmap)
+
+def test_edit_during_bake_leaves_the_cache_stale(tmp_path, monkeypatch):
+    import AssetCache
+
+    source = tmp_path / 'image.png'
+    source.write_bytes(b'before')
+
+    def decode_while_editing(filename):
+        source.write_bytes(b'after the bake started')
+        return [np.zeros((2, 2, 4), dtype=np.uint8)]
+    monkeypatch.setattr(AssetCache, 'decode_texture', decode_while_editing)
+    AssetCache.bake_texture(str(source))
+
+    path = AssetCache.cache_path(str(source), AssetCache.TEXTURE_CACHE_SUFFIX)
+    assert os.path.exists(path)
+    assert AssetCache.read_cache(path, str(source), AssetCache.TEXTURE_CACHE_KIND) is None
@@ -0,0 +1,46 @@
+import numpy as np
+
+def vertex_records(count: int, value: float) -> np.ndarray:
+    return np.full((count, 8), value, dtype=np.float32)
+
+def read_vertices(arena, mesh) -> np.ndarray:
+    from OpenGL.GL import GL_COPY_READ_BUFFER, glBindBuffer, glGetBufferSubData
+
+    glBindBuffer(GL_COPY_READ_BUFFER, arena.vbo)
+    stride = arena.vertex_format.stride
+    data = glGetBufferSubData(GL_COPY_READ_BUFFER, mesh.first_vertex * stride, mesh.vertex_count * stride)
+    return np.frombuffer(bytes(data), dtype=np.float32).reshape(-1, 8)
+
+def test_relocation_while_adding_keeps_both_ranges(gl_context):
+    from GeometryArena import GeometryArena
+
+    # The vertex range of D fits in the hole A leaves, its index range only fits after packing
+    arena = GeometryArena(vertex_capacity=100, index_capacity=100)
+    a = arena.add(vertex_records(10, 1.0), np.arange(30))
+    b = arena.add(vertex_records(10, 2.0), np.arange(30))
+    c = arena.add(vertex_records(10, 3.0), np.arange(30))
+    arena.remove(a)
+    d = arena.add(vertex_records(10, 4.0), np.arange(40))
+
+    assert arena.relocations == 1
+    assert (read_vertices(arena, b) == 2.0).all()
+    assert (read_vertices(arena, c) == 3.0).all()
+    assert (read_vertices(arena, d) == 4.0).all()
+    vertex_ranges = sorted((mesh.first_vertex, mesh.first_vertex + mesh.vertex_count) for mesh in (b, c, d))
+    index_ranges = sorted((mesh.first_index, mesh.first_index + mesh.index_count) for mesh in (b, c, d))
+    for ranges in (vertex_ranges, index_ranges):
+        assert all(end <= start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    arena.delete()
+
+def test_growth_while_adding_keeps_both_ranges(gl_context):
+    from GeometryArena import GeometryArena
+
+    arena = GeometryArena(vertex_capacity=16, index_capacity=16)
+    a = arena.add(vertex_records(8, 1.0), np.arange(12))
+    b = arena.add(vertex_records(8, 2.0), np.arange(24))
+
+    assert arena.index_ranges.capacity >= 36
+    assert (read_vertices(arena, a) == 1.0).all()
+    assert (read_vertices(arena, b) == 2.0).all()
+    assert a.first_vertex != b.first_vertex
+    arena.delete()
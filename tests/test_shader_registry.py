@@ -0,0 +1,42 @@
+import os
+import pathlib
+
+import pytest
+
+SHADERS = pathlib.Path(__file__).parent.parent.resolve() / 'shaders'
+
+def compile_default(registry):
+    return registry.program(str(SHADERS / 'vertex.vert'), str(SHADERS / 'fragment.frag'))
+
+def test_failed_save_leaves_no_temporary_file(gl_context, tmp_path, monkeypatch):
+    from ShaderRegistry import ShaderRegistry
+
+    registry = ShaderRegistry(tmp_path)
+    if not registry.persist:
+        pytest.skip('driver exposes no program binary formats')
+
+    def fail(source, destination):
+        raise OSError('read-only')
+    monkeypatch.setattr(os, 'replace', fail)
+    compile_default(registry)
+    monkeypatch.undo()
+
+    assert registry.compiled == 1
+    assert list(tmp_path.iterdir()) == []
+    registry.delete()
+
+def test_no_binary_formats_never_persists(gl_context, tmp_path, monkeypatch):
+    import ShaderRegistry
+
+    monkeypatch.setattr(ShaderRegistry, 'binary_format_count', lambda: 0)
+    registry = ShaderRegistry.ShaderRegistry(tmp_path)
+    assert not registry.persist
+
+    # Compiles every time and never touches the cache directory
+    compile_default(registry)
+    fresh = ShaderRegistry.ShaderRegistry(tmp_path)
+    compile_default(fresh)
+    assert (registry.compiled, fresh.compiled, fresh.loaded) == (1, 1, 0)
+    assert list(tmp_path.iterdir()) == []
+    registry.delete()
+    fresh.delete()